@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the interface catchment engines on synthetic cities.
+
+Run from the directory holding the plugin, with plain python (no QGIS)::
+
+    python -m interfacecatchment.icbench --output results.json
+    python -m interfacecatchment.icbench --compare results.json
+"""
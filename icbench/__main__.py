@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+import argparse
+import configparser
+import json
+import os.path
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from math import ceil
+
+from ..icbatch import expand_parallel
+from ..icengine import (ENGINES, ENGINE_ITERATIVE, ENGINE_STORED_GRAPH,
+                        ENGINE_VISIBILITY_GRAPH, ORIGIN, expand_graph_store,
+                        expand_iterative, expand_visibility_graph)
+from ..icgraphstore import GraphStore, build_graph_store
+from ..icindex import EdgeIndex
+from ..icintervals import ReachableIntervals, block_lines
+from .city import synthetic_city
+
+DISTANCES = (200, 400, 800, 1200)
+
+# the synthetic cities, as options of synthetic_city
+SCENARIOS = {
+    'grid': {},
+    'irregular': {'irregularity': 0.8},
+    'street-widths': {'street_width': (6.0, 30.0)},
+    'dead-ends': {'dead_ends': 0.5},
+    'courtyards': {'courtyards': 0.5},
+    'curved': {'curved': 0.5},
+    'mixed': {'irregularity': 0.5, 'street_width': (8.0, 25.0),
+              'dead_ends': 0.3, 'courtyards': 0.3, 'curved': 0.3},
+}
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def city_lines(scenario, distance, block_size=80.0, seed=0):
+    """Returns the block lines of the synthetic city of a scenario, big
+    enough for the walking distance, and its starting point."""
+    options = dict(SCENARIOS[scenario])
+    widest = options.get('street_width', (15.0, 15.0))[1]
+    count = int(ceil(2 * distance / (block_size + widest))) + 2
+    blocks, origin = synthetic_city(count, count, block_size, seed=seed,
+                                    **options)
+    lines = []
+    for block_id, rings in enumerate(blocks):
+        lines.extend(block_lines(block_id, rings))
+    return lines, origin
+
+
+def stored_graph(lines, radius):
+    """Build the stored visibility graph of the lines into a temporary file.
+    Returns the GraphStore and the time the build took."""
+    handle, path = tempfile.mkstemp(suffix='.icvg')
+    os.close(handle)
+    start = time.perf_counter()
+    edge_index = EdgeIndex(lines)
+    build_graph_store(edge_index, radius, path)
+    seconds = time.perf_counter() - start
+    return GraphStore(path, lines, edge_index.grid), seconds
+
+
+def expand(lines, origin, distance, engine, store=None, processes=1):
+    """Grow the catchment from the origin, returns the measured run. The
+    stored graph engine searches the given GraphStore, and the iterative
+    engine looks in rounds over that many processes unless processes is
+    1."""
+    edge_index = EdgeIndex(lines)
+    intervals = ReachableIntervals()
+    x, y = origin
+    start = time.perf_counter()
+    if engine == ENGINE_STORED_GRAPH:
+        distances, previous = expand_graph_store(
+            store, edge_index, x, y, distance, intervals)
+        vertices = len(distances) - 1
+        hops = {ORIGIN: 0}
+        for node in distances:
+            if node != ORIGIN:
+                hops[node] = hops[previous[node]] + 1
+        iterations = max(hops.values())
+    elif engine == ENGINE_VISIBILITY_GRAPH:
+        graph, distances = expand_visibility_graph(
+            edge_index, x, y, distance, intervals)
+        vertices = len(distances)
+        # the most sight lines on a shortest path
+        hops = {}
+        for node in distances:
+            previous = graph.previous[node]
+            hops[node] = 0 if previous is None else hops[previous] + 1
+        iterations = max(hops.values())
+    elif processes != 1:
+        vertex_store = expand_parallel(edge_index, x, y, distance,
+                                       intervals, processes)
+        vertices = len(vertex_store)
+        iterations = vertex_store.iterations
+    else:
+        vertex_store = expand_iterative(edge_index, x, y, distance,
+                                        intervals)
+        vertices = len(vertex_store)
+        iterations = vertex_store.iterations
+    ic = sum(intervals.length(key) for key in list(intervals.keys()))
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': seconds,
+        'ic': round(ic),
+        'vertices': vertices,
+        'iterations': iterations,
+        'edges_tested': edge_index.tested,
+    }
+
+
+def peak_memory(lines, origin, distance, engine, store=None, processes=1):
+    """Returns the peak memory (in bytes) taken by growing the catchment,
+    as traced by tracemalloc, which slows the run down considerably. The
+    memory of worker processes is not traced."""
+    tracemalloc.start()
+    try:
+        expand(lines, origin, distance, engine, store, processes)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def environment():
+    """Returns what the results were measured with."""
+    metadata = configparser.ConfigParser()
+    metadata.read(os.path.join(PLUGIN_DIR, 'metadata.txt'))
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PLUGIN_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'version': metadata.get('general', 'version', fallback=''),
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run(scenarios, distances, engines, memory=True, repeat=1, log=print,
+        processes=(1,)):
+    """Run every engine over every scenario and walking distance. The
+    fastest of repeat runs is kept. The stored graph engine is timed
+    without building its graph, which is built once per scenario for the
+    longest walking distance and timed apart. The iterative engine runs
+    once for every number of worker processes in processes (None for one
+    per core), the other engines once. Returns the list of results."""
+    results = []
+    for scenario in scenarios:
+        lines, origin = city_lines(scenario, max(distances))
+        edges = sum(len(line.points) - 1 for line in lines)
+        store = None
+        if ENGINE_STORED_GRAPH in engines:
+            store, build_seconds = stored_graph(lines, max(distances))
+            log('%-14s %-17s %5d m  %8.3f s  graph built'
+                % (scenario, ENGINE_STORED_GRAPH, max(distances),
+                   build_seconds))
+        for distance in distances:
+            for engine in engines:
+                counts = processes if engine == ENGINE_ITERATIVE else [1]
+                for count in counts:
+                    runs = [expand(lines, origin, distance, engine, store,
+                                   count)
+                            for _ in range(repeat)]
+                    result = min(runs, key=lambda r: r['seconds'])
+                    result.update({
+                        'scenario': scenario,
+                        'engine': engine,
+                        'distance': distance,
+                        'blocks': len({line.boundary_id for line in lines}),
+                        'edges': edges,
+                        'processes': count,
+                    })
+                    if engine == ENGINE_STORED_GRAPH:
+                        result['build_seconds'] = build_seconds
+                    if memory:
+                        result['peak_memory'] = peak_memory(
+                            lines, origin, distance, engine, store, count)
+                    results.append(result)
+                    log('%-14s %-17s %5d m  %8.3f s  IC %7d  %6d vertices'
+                        '  %s processes'
+                        % (scenario, engine, distance, result['seconds'],
+                           result['ic'], result['vertices'],
+                           count or 'all'))
+        if store is not None:
+            store.close()
+            os.remove(store.path)
+    return results
+
+
+def compare(results, previous, log=print):
+    """Log the time of every run against the same run in the previous
+    results, and any change of the IC."""
+    before = {(r['scenario'], r['engine'], r['distance'],
+               r.get('processes', 1)): r
+              for r in previous['results']}
+    for result in results:
+        old = before.get(
+            (result['scenario'], result['engine'], result['distance'],
+             result['processes']))
+        if old is None:
+            continue
+        change = ''
+        if old['ic'] != result['ic']:
+            change = '  IC %d -> %d' % (old['ic'], result['ic'])
+        log('%-14s %-17s %5d m  %8.3f s -> %8.3f s  (x%.2f)%s'
+            % (result['scenario'], result['engine'], result['distance'],
+               old['seconds'], result['seconds'],
+               result['seconds'] / old['seconds'] if old['seconds'] else 0,
+               change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='icbench', description='Benchmark the interface catchment '
+        'engines on synthetic cities.')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS),
+                        choices=list(SCENARIOS))
+    parser.add_argument('--distances', nargs='+', type=float,
+                        default=list(DISTANCES))
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES),
+                        choices=list(ENGINES))
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs of every case, the fastest is kept')
+    parser.add_argument('--processes', nargs='+', type=int, default=[1],
+                        help='worker processes of the iterative engine, '
+                        '0 for one per core; the iterative engine is run '
+                        'with each of them')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the traced runs measuring peak memory')
+    parser.add_argument('--output', help='write the results to this JSON '
+                        'file')
+    parser.add_argument('--compare', help='compare with the results in '
+                        'this JSON file')
+    args = parser.parse_args(argv)
+
+    results = run(args.scenarios, args.distances, args.engines,
+                  not args.no_memory, args.repeat,
+                  processes=[count or None for count in args.processes])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results},
+                      f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
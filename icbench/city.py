@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import random
+from math import asin, ceil, cos, sin
+
+
+def _bilinear(corners, u, v):
+    """Map (u, v) of the unit square onto the quadrilateral with the given
+    corners (bottom left, bottom right, top right, top left)."""
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = corners
+    return ((1 - u) * (1 - v) * x0 + u * (1 - v) * x1 + u * v * x2
+            + (1 - u) * v * x3,
+            (1 - u) * (1 - v) * y0 + u * (1 - v) * y1 + u * v * y2
+            + (1 - u) * v * y3)
+
+
+def _arc(sagitta, segments):
+    """Returns the inner points of a circular arc from (1, 1) to (0, 1) of
+    the unit square, bent down into the square by sagitta."""
+    radius = (0.25 + sagitta * sagitta) / (2 * sagitta)
+    half_angle = asin(0.5 / radius)
+    centre = 1 + radius - sagitta
+    points = []
+    for n in range(1, segments):
+        angle = half_angle - 2 * half_angle * n / segments
+        points.append((0.5 + radius * sin(angle),
+                       centre - radius * cos(angle)))
+    return points
+
+
+def synthetic_city(columns=10, rows=10, block_size=80.0,
+                   street_width=(15.0, 15.0), irregularity=0.0,
+                   dead_ends=0.0, courtyards=0.0, curved=0.0,
+                   curve_spacing=1.0, seed=0):
+    """Returns the blocks of a synthetic city, laid out on a grid of columns
+    by rows blocks, as lists of rings of (x, y) points in metres (the
+    exterior ring first, then the holes), and the middle of the street
+    crossing nearest to the centre of the city as a starting point. The
+    south west corner of the city is at (0, 0).
+
+    street_width is the (narrowest, widest) street, each street of the grid
+    gets a width between them. irregularity moves the block corners by up
+    to that fraction of half the narrowest street. dead_ends, courtyards
+    and curved are the shares of the blocks cut by a dead-end street from
+    their south side, holding a closed courtyard, and with a curved north
+    side digitized every curve_spacing metres.
+    """
+    rnd = random.Random(seed)
+    narrowest, widest = street_width
+
+    # the positions of the block edges along both axes, streets of random
+    # width between the blocks
+    def edges(count):
+        position = 0.0
+        spans = []
+        for _ in range(count):
+            spans.append((position, position + block_size))
+            position += block_size + rnd.uniform(narrowest, widest)
+        return spans
+
+    xs = edges(columns)
+    ys = edges(rows)
+    shift = irregularity * narrowest / 2
+
+    blocks = []
+    for x0, x1 in xs:
+        for y0, y1 in ys:
+            corners = [
+                (x + rnd.uniform(-shift, shift), y + rnd.uniform(-shift, shift))
+                for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))
+            ]
+
+            # the exterior ring in the unit square, counter-clockwise
+            ring = [(0.0, 0.0)]
+            if rnd.random() < dead_ends:
+                # a narrow street cut into the block from the south
+                width = rnd.uniform(3.0, 8.0) / block_size
+                middle = rnd.uniform(0.3, 0.7)
+                depth = rnd.uniform(0.15, 0.35)
+                ring += [(middle - width / 2, 0.0),
+                         (middle - width / 2, depth),
+                         (middle + width / 2, depth),
+                         (middle + width / 2, 0.0)]
+            ring += [(1.0, 0.0), (1.0, 1.0)]
+            if rnd.random() < curved:
+                sagitta = rnd.uniform(0.03, 0.1)
+                ring += _arc(sagitta, max(2, int(ceil(block_size
+                                                      / curve_spacing))))
+            ring += [(0.0, 1.0), (0.0, 0.0)]
+            rings = [ring]
+
+            if rnd.random() < courtyards:
+                # a closed courtyard, clockwise
+                rings.append([(0.3, 0.45), (0.3, 0.8), (0.7, 0.8),
+                              (0.7, 0.45), (0.3, 0.45)])
+
+            blocks.append([[_bilinear(corners, u, v) for u, v in ring]
+                           for ring in rings])
+
+    # the crossing of the streets after the middle column and row
+    column = (columns - 1) // 2
+    row = (rows - 1) // 2
+    centre = ((xs[column][1] + xs[column + 1][0]) / 2 if column + 1 < columns
+              else xs[column][1] + narrowest / 2,
+              (ys[row][1] + ys[row + 1][0]) / 2 if row + 1 < rows
+              else ys[row][1] + narrowest / 2)
+    return blocks, centre
@@ -0,0 +1,677 @@
+# -*- coding: utf-8 -*-
+import glob
+import hashlib
+import os.path
+import shutil
+import threading
+import time
+from math import ceil, floor
+
+from qgis.core import (QgsApplication, QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform, QgsFeatureRequest, QgsGeometry,
+                       QgsProject, QgsRectangle, QgsVectorFileWriter,
+                       QgsVectorLayer)
+
+from .icgeometry import (blocks_layer_of, dissolve, fill_dead_ends,
+                         filled_blocks, read_blocks)
+from .icblockstore import TILE_SIZE, BlockStoreWriter, tile_of
+from .icgraphstore import GraphStore, build_graph_store
+from .icindex import EdgeIndex
+from .icintervals import SNAP_GRID, block_lines
+from .icstats import RunStats
+
+# the preprocessed blocks are kept on disk in this directory of the QGIS
+# settings directory, one GeoPackage per preprocessed layer
+CACHE_DIRECTORY = 'interfacecatchment_cache'
+
+# the files of the cache are removed, least recently used first, when they
+# take more than this many bytes or have not been used for this many seconds
+CACHE_MAX_SIZE = 2 * 1024 ** 3
+CACHE_MAX_AGE = 90 * 24 * 3600
+
+# the GeoPackages being written are named with this prefix until they are
+# moved into place, and are left alone by the eviction
+PART_PREFIX = 'part_'
+
+# study areas are grown out to this grid (in the units of the target CRS),
+# so that runs from nearby starting points can use the same blocks
+EXTENT_GRID = 1000.0
+
+
+def _touch(path):
+    """Mark a cached file as used now, for the eviction."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def study_extent(rectangle, dead_end_width=None):
+    """Returns the study area rectangle grown out to the extent grid, as an
+    (xmin, ymin, xmax, ymax) tuple. It is also grown by the dead-end width,
+    since the dead-end removal can join the blocks near the study area to
+    the blocks outside it."""
+    margin = dead_end_width or 0.0
+    return (floor((rectangle.xMinimum() - margin) / EXTENT_GRID) * EXTENT_GRID,
+            floor((rectangle.yMinimum() - margin) / EXTENT_GRID) * EXTENT_GRID,
+            ceil((rectangle.xMaximum() + margin) / EXTENT_GRID) * EXTENT_GRID,
+            ceil((rectangle.yMaximum() + margin) / EXTENT_GRID) * EXTENT_GRID)
+
+
+def _contains(outer, inner):
+    """Check if the extent outer (None for everything) contains the extent
+    inner."""
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and outer[2] >= inner[2] and outer[3] >= inner[3])
+
+
+def _request_for(blocks_layer, crs, extent=None):
+    """Returns the feature request for the blocks whose bounding box touches
+    the extent (xmin, ymin, xmax, ymax) in the given CRS, or for all the
+    blocks when the extent is None."""
+    request = QgsFeatureRequest()
+    if extent is not None:
+        # take the extent back into the CRS of the blocks layer and let the
+        # data provider (and its spatial index) hand out only the blocks
+        # around it, before anything is fixed or reprojected
+        rectangle = QgsRectangle(*extent)
+        target_crs = QgsCoordinateReferenceSystem(crs)
+        if blocks_layer.crs() != target_crs:
+            transform = QgsCoordinateTransform(
+                target_crs, blocks_layer.crs(), QgsProject.instance())
+            rectangle = transform.transformBoundingBox(rectangle)
+        request.setFilterRect(rectangle)
+    return request
+
+
+def preprocess_blocks(blocks_layer, crs, dead_end_width=None, extent=None,
+                      is_canceled=None, stats=None):
+    """Turn the blocks layer into fixed, single part block polygons in the
+    given CRS, with touching blocks dissolved into one. When dead_end_width
+    is given, the dead-end streets narrower than it are filled in. When an
+    extent (xmin, ymin, xmax, ymax) in the given CRS is given, only the
+    blocks whose bounding box touches it are preprocessed. The steps run on
+    the geometries in memory, and only the result is put into a layer. The
+    time each step takes is added to stats. Returns the preprocessed layer,
+    or None if canceled."""
+    if stats is None:
+        stats = RunStats()
+
+    def canceled():
+        return is_canceled is not None and is_canceled()
+
+    request = _request_for(blocks_layer, crs, extent)
+
+    # read, fix and reproject the blocks (closing line blocks into
+    # polygons) feature by feature
+    with stats.stage('read blocks'):
+        geometries = read_blocks(blocks_layer, crs, request)
+    stats.count('blocks read', len(geometries))
+
+    if canceled():
+        return None
+
+    # dissolve the polygons in order to make touching polygons into one
+    # block, and take the result apart into single parts
+    with stats.stage('dissolve'):
+        geometries = dissolve(geometries)
+
+    if canceled():
+        return None
+
+    # if the deadend solution has been selected, buffer the blocks out and
+    # back in to remove the deadends from the results
+    if dead_end_width:
+        with stats.stage('fill dead-ends'):
+            geometries, dead_ends = fill_dead_ends(geometries, dead_end_width)
+        stats.count('dead-ends filled', dead_ends)
+
+        if canceled():
+            return None
+
+    return blocks_layer_of(geometries, crs)
+
+
+def fill_dead_ends_near(blocks_layer, dead_end_width, area=None, filled=None,
+                        stats=None):
+    """Fill in the dead-end streets narrower than dead_end_width in the
+    blocks near the area (a QgsRectangle, None for all the blocks). Filling
+    in a dead-end only grows a block by half the width, so the blocks
+    further away from the area can be left as they are. filled holds the
+    blocks filled before, by feature id, as (block, dead-ends); the blocks
+    near the area which are not in it are filled in together, see
+    filled_blocks, and added to it. Returns a new layer of the blocks near
+    the area."""
+    if stats is None:
+        stats = RunStats()
+    if filled is None:
+        filled = {}
+    request = QgsFeatureRequest()
+    if area is not None:
+        near = QgsRectangle(area)
+        near.grow(dead_end_width / 2)
+        request.setFilterRect(near)
+    with stats.stage('fill dead-ends'):
+        features = list(blocks_layer.getFeatures(request))
+        missing = [feature for feature in features
+                   if feature.id() not in filled]
+        stats.count('dead-end cache hits', len(features) - len(missing))
+        for feature, block in zip(missing, filled_blocks(
+                [feature.geometry() for feature in missing],
+                dead_end_width)):
+            filled[feature.id()] = block
+        blocks = [filled[feature.id()] for feature in features]
+    geometries = [QgsGeometry(block) for block, _ in blocks]
+    stats.count('dead-ends filled',
+                sum(dead_ends for _, dead_ends in blocks))
+    return blocks_layer_of(geometries, blocks_layer.crs().authid())
+
+
+def block_lines_from(blocks, grid=SNAP_GRID):
+    """Returns the rings of all the blocks (a layer, or some of its
+    features) as BoundaryLines snapped to the grid, keyed by the block
+    feature id and the ring number, with the blocks on their left."""
+    if isinstance(blocks, QgsVectorLayer):
+        blocks = blocks.getFeatures()
+    lines = []
+    for block in blocks:
+        lines.extend(geometry_lines(block.id(), block.geometry(), grid))
+    return lines
+
+
+def geometry_lines(block_id, geometry, grid=SNAP_GRID):
+    """Returns the rings of a block geometry as BoundaryLines snapped to the
+    grid, keyed by the block id and the ring number."""
+    if geometry.isMultipart():
+        polygons = geometry.asMultiPolygon()
+    else:
+        polygons = [geometry.asPolygon()]
+    lines = []
+    ring_count = 0
+    for polygon in polygons:
+        rings = [[(point.x(), point.y()) for point in ring]
+                 for ring in polygon]
+        lines.extend(block_lines(block_id, rings, first_key=ring_count,
+                                 grid=grid))
+        ring_count += len(rings)
+    return lines
+
+
+def _box(geometry):
+    box = geometry.boundingBox()
+    return (box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum())
+
+
+def _tiles_of(box, tile_size):
+    """Returns the (column, row) of every tile the box covers."""
+    first_column, first_row = tile_of(box[0], box[1], tile_size)
+    last_column, last_row = tile_of(box[2], box[3], tile_size)
+    return [(column, row)
+            for column in range(first_column, last_column + 1)
+            for row in range(first_row, last_row + 1)]
+
+
+def _read_dissolved(blocks_layer, crs, extent):
+    """Returns the blocks whose bounding box touches the extent, fixed,
+    reprojected and dissolved into single part polygons."""
+    return dissolve(read_blocks(blocks_layer, crs,
+                                _request_for(blocks_layer, crs, extent)))
+
+
+def _whole_block(blocks_layer, crs, part, margin):
+    """Returns the whole dissolved block a part of it belongs to, reading
+    the blocks around it until the block stops growing."""
+    inside = part.pointOnSurface()
+    box = _box(part)
+    while True:
+        extent = (box[0] - margin, box[1] - margin,
+                  box[2] + margin, box[3] + margin)
+        for block in _read_dissolved(blocks_layer, crs, extent):
+            if block.intersects(inside):
+                break
+        else:
+            return part
+        if _box(block) == box:
+            return block
+        part, box = block, _box(block)
+
+
+def build_block_store(blocks_layer, crs, path, dead_end_width=None,
+                      tile_size=TILE_SIZE, grid=SNAP_GRID, is_canceled=None,
+                      progress=None, stats=None):
+    """Preprocess the whole blocks layer into a block store file at path,
+    tile by tile, so that only the blocks around one tile are in memory at
+    a time. The blocks are fixed, reprojected into the given CRS, dissolved
+    and (with a dead-end width) have their dead-ends filled in as by
+    preprocess_blocks, and their boundary lines are snapped to the grid.
+
+    The blocks around a tile are read as far as half a tile out of it, so
+    a dissolved block lying in the tile (by the centre of its bounding box)
+    and less than a tile across is whole. The larger blocks are read as far
+    as they reach and are stored apart, once each. progress is called with
+    the percentage of the tiles done. Returns the number of blocks stored,
+    or None if canceled."""
+    if stats is None:
+        stats = RunStats()
+
+    def canceled():
+        return is_canceled is not None and is_canceled()
+
+    rectangle = blocks_layer.extent()
+    target_crs = QgsCoordinateReferenceSystem(crs)
+    if blocks_layer.crs() != target_crs:
+        transform = QgsCoordinateTransform(
+            blocks_layer.crs(), target_crs, QgsProject.instance())
+        rectangle = transform.transformBoundingBox(rectangle)
+    tiles = _tiles_of((rectangle.xMinimum(), rectangle.yMinimum(),
+                       rectangle.xMaximum(), rectangle.yMaximum()), tile_size)
+    half = tile_size / 2
+    # the blocks reaching out of the tiles they were seen from, whole, by
+    # their bounding box, and the boxes of those by every tile they cover
+    whole_blocks = {}
+    whole_tiles = {}
+    block_count = 0
+
+    def add(writer, blocks, tile):
+        # the dead-ends of the blocks stored by a tile are filled in
+        # together
+        nonlocal block_count
+        if dead_end_width:
+            filled = filled_blocks(blocks, dead_end_width)
+            blocks = [block for block, _ in filled]
+            stats.count('dead-ends filled',
+                        sum(dead_ends for _, dead_ends in filled))
+        for block in blocks:
+            writer.add_block(geometry_lines(block_count, block, grid), tile)
+            block_count += 1
+
+    writer = BlockStoreWriter(path, crs, grid, tile_size, dead_end_width)
+    try:
+        for done, (column, row) in enumerate(tiles):
+            if canceled():
+                return None
+            tile = (column * tile_size, row * tile_size,
+                    (column + 1) * tile_size, (row + 1) * tile_size)
+            extent = (tile[0] - half, tile[1] - half,
+                      tile[2] + half, tile[3] + half)
+            with stats.stage('read blocks'):
+                blocks = _read_dissolved(blocks_layer, crs, extent)
+            stored = []
+            for block in blocks:
+                box = _box(block)
+                small = (box[2] - box[0] < tile_size
+                         and box[3] - box[1] < tile_size)
+                if small and tile_of((box[0] + box[2]) / 2,
+                                     (box[1] + box[3]) / 2,
+                                     tile_size) == (column, row):
+                    # whole, and stored by the tile its centre lies in
+                    stored.append(block)
+                    continue
+                if small and (box[0] > extent[0] and box[1] > extent[1]
+                              and box[2] < extent[2] and box[3] < extent[3]):
+                    # whole, and stored by another tile
+                    continue
+                if (box[0] > tile[2] or box[2] < tile[0]
+                        or box[1] > tile[3] or box[3] < tile[1]):
+                    continue
+                # a block larger than a tile, or a part of a block reaching
+                # out of the blocks read
+                inside = block.pointOnSurface()
+                # a whole block containing the part covers the tile of its
+                # lower left corner
+                if any(box[0] >= whole[0] and box[1] >= whole[1]
+                       and box[2] <= whole[2] and box[3] <= whole[3]
+                       and whole_blocks[whole].intersects(inside)
+                       for whole in whole_tiles.get(
+                           tile_of(box[0], box[1], tile_size), ())):
+                    continue
+                with stats.stage('read large blocks'):
+                    block = _whole_block(blocks_layer, crs, block, half)
+                # kept even when it is stored by its own tile, so that it
+                # is read only once
+                whole = _box(block)
+                if whole not in whole_blocks:
+                    whole_blocks[whole] = block
+                    for cell in _tiles_of(whole, tile_size):
+                        whole_tiles.setdefault(cell, []).append(whole)
+            with stats.stage('block lines'):
+                add(writer, stored, (column, row))
+            if progress is not None:
+                progress(100.0 * (done + 1) / len(tiles))
+        large = [box for box in sorted(whole_blocks)
+                 if box[2] - box[0] >= tile_size
+                 or box[3] - box[1] >= tile_size]
+        stats.count('large blocks', len(large))
+        with stats.stage('block lines'):
+            add(writer, [whole_blocks[box] for box in large], None)
+        with stats.stage('write block store'):
+            writer.finish()
+    finally:
+        writer.close()
+    stats.count('blocks stored', block_count)
+    return block_count
+
+
+def _file_state(path):
+    """Returns the modification time and size of a file and of the SQLite
+    write-ahead log next to it: the edits of a GeoPackage go into its -wal
+    file until a checkpoint, without touching the GeoPackage itself."""
+    parts = []
+    for name in (path, path + '-wal', path + '-shm'):
+        if os.path.isfile(name):
+            status = os.stat(name)
+            parts.append('%r:%d' % (status.st_mtime, status.st_size))
+    return 'file:%s' % ','.join(parts)
+
+
+def _features_state(layer):
+    """Returns a hash of the ids and the geometries of the features of the
+    layer, as they are read for the blocks (with the edits not saved
+    yet)."""
+    digest = hashlib.sha1()
+    for feature in layer.getFeatures(QgsFeatureRequest().setNoAttributes()):
+        digest.update(str(feature.id()).encode())
+        digest.update(bytes(feature.geometry().asWkb()))
+    return 'hash:%s' % digest.hexdigest()
+
+
+def layer_source(layer):
+    """Returns what tells the source of the layer and whether it has
+    changed: the URI of its data source, with the modification times of
+    its file when it comes from a file, or else (a database or a memory
+    layer) a hash of its features. The features are also hashed when the
+    layer has edits which are not saved yet. It is worked out once per
+    run."""
+    provider = layer.dataProvider()
+    path = layer.source().split('|')[0]
+    if os.path.isfile(path) and not layer.isModified():
+        state = _file_state(path)
+    else:
+        state = _features_state(layer)
+    return '%s\n%s' % (provider.dataSourceUri(), state)
+
+
+class BlockCache:
+    """Two tier cache of the preprocessed blocks: the layers preprocessed in
+    this QGIS session are kept in memory, and every preprocessed layer is
+    also written into a GeoPackage on disk for the later sessions.
+
+    The key covers the data source of the blocks layer, the modification
+    time of its file (or a hash of its features) and the target CRS, so a
+    change to any of them preprocesses the blocks again. Under every key
+    the blocks of several study areas are kept, and the blocks of a study
+    area are used for any study area within it.
+
+    The dead-ends are filled in afterwards, only in the blocks near the
+    area a run needs, and the filled blocks are kept in memory for every
+    dead-end width, so that the blocks are dissolved once for all the
+    widths and a block is filled once for every width.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.join(QgsApplication.qgisSettingsDirPath(),
+                                     CACHE_DIRECTORY)
+        self.directory = directory
+        # key -> [(extent, layer), ...]
+        self._layers = {}
+        # key -> [(extent, lines, edge index, graph store), ...]
+        self._graphs = {}
+        # (key, extent, dead-end width) -> {feature id: (block, dead-ends)}
+        self._filled = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source, crs, dead_end_width=None, grid=None):
+        """Returns the key of the blocks of a layer, given by its
+        layer_source, which is worked out once per run."""
+        parts = [
+            source,
+            crs,
+            'dead-ends:%r' % (dead_end_width or None),
+        ]
+        if grid is not None:
+            parts.append('grid:%r' % grid)
+        return '\n'.join(parts)
+
+    def _path(self, key, extent):
+        name = hashlib.sha1(key.encode()).hexdigest()
+        if extent is not None:
+            name += '_%d_%d_%d_%d' % extent
+        return os.path.join(self.directory, name + '.gpkg')
+
+    def _from_disk(self, key, extent):
+        """Load the blocks of a study area containing the extent from disk,
+        returns the extent of the study area and the layer, or None."""
+        pattern = hashlib.sha1(key.encode()).hexdigest() + '*.gpkg'
+        for path in glob.glob(os.path.join(self.directory, pattern)):
+            name = os.path.splitext(os.path.basename(path))[0]
+            bounds = name.split('_')[1:]
+            stored = tuple(float(b) for b in bounds) if bounds else None
+            if not _contains(stored, extent):
+                continue
+            layer = QgsVectorLayer(path, 'IC_blocks', 'ogr')
+            if layer.isValid():
+                _touch(path)
+                self._layers.setdefault(key, []).append((stored, layer))
+                return stored, layer
+        return None
+
+    def _blocks(self, blocks_layer, source, crs, dead_end_width=None,
+                area=None, is_canceled=None, stats=None):
+        """Returns the preprocessed blocks as in blocks(), but with the
+        dead-ends left in, together with their key and the extent they were
+        preprocessed for, or None if canceled. The source is the
+        layer_source of the blocks layer."""
+        if stats is None:
+            stats = RunStats()
+        key = self.key(source, crs)
+        extent = None if area is None else study_extent(area, dead_end_width)
+        with self._lock:
+            layer = None
+            for stored, cached in self._layers.get(key, []):
+                if _contains(stored, extent):
+                    layer, extent = cached, stored
+                    break
+            if layer is None and os.path.isdir(self.directory):
+                found = self._from_disk(key, extent)
+                if found is not None:
+                    extent, layer = found
+            if layer is not None:
+                self.hits += 1
+                stats.count('block cache hits')
+                return layer.materialize(QgsFeatureRequest()), key, extent
+            self.misses += 1
+            stats.count('block cache misses')
+
+        layer = preprocess_blocks(blocks_layer, crs, None, extent,
+                                  is_canceled, stats)
+        if layer is None:
+            return None
+        with self._lock:
+            self._layers.setdefault(key, []).append(
+                (extent, layer.materialize(QgsFeatureRequest())))
+        # the runs go on while the GeoPackage is written, the kept copy is
+        # in memory
+        with stats.stage('write block cache'):
+            self._write(self._path(key, extent), layer, crs)
+            self._evict()
+        return layer, key, extent
+
+    def _fill(self, layer, key, extent, dead_end_width, area, stats):
+        """Fill in the dead-ends of the blocks near the area, with the blocks
+        filled before for the same width. Returns a new layer."""
+        with self._lock:
+            filled = self._filled.setdefault(
+                (key, extent, dead_end_width), {})
+        # a block filled by parallel runs at the same time is filled twice,
+        # to the same result
+        return fill_dead_ends_near(layer, dead_end_width, area, filled,
+                                   stats)
+
+    def blocks(self, blocks_layer, crs, dead_end_width=None, area=None,
+               is_canceled=None, stats=None):
+        """Returns the preprocessed blocks, from memory, from disk or by
+        preprocessing the blocks layer. With an area (a QgsRectangle in the
+        target CRS) only the blocks around it are needed, and with a
+        dead-end width only the blocks near it are returned, with their
+        dead-ends filled in. Every run gets its own copy in memory, so that
+        runs in parallel tasks do not share a layer. Hits, misses and the
+        preprocessing time are added to stats. Returns None if canceled."""
+        if stats is None:
+            stats = RunStats()
+        found = self._blocks(blocks_layer, layer_source(blocks_layer), crs,
+                             dead_end_width, area, is_canceled, stats)
+        if found is None:
+            return None
+        layer, key, extent = found
+        if dead_end_width:
+            layer = self._fill(layer, key, extent, dead_end_width, area,
+                               stats)
+        return layer
+
+    def graph(self, blocks_layer, crs, dead_end_width=None, area=None,
+              radius=None, is_canceled=None, progress=None, stats=None,
+              grid=SNAP_GRID):
+        """Returns the boundary lines of the preprocessed blocks around the
+        area, their EdgeIndex and the GraphStore of their visibility graph
+        as far as radius. The graph is built once for the preprocessed
+        blocks and kept on disk next to them, so it goes when they change
+        or the cache is cleared, and it is memory-mapped again by the later
+        sessions. The block lines are snapped to the grid. Returns None if
+        canceled."""
+        if stats is None:
+            stats = RunStats()
+        # the source is worked out once per run, for both keys
+        source = layer_source(blocks_layer)
+        key = self.key(source, crs, dead_end_width, grid)
+        extent = None if area is None else study_extent(area, dead_end_width)
+        with self._lock:
+            for stored, lines, edge_index, store in self._graphs.get(key, []):
+                if _contains(stored, extent) and store.radius >= radius:
+                    self.hits += 1
+                    stats.count('graph store hits')
+                    return lines, edge_index, store
+
+        found = self._blocks(blocks_layer, source, crs, dead_end_width, area,
+                             is_canceled, stats)
+        if found is None:
+            return None
+        layer, blocks_key, extent = found
+        if dead_end_width:
+            layer = self._fill(layer, blocks_key, extent, dead_end_width,
+                               None, stats)
+        # the graph is kept for the blocks with the dead-ends filled in,
+        # snapped to the grid
+        stem = os.path.splitext(self._path(key, extent))[0]
+
+        with stats.stage('block lines'):
+            lines = block_lines_from(layer, grid)
+        with stats.stage('edge index'):
+            edge_index = EdgeIndex(lines, grid=grid)
+
+        store = None
+        for path in glob.glob(stem + '_r*.icvg'):
+            stored_radius = float(os.path.splitext(path)[0].rsplit('_r')[-1])
+            if stored_radius < radius:
+                continue
+            try:
+                with stats.stage('load graph store'):
+                    store = GraphStore(path, lines, edge_index.grid)
+                _touch(path)
+                break
+            except (OSError, ValueError):
+                continue
+
+        if store is None:
+            stats.count('graph store misses')
+            path = '%s_r%d.icvg' % (stem, ceil(radius))
+            with stats.stage('build graph store'):
+                if not os.path.isdir(self.directory):
+                    os.makedirs(self.directory)
+                if not build_graph_store(edge_index, ceil(radius), path,
+                                         is_canceled, progress):
+                    return None
+            store = GraphStore(path, lines, edge_index.grid)
+
+        with self._lock:
+            self._graphs.setdefault(key, []).append(
+                (extent, lines, edge_index, store))
+        self._evict()
+        return lines, edge_index, store
+
+    def _write(self, path, layer, crs):
+        """Write the layer into a GeoPackage under a name of its own first,
+        so that no other run finds it half written."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        part = os.path.join(self.directory, '%s%d_%s' % (
+            PART_PREFIX, threading.get_ident(), os.path.basename(path)))
+        error = QgsVectorFileWriter.writeAsVectorFormat(
+            layer, part, 'UTF-8', QgsCoordinateReferenceSystem(crs), 'GPKG')
+        if isinstance(error, tuple):
+            error = error[0]
+        if error == QgsVectorFileWriter.NoError:
+            os.replace(part, path)
+        elif os.path.isfile(part):
+            os.remove(part)
+
+    def _evict(self):
+        """Remove the cached files which have not been used for
+        CACHE_MAX_AGE, and then the least recently used ones until they
+        take no more than CACHE_MAX_SIZE. The files open in this session
+        and the GeoPackages still being written are kept."""
+        with self._lock:
+            in_use = {os.path.normcase(os.path.abspath(path)) for path in (
+                [layer.source().split('|')[0]
+                 for layers in self._layers.values()
+                 for extent, layer in layers] +
+                [graph[3].path for graphs in self._graphs.values()
+                 for graph in graphs])}
+        files = []
+        for pattern in ('*.gpkg', '*.icvg'):
+            for path in glob.glob(os.path.join(self.directory, pattern)):
+                if os.path.basename(path).startswith(PART_PREFIX) \
+                        or os.path.normcase(os.path.abspath(path)) in in_use:
+                    continue
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                files.append((status.st_mtime, status.st_size, path))
+        files.sort()
+        size = sum(file_size for used, file_size, path in files)
+        oldest = time.time() - CACHE_MAX_AGE
+        for used, file_size, path in files:
+            if used >= oldest and size <= CACHE_MAX_SIZE:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
+
+    def clear(self):
+        """Forget the preprocessed blocks and their visibility graphs, in
+        memory and on disk."""
+        with self._lock:
+            self._layers.clear()
+            self._filled.clear()
+            for graphs in self._graphs.values():
+                for extent, lines, edge_index, store in graphs:
+                    store.close()
+            self._graphs.clear()
+            if os.path.isdir(self.directory):
+                shutil.rmtree(self.directory, ignore_errors=True)
+
+    def summary(self):
+        return '%s hits, %s misses' % (self.hits, self.misses)
+
+
+# the cache shared by all the runs of the plugin in this QGIS session
+block_cache = BlockCache()
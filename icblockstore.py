@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from math import floor
+
+from .icintervals import BoundaryLine
+from .icmapped import MappedFile
+
+# the file starts with the magic bytes and the version of the format
+MAGIC = b'ICBS'
+VERSION = 1
+
+# the blocks are stored by the tile of this size (in the units of the CRS)
+# their bounding box centre lies in
+TILE_SIZE = 500.0
+
+# magic, version, CRS, snapping grid, tile size, dead-end width (0 when the
+# dead-ends were kept), number of lines, points and tiles, and the number
+# of the first line of the blocks too large for a tile
+_HEADER = struct.Struct('<4sI16sdddqqqq')
+
+# the sections of the file after the header, in the order they are written,
+# with their array type: the 8 byte ones first so that every section is
+# aligned for memoryview.cast
+_SECTIONS = (
+    ('points', 'd'),
+    ('line_boxes', 'd'),
+    ('line_offsets', 'q'),
+    ('line_blocks', 'q'),
+    ('tile_keys', 'q'),
+    ('tile_starts', 'q'),
+    ('line_rings', 'i'),
+    ('corners', 'b'),
+)
+
+
+def tile_of(x, y, tile_size):
+    """Returns the (column, row) of the tile the point lies in."""
+    return floor(x / tile_size), floor(y / tile_size)
+
+
+def _tile_key(column, row):
+    """Returns the tile as a single integer, in the order of the columns and
+    then of the rows."""
+    return (column << 32) + row + 2 ** 31
+
+
+class BlockStoreWriter:
+    """Writes the boundary lines of the preprocessed blocks into a block
+    store file, tile by tile, without keeping them in memory: every section
+    is streamed into a file of its own next to the store and the sections
+    are put together by finish.
+
+    The blocks are added in the order of their tiles (by column, then by
+    row), and the blocks too large for a tile last.
+    """
+
+    def __init__(self, path, crs, grid, tile_size=TILE_SIZE,
+                 dead_end_width=None):
+        self.path = path
+        self.header = (crs.encode(), grid, tile_size, dead_end_width or 0.0)
+        self._files = {name: open('%s.%s.tmp' % (path, name), 'w+b')
+                       for name, _ in _SECTIONS}
+        self._tile_keys = array('q')
+        self._tile_starts = array('q')
+        self._large_first = None
+        self.line_count = 0
+        self.point_count = 0
+        self._files['line_offsets'].write(array('q', [0]).tobytes())
+
+    def add_block(self, lines, tile=None):
+        """Add the boundary lines of a block lying in the tile, given as
+        (column, row), or of a block too large for a tile when the tile is
+        None."""
+        if tile is None:
+            if self._large_first is None:
+                self._large_first = self.line_count
+        else:
+            if self._large_first is not None:
+                raise ValueError('The large blocks are added last')
+            key = _tile_key(*tile)
+            if not self._tile_keys or self._tile_keys[-1] != key:
+                if self._tile_keys and self._tile_keys[-1] > key:
+                    raise ValueError('The tiles are added in order')
+                self._tile_keys.append(key)
+                self._tile_starts.append(self.line_count)
+        for line in lines:
+            xs = [x for x, _ in line.points]
+            ys = [y for _, y in line.points]
+            self._write('points', 'd', [c for point in line.points
+                                        for c in point])
+            self._write('line_boxes', 'd',
+                        [min(xs), min(ys), max(xs), max(ys)])
+            self.point_count += len(line.points)
+            self._write('line_offsets', 'q', [self.point_count])
+            self._write('line_blocks', 'q', [line.boundary_id])
+            self._write('line_rings', 'i', [line.key[1]])
+            self._write('corners', 'b', [int(c) for c in line.corners])
+            self.line_count += 1
+
+    def _write(self, name, kind, values):
+        self._files[name].write(array(kind, values).tobytes())
+
+    def finish(self):
+        """Put the sections together into the block store file."""
+        if self._large_first is None:
+            self._large_first = self.line_count
+        self._tile_starts.append(self._large_first)
+        self._files['tile_keys'].write(self._tile_keys.tobytes())
+        self._files['tile_starts'].write(self._tile_starts.tobytes())
+        # written next to the final file first, so that a failed write
+        # never leaves a broken store behind
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            crs, grid, tile_size, dead_end_width = self.header
+            f.write(_HEADER.pack(MAGIC, VERSION, crs, grid, tile_size,
+                                 dead_end_width, self.line_count,
+                                 self.point_count, len(self._tile_keys),
+                                 self._large_first))
+            for name, _ in _SECTIONS:
+                section = self._files[name]
+                section.seek(0)
+                shutil.copyfileobj(section, f)
+        self.close()
+        os.replace(temporary, self.path)
+
+    def close(self):
+        """Remove the section files, leaving the store as it is."""
+        for section in self._files.values():
+            section.close()
+            os.remove(section.name)
+        self._files = {}
+
+
+class BlockStore:
+    """The boundary lines of the preprocessed blocks, memory-mapped from a
+    file written by BlockStoreWriter. Only the tile index is looked at to
+    find the lines around an area, and only those lines are read, so the
+    memory taken does not grow with the size of the city.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = MappedFile(path, _HEADER)
+        (magic, version, crs, self.grid, self.tile_size,
+         dead_end_width, self.line_count, point_count, tile_count,
+         self._large_first) = self._file.header
+        if magic != MAGIC or version != VERSION:
+            self._file.close()
+            raise ValueError('Not a block store: %s' % path)
+        self.crs = crs.rstrip(b'\0').decode()
+        self.dead_end_width = dead_end_width or None
+
+        sizes = {
+            'points': 2 * point_count,
+            'line_boxes': 4 * self.line_count,
+            'line_offsets': self.line_count + 1,
+            'line_blocks': self.line_count,
+            'tile_keys': tile_count,
+            'tile_starts': tile_count + 1,
+            'line_rings': self.line_count,
+            'corners': point_count,
+        }
+        for name, section in self._file.sections(_SECTIONS, sizes).items():
+            setattr(self, '_' + name, section)
+
+    def line(self, line_no):
+        """Returns a BoundaryLine read from the store."""
+        first = self._line_offsets[line_no]
+        last = self._line_offsets[line_no + 1]
+        points = self._points
+        block = self._line_blocks[line_no]
+        return BoundaryLine(
+            (block, self._line_rings[line_no]), block,
+            [(points[2 * i], points[2 * i + 1]) for i in range(first, last)],
+            [bool(c) for c in self._corners[first:last]])
+
+    def _meets(self, line_no, extent):
+        boxes = self._line_boxes
+        k = 4 * line_no
+        return (boxes[k] <= extent[2] and boxes[k + 1] <= extent[3]
+                and boxes[k + 2] >= extent[0] and boxes[k + 3] >= extent[1])
+
+    def line_numbers(self, extent):
+        """Returns the numbers of the lines whose bounding box meets the
+        (xmin, ymin, xmax, ymax) extent, looking only in the tiles around
+        it and among the blocks too large for a tile."""
+        # a block in a tile reaches at most half a tile out of it, and a
+        # little further with its dead-ends filled in
+        half = self.tile_size / 2 + (self.dead_end_width or 0.0)
+        first_column, first_row = tile_of(extent[0] - half, extent[1] - half,
+                                          self.tile_size)
+        last_column, last_row = tile_of(extent[2] + half, extent[3] + half,
+                                        self.tile_size)
+        keys = self._tile_keys
+        starts = self._tile_starts
+        found = []
+        for column in range(first_column, last_column + 1):
+            for k in range(bisect_left(keys, _tile_key(column, first_row)),
+                           bisect_right(keys, _tile_key(column, last_row))):
+                found.extend(line_no
+                             for line_no in range(starts[k], starts[k + 1])
+                             if self._meets(line_no, extent))
+        found.extend(line_no
+                     for line_no in range(self._large_first, self.line_count)
+                     if self._meets(line_no, extent))
+        return found
+
+    def lines(self, extent):
+        """Returns the BoundaryLines whose bounding box meets the extent."""
+        return [self.line(line_no) for line_no in self.line_numbers(extent)]
+
+    def close(self):
+        self._file.close()
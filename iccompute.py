@@ -0,0 +1,999 @@
+# -*- coding: utf-8 -*-
+"""Headless interface catchment: everything the plugin does, without the
+dialog, the map canvas or the task manager, for scripts, batch jobs and
+benchmarks (PyQGIS or qgis_process). For example::
+
+    from interfacecatchment.iccompute import compute_ic
+    result = compute_ic(blocks_layer, (x, y), 400, crs='EPSG:28355')
+    print(result.ic, result.timings)
+"""
+import os.path
+import time
+from array import array
+from math import ceil
+
+from PyQt5.QtCore import QVariant
+
+from qgis.core import (QgsCoordinateReferenceSystem, QgsFeature,
+                       QgsFeatureRequest, QgsField, QgsGeometry, QgsPointXY,
+                       QgsProcessingUtils, QgsProject, QgsRasterLayer,
+                       QgsRectangle, QgsVectorLayer, QgsWkbTypes, edit)
+
+from osgeo import gdal
+
+from .icbatch import (PARALLEL_DISTANCE, batch_catchments,
+                      expand_parallel)
+from .icblocks import (block_cache, block_lines_from, build_block_store,
+                       fill_dead_ends_near, preprocess_blocks, study_extent)
+from .icblockstore import BlockStore
+from .icengine import (ENGINE_ITERATIVE, ENGINE_STORED_GRAPH,
+                       ENGINE_VISIBILITY_GRAPH, ORIGIN, expand_graph_store,
+                       expand_iterative, expand_visibility_graph)
+from .icgeometry import features_within
+from .icgraph import VisibilityGraph
+from .icindex import EdgeIndex
+from .icintervals import SNAP_GRID, DistanceSweep
+from .icstats import RunStats
+from .icvertices import VertexStore
+
+
+class ICResult:
+    """The result of compute_ic: the IC value, the reachable portions of the
+    block boundaries as a layer and as a single multi line geometry, the
+    starting point layer, the vertices layer (when asked for), the time
+    each stage took, in seconds, the RunStats of the run and the walking
+    distance. An anytime run stopped early is not complete, and its IC is
+    a lower bound."""
+
+    def __init__(self, ic, reachable_layer, starting_point_layer,
+                 vertices_layer, timings, stats=None, walking_distance=None,
+                 complete=True):
+        self.ic = ic
+        self.complete = complete
+        self.walking_distance = walking_distance
+        self.reachable_layer = reachable_layer
+        self.starting_point_layer = starting_point_layer
+        self.vertices_layer = vertices_layer
+        self.timings = timings
+        self.stats = stats
+
+    @property
+    def reachable_geometry(self):
+        parts = []
+        for feature in self.reachable_layer.getFeatures():
+            parts.extend(feature.geometry().asMultiPolylineXY())
+        return QgsGeometry.fromMultiPolylineXY(parts)
+
+
+class ICSweep:
+    """The result of compute_ic_sweep: an ICResult for every walking
+    distance (in results, shortest first, and by walking distance in
+    by_distance), the distance bands layer (when asked for), the time each
+    stage took and the RunStats of the run."""
+
+    def __init__(self, results, bands_layer, timings, stats):
+        self.results = results
+        self.complete = all(result.complete for result in results)
+        self.by_distance = {result.walking_distance: result
+                            for result in results}
+        self.bands_layer = bands_layer
+        self.timings = timings
+        self.stats = stats
+
+
+class ICPreview:
+    """The prepared blocks of an area, with their edge index and a
+    visibility graph over them kept in memory, for working out the IC of
+    one point of the area after another, such as the point under the
+    cursor. Every block vertex is looked from only once, as far as the
+    longest walking distance, for all the points. Made by
+    prepare_preview."""
+
+    def __init__(self, lines, extent, walking_distances, snap_grid=SNAP_GRID):
+        self.lines = lines
+        self.extent = extent
+        self.walking_distances = walking_distances
+        self.edge_index = EdgeIndex(lines, grid=snap_grid)
+        self.graph = VisibilityGraph(self.edge_index, walking_distances[-1])
+
+    def covers(self, extent):
+        """Check if the prepared area covers the (xmin, ymin, xmax, ymax)
+        extent."""
+        return (self.extent[0] <= extent[0] and self.extent[1] <= extent[1]
+                and extent[2] <= self.extent[2]
+                and extent[3] <= self.extent[3])
+
+    def ic(self, x, y, is_canceled=None):
+        """Returns the ICs of (x, y) for every walking distance, together
+        with the reachable portions of the boundaries within the longest
+        one as a single geometry, or None if the point does not lie in the
+        open space of the area or the search is canceled."""
+        if not self.covers((x, y, x, y)) or self.edge_index.inside(x, y):
+            return None
+        sweep = DistanceSweep(self.walking_distances)
+        expanded = expand_visibility_graph(
+            self.edge_index, x, y, self.walking_distances[-1], sweep,
+            is_canceled, graph=self.graph)
+        if expanded is None:
+            return None
+        ICs = [round(sum(intervals.length(key)
+                         for key in list(intervals.keys())))
+               for intervals in sweep.intervals]
+        return ICs, reachable_geometry(self.lines, sweep.intervals[-1])
+
+
+class ICSurface:
+    """The result of compute_ic_surface: the IC raster (one band per walking
+    distance, written into a GeoTIFF), the points layer of the open space
+    cell centres with their IC, the number of cells worked out and the time
+    each stage took."""
+
+    def __init__(self, raster_layer, points_layer, cells, timings):
+        self.raster_layer = raster_layer
+        self.points_layer = points_layer
+        self.cells = cells
+        self.timings = timings
+
+
+# the value of the raster cells which are inside a block
+SURFACE_NO_DATA = -1
+
+# an IC surface has at most this many cells, every one of them a catchment
+MAX_SURFACE_CELLS = 250000
+
+# an anytime run reports what it has reached at most this often (in seconds)
+REPORT_INTERVAL = 1.0
+
+
+def _no_log(message):
+    pass
+
+
+def _crs_of(blocks, crs):
+    """Returns the CRS to work in: crs, or else the CRS of the blocks layer.
+    A list of geometries has no CRS of its own, so crs is needed with it."""
+    if crs is not None:
+        return crs
+    if isinstance(blocks, QgsVectorLayer):
+        return blocks.crs().authid()
+    raise ValueError('The crs is needed with blocks given as geometries')
+
+
+def blocks_layer_from(blocks, crs):
+    """Returns the blocks as a layer: a layer is used as it is, polygon or
+    line geometries (in crs) are put into a new memory layer."""
+    if isinstance(blocks, QgsVectorLayer):
+        return blocks
+    geometries = list(blocks)
+    kind = 'Polygon'
+    if geometries and geometries[0].type() == QgsWkbTypes.LineGeometry:
+        kind = 'LineString'
+    layer = QgsVectorLayer('Multi%s?crs=%s' % (kind, crs), 'blocks',
+                           'memory')
+    features = []
+    for geometry in geometries:
+        feature = QgsFeature()
+        feature.setGeometry(geometry)
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    layer.updateExtents()
+    return layer
+
+
+def starting_points_layer(points, crs):
+    """Returns a new memory layer holding the (x, y) points, in crs."""
+    layer = QgsVectorLayer('Point?crs=' + crs, 'IC_starting_point', 'memory')
+    provider = layer.dataProvider()
+    with edit(layer):
+        features = []
+        for fid, (x, y) in enumerate(points, 1):
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+            feature.setId(fid)
+            features.append(feature)
+        provider.addFeatures(features)
+    layer.updateFields()
+    layer.updateExtents()
+    return layer
+
+
+def area_layer(extent, crs):
+    """Returns a new memory layer holding the (xmin, ymin, xmax, ymax)
+    rectangle, in crs."""
+    layer = QgsVectorLayer('Polygon?crs=' + crs, 'IC_area', 'memory')
+    feature = QgsFeature()
+    feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(*extent)))
+    layer.dataProvider().addFeatures([feature])
+    layer.updateExtents()
+    return layer
+
+
+def prepare_blocks(blocks_layer, starting_point_layer, walking_distance, crs,
+                   dead_end_width=None, use_cache=True, is_canceled=None,
+                   log=_no_log, stats=None, snap_grid=SNAP_GRID):
+    """Preprocess the blocks around the starting points (from the block
+    cache, unless use_cache is False) and keep the ones which intersect the
+    walking distance around them. The starting point layer can also hold
+    the area the starting points lie in. Returns the BoundaryLines of the
+    kept blocks, snapped to the snapping grid, or None if canceled."""
+    if stats is None:
+        stats = RunStats()
+    # the study area is the bounding box of the walking distance around
+    # the starting points, only the blocks around it are preprocessed
+    starting_point_layer.updateExtents()
+    study_area = starting_point_layer.extent()
+    study_area.grow(walking_distance)
+
+    # the fixed, reprojected and dissolved blocks, from the cache when
+    # the same blocks layer has been preprocessed with the same options
+    # before
+    if use_cache:
+        blocks_layer = block_cache.blocks(
+            blocks_layer, crs, dead_end_width, study_area, is_canceled,
+            stats)
+        log('Block cache: %s' % block_cache.summary())
+    else:
+        blocks_layer = preprocess_blocks(
+            blocks_layer, crs, None,
+            study_extent(study_area, dead_end_width), is_canceled, stats)
+        # the dead-ends are only filled in near the walking distance
+        if blocks_layer is not None and dead_end_width:
+            blocks_layer = fill_dead_ends_near(
+                blocks_layer, dead_end_width, study_area, stats=stats)
+    if blocks_layer is None:
+        return None
+    if dead_end_width:
+        log('Dead-ends: %s filled in'
+            % stats.counters.get('dead-ends filled', 0))
+
+    # This is where I keep only the blocks within the walking distance of
+    # the starting points
+    with stats.stage('blocks within walking distance'):
+        blocks = list(features_within(blocks_layer, starting_point_layer,
+                                      walking_distance))
+    # the copy of the preprocessed blocks is not needed any more
+    del blocks_layer
+
+    if is_canceled is not None and is_canceled():
+        return None
+
+    # This is where I take the boundaries of the blocks apart into rings,
+    # turned so that every block lies on the left of its rings
+    with stats.stage('block lines'):
+        lines = block_lines_from(blocks, snap_grid)
+    stats.count('boundary lines', len(lines))
+    return lines
+
+
+def store_lines(block_store, points, walking_distance, stats=None):
+    """Returns the BoundaryLines of the blocks in the block store around
+    the (x, y) points, as far as the walking distance, read from the tiles
+    around them only."""
+    if stats is None:
+        stats = RunStats()
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    with stats.stage('read block store'):
+        lines = block_store.lines((min(xs) - walking_distance,
+                                   min(ys) - walking_distance,
+                                   max(xs) + walking_distance,
+                                   max(ys) + walking_distance))
+    stats.count('boundary lines', len(lines))
+    return lines
+
+
+def open_block_store(blocks_layer, path, crs, dead_end_width=None,
+                     is_canceled=None, progress=None, log=_no_log):
+    """Returns the BlockStore at path, built from the blocks layer by
+    build_block_store first when the file does not exist. A store of
+    another CRS or dead-end width is refused with a ValueError. Returns None
+    if canceled."""
+    if not os.path.isfile(path):
+        log('Block store: building %s' % path)
+        stats = RunStats()
+        if build_block_store(blocks_layer, crs, path, dead_end_width,
+                             is_canceled=is_canceled, progress=progress,
+                             stats=stats) is None:
+            return None
+        log('Block store: %s blocks stored'
+            % stats.counters.get('blocks stored', 0))
+    block_store = BlockStore(path)
+    if block_store.crs != crs \
+            or block_store.dead_end_width != (dead_end_width or None):
+        block_store.close()
+        raise ValueError(
+            'The block store %s was built in %s with a dead-end width of %s, '
+            'not in %s with %s' % (path, block_store.crs,
+                                   block_store.dead_end_width, crs,
+                                   dead_end_width or None))
+    return block_store
+
+
+def _check_engine(engine, use_cache, block_store):
+    """Refuses the stored visibility graph engine where it cannot run: it is
+    kept next to the blocks of the block cache, so it needs the cache, and
+    a block store has no visibility graph."""
+    if engine != ENGINE_STORED_GRAPH:
+        return
+    if block_store is not None:
+        raise ValueError(
+            'The stored visibility graph is kept for the blocks of the block '
+            'cache, not for a block store: use another engine with it')
+    if not use_cache:
+        raise ValueError(
+            'The stored visibility graph is kept in the block cache: use the '
+            'block cache or another engine')
+
+
+def _stored_graph(blocks_layer, crs, dead_end_width, extent,
+                  walking_distance, is_canceled, progress, log, stats=None,
+                  snap_grid=SNAP_GRID):
+    """Returns the lines, the edge index and the GraphStore of the cached
+    blocks around the (xmin, ymin, xmax, ymax) extent, as far as the walking
+    distance, or None if canceled."""
+    graph = block_cache.graph(
+        blocks_layer, crs, dead_end_width,
+        QgsRectangle(extent[0] - walking_distance,
+                     extent[1] - walking_distance,
+                     extent[2] + walking_distance,
+                     extent[3] + walking_distance),
+        walking_distance, is_canceled, progress, stats, snap_grid)
+    if graph is not None:
+        log('Block cache: %s' % block_cache.summary())
+    return graph
+
+
+def reachable_layer(lines, intervals, crs):
+    """Write the reachable portions of the boundaries into a new
+    IC_reachable layer, one feature per block boundary, with the length
+    of the reachable portions and the total IC. Returns the layer and
+    IC."""
+    layer = QgsVectorLayer('MultiLineString?crs='+crs,
+                           'IC_reachable', 'memory')
+    provider = layer.dataProvider()
+    provider.addAttributes(
+        [
+            QgsField('ic_boundary_id', QVariant.Int),
+            QgsField('length', QVariant.Double, len=20, prec=3),
+            QgsField('IC', QVariant.Int),
+        ]
+    )
+    layer.updateFields()
+
+    boundaries = {}
+    for line in lines:
+        boundaries.setdefault(line.boundary_id, []).append(line)
+
+    features = []
+    for boundary_id, boundary_lines in boundaries.items():
+        parts = []
+        length = 0
+        for line in boundary_lines:
+            for start, end in intervals.merged(line.key):
+                parts.append([QgsPointXY(x, y)
+                              for x, y in line.substring(start, end)])
+                length += end - start
+        if not parts:
+            continue
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromMultiPolylineXY(parts))
+        feature['ic_boundary_id'] = boundary_id
+        feature['length'] = length
+        features.append(feature)
+
+    IC = round(sum(feature['length'] for feature in features))
+    for feature in features:
+        feature['IC'] = IC
+    provider.addFeatures(features)
+    layer.updateExtents()
+    return layer, IC
+
+
+def reachable_geometry(lines, intervals):
+    """Returns the reachable portions of the boundaries as a single multi
+    line geometry."""
+    parts = []
+    for line in lines:
+        for start, end in intervals.merged(line.key):
+            parts.append([QgsPointXY(x, y)
+                          for x, y in line.substring(start, end)])
+    return QgsGeometry.fromMultiPolylineXY(parts)
+
+
+def _graph_vertices(point, previous_nodes, distances, walking_distance):
+    """Returns a VertexStore of the nodes reached by a visibility graph
+    search, given the place of a node by point and the node each node was
+    reached from. The iteration of a vertex is the number of sight lines on
+    its shortest path, nodes are settled after the node they come from."""
+    vertex_store = VertexStore()
+    fids = {}
+    hops = {}
+    for node, distance in distances.items():
+        previous = previous_nodes[node]
+        hops[node] = 0 if previous is None else hops[previous] + 1
+        x, y = point(node)
+        vertex = vertex_store.offer(
+            x, y, walking_distance - distance,
+            hops[node], prev_id=fids.get(previous))
+        if vertex is not None:
+            fids[node] = vertex.fid
+    return vertex_store
+
+
+def bands_layer(lines, sweep, crs):
+    """Write the reachable portions of the boundaries into a new IC_bands
+    layer by distance band, one feature per block boundary and band, with
+    the walking distance of the band, the one before it and the length of
+    the portions."""
+    layer = QgsVectorLayer('MultiLineString?crs='+crs,
+                           'IC_bands', 'memory')
+    provider = layer.dataProvider()
+    provider.addAttributes(
+        [
+            QgsField('ic_boundary_id', QVariant.Int),
+            QgsField('from_distance', QVariant.Double, len=20, prec=3),
+            QgsField('to_distance', QVariant.Double, len=20, prec=3),
+            QgsField('length', QVariant.Double, len=20, prec=3),
+        ]
+    )
+    layer.updateFields()
+
+    previous = dict(zip(sweep.walking_distances[1:],
+                        sweep.walking_distances))
+    parts = {}
+    for line in lines:
+        for start, end, distance in sweep.bands(line.key):
+            band = parts.setdefault((line.boundary_id, distance), [])
+            band.append((line, start, end))
+
+    features = []
+    for (boundary_id, distance), band in sorted(parts.items()):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromMultiPolylineXY([
+            [QgsPointXY(x, y) for x, y in line.substring(start, end)]
+            for line, start, end in band
+        ]))
+        feature['ic_boundary_id'] = boundary_id
+        feature['from_distance'] = previous.get(distance, 0.0)
+        feature['to_distance'] = distance
+        feature['length'] = sum(end - start for line, start, end in band)
+        features.append(feature)
+    provider.addFeatures(features)
+    layer.updateExtents()
+    return layer
+
+
+def _walking_distances(walking_distance):
+    """Returns a walking distance, or a list of them, as a sorted list."""
+    if isinstance(walking_distance, (int, float)):
+        return [walking_distance]
+    return sorted(set(walking_distance))
+
+
+def compute_ic_sweep(blocks, origin, walking_distances, crs=None,
+                     dead_end_width=None, engine=ENGINE_ITERATIVE,
+                     vertices_layer=False, bands=False, use_cache=True,
+                     is_canceled=None, log=_no_log, stats_path=None,
+                     progress=None, snap_grid=SNAP_GRID, processes=1,
+                     time_budget=None, max_iterations=None, report=None,
+                     block_store=None):
+    """Work out the interface catchment of a starting point for several
+    walking distances at once. The blocks are prepared and the catchment is
+    grown only once, to the longest walking distance, and the reachable
+    portions of the boundaries are cut down to each of the walking
+    distances from the walking distance of the points they are seen from.
+
+    The parameters are those of compute_ic, with a list of walking
+    distances. The vertices layer holds the vertices reached within the
+    longest walking distance and comes with its result. With bands, the
+    reachable portions are also written into a layer by distance band.
+    progress is called with the percentage done while a stored visibility
+    graph is built.
+
+    With a time_budget (in seconds from the start of the run) or
+    max_iterations (the most sight lines to a point looked from) the run is
+    anytime: the catchment is grown by the iterative frontier, and when the
+    budget runs out or the run is canceled while it grows, the result holds
+    what has been reached so far. The ICs of the walking distances within
+    which every point has been looked from are exact, the others are lower
+    bounds and their results are not complete. report is called about every
+    REPORT_INTERVAL seconds while the iterative frontier grows, with the
+    walking distance reached, the (lower bound) ICs of the walking
+    distances and the geometry of what is reachable within the longest.
+
+    With a block_store (a BlockStore written by build_block_store) the
+    blocks are read from the tiles of the store around the starting point
+    rather than prepared from blocks, which can be None; the CRS, the
+    snapping grid and the dead-end width are those of the store. The store
+    holds no visibility, so the stored visibility graph engine is refused
+    with a ValueError.
+
+    Returns an ICSweep, or None if canceled.
+    """
+    stats = RunStats()
+    timings = {}
+    starttime = time.time()
+    walking_distances = _walking_distances(walking_distances)
+    walking_distance = walking_distances[-1]
+    anytime = time_budget is not None or max_iterations is not None
+    if anytime and engine != ENGINE_ITERATIVE:
+        log('An anytime run grows the catchment with the iterative '
+            'frontier, which can be stopped at any time')
+        engine = ENGINE_ITERATIVE
+    _check_engine(engine, use_cache, block_store)
+    if block_store is not None:
+        # the blocks were prepared into the block store, in its CRS and
+        # snapped to its grid
+        crs, snap_grid = block_store.crs, block_store.grid
+        blocks_layer = None
+    else:
+        crs = _crs_of(blocks, crs)
+        blocks_layer = blocks_layer_from(blocks, crs)
+    if isinstance(origin, QgsPointXY):
+        x, y = origin.x(), origin.y()
+    else:
+        x, y = origin
+    starting_point_layer = starting_points_layer([(x, y)], crs)
+
+    if engine == ENGINE_STORED_GRAPH:
+        # the blocks of the whole study area of the block cache, with the
+        # visibility graph of their vertices built once for all the
+        # starting points in it
+        graph = _stored_graph(blocks_layer, crs, dead_end_width,
+                              (x, y, x, y), walking_distance, is_canceled,
+                              progress, log, stats, snap_grid)
+        if graph is None:
+            return None
+        lines, edge_index, store = graph
+    else:
+        if block_store is not None:
+            lines = store_lines(block_store, [(x, y)], walking_distance,
+                                stats)
+        else:
+            lines = prepare_blocks(blocks_layer, starting_point_layer,
+                                   walking_distance, crs, dead_end_width,
+                                   use_cache, is_canceled, log, stats,
+                                   snap_grid)
+        if lines is None:
+            return None
+        # index the edges so that a point is only looked from towards the
+        # edges within its remaining walking distance
+        with stats.stage('edge index'):
+            edge_index = EdgeIndex(lines, grid=snap_grid)
+    timings['blocks'] = time.time() - starttime
+
+    # the reachable portions of the boundaries, as intervals of the
+    # distance along each boundary line, for every walking distance
+    sweep = DistanceSweep(walking_distances)
+    vertex_store = None
+    complete_within = walking_distance
+
+    # an anytime run stops growing when its time runs out
+    stop = is_canceled
+    if time_budget is not None:
+        def stop():
+            return (time.time() - starttime > time_budget
+                    or is_canceled is not None and is_canceled())
+    expansion_report = None
+    if report is not None:
+        last_report = time.time()
+
+        def expansion_report(walked):
+            nonlocal last_report
+            if time.time() - last_report < REPORT_INTERVAL:
+                return
+            last_report = time.time()
+            report(walked,
+                   [round(sum(intervals.length(key)
+                              for key in list(intervals.keys())))
+                    for intervals in sweep.intervals],
+                   reachable_geometry(lines, sweep.intervals[-1]))
+
+    # grow the catchment from the starting point with the chosen engine
+    stagetime = time.time()
+    if engine == ENGINE_VISIBILITY_GRAPH:
+        expanded = expand_visibility_graph(
+            edge_index, x, y, walking_distance, sweep, is_canceled,
+            stats)
+        if expanded is None:
+            return None
+        graph, distances = expanded
+        log('Visibility graph: %s vertices seen, %s reached'
+            %(len(graph.nodes), len(distances)))
+        if vertices_layer:
+            vertex_store = _graph_vertices(
+                graph.point, graph.previous, distances,
+                walking_distance)
+    elif engine == ENGINE_STORED_GRAPH:
+        expanded = expand_graph_store(
+            store, edge_index, x, y, walking_distance, sweep, is_canceled,
+            stats)
+        if expanded is None:
+            return None
+        distances, previous = expanded
+        log('Stored visibility graph: %s of %s vertices reached'
+            %(len(distances) - 1, store.node_count))
+        if vertices_layer:
+            def point(node):
+                return (x, y) if node == ORIGIN else store.point(node)
+            vertex_store = _graph_vertices(point, previous, distances,
+                                           walking_distance)
+    else:
+        if processes != 1 and walking_distance < PARALLEL_DISTANCE:
+            log('Walking distances under %g are grown in a single process, '
+                'the worker processes would only slow them down'
+                % PARALLEL_DISTANCE)
+            processes = 1
+        if processes == 1:
+            vertex_store = expand_iterative(
+                edge_index, x, y, walking_distance, sweep, stop, stats,
+                anytime, max_iterations, expansion_report)
+        else:
+            vertex_store = expand_parallel(
+                edge_index, x, y, walking_distance, sweep, processes, stop,
+                stats, partial=anytime, max_iterations=max_iterations,
+                report=expansion_report)
+        if vertex_store is None:
+            return None
+        log('Vertices: %s added, %s replaced by shorter paths, %s kept'
+            %(vertex_store.added, vertex_store.replaced, len(vertex_store)))
+        complete_within = vertex_store.complete_within
+        if complete_within < walking_distance:
+            log('Stopped early, the catchment is complete within %g of '
+                'the walking distance' % complete_within)
+    log('Edge index: %s' % edge_index.summary())
+    timings['expansion'] = time.time() - stagetime
+
+    # write the reachable portions of the boundaries, together with their
+    # lengths, into a resulting layer for every walking distance
+    stagetime = time.time()
+    results = []
+    for distance, intervals in zip(walking_distances, sweep.intervals):
+        with stats.stage('reachable length'):
+            layer, IC = reachable_layer(lines, intervals, crs)
+        if len(walking_distances) == 1:
+            layer.setName('IC_' + str(IC))
+        else:
+            layer.setName('IC_%gm_%s' % (distance, IC))
+        complete = distance <= complete_within
+        if not complete:
+            layer.setName(layer.name() + '_lower_bound')
+        results.append(ICResult(IC, layer, starting_point_layer, None,
+                                timings, stats, distance, complete))
+    stats.count('intervals merged', sweep.unions)
+    if vertices_layer:
+        with stats.stage('vertices layer'):
+            results[-1].vertices_layer = vertex_store.to_layer(crs)
+    distance_bands = None
+    if bands:
+        with stats.stage('distance bands'):
+            distance_bands = bands_layer(lines, sweep, crs)
+    timings['output'] = time.time() - stagetime
+    timings['total'] = time.time() - starttime
+
+    if stats_path is not None:
+        stats.write_json(
+            stats_path, engine=engine, origin=[x, y], timings=timings,
+            ic={'%g' % result.walking_distance: result.ic
+                for result in results},
+            complete={'%g' % result.walking_distance: result.complete
+                      for result in results})
+    return ICSweep(results, distance_bands, timings, stats)
+
+
+def compute_ic(blocks, origin, walking_distance, crs=None,
+               dead_end_width=None, engine=ENGINE_ITERATIVE,
+               vertices_layer=False, use_cache=True, is_canceled=None,
+               log=_no_log, stats_path=None, progress=None,
+               snap_grid=SNAP_GRID, processes=1, time_budget=None,
+               max_iterations=None, report=None, block_store=None):
+    """Work out the interface catchment of a starting point.
+
+    blocks is a polygon or line layer of the urban blocks, or a list of
+    their geometries in crs. origin is the starting point as (x, y) or a
+    QgsPointXY in crs, which defaults to the CRS of the blocks layer; the
+    blocks are reprojected into it. With a list of geometries crs is needed,
+    a ValueError is raised without it. dead_end_width is the width of the
+    dead-end streets to fill in, None keeps them. engine is one of ENGINES.
+    With vertices_layer the reached vertices are returned as a layer too.
+    is_canceled is called now and then to stop the work early and log is
+    called with progress messages. The timers and counters of the run are
+    kept in the stats of the result, and written into a JSON file at
+    stats_path when it is given. progress is called with the percentage done
+    while a stored visibility graph is built. The coordinates of the blocks
+    are snapped to a grid of snap_grid spacing, on which the block vertices
+    are compared. With the iterative engine and more than one process (None
+    for one per core), the points reached at about the same walking distance
+    are looked from at once in a pool of worker processes, which gives the
+    same IC as a single process; walking distances under PARALLEL_DISTANCE
+    are grown in a single process. time_budget, max_iterations and report
+    make an anytime run, and block_store reads the blocks from a block
+    store, see compute_ic_sweep.
+
+    Returns an ICResult, or None if canceled.
+    """
+    sweep = compute_ic_sweep(blocks, origin, [walking_distance], crs,
+                             dead_end_width, engine, vertices_layer,
+                             use_cache=use_cache, is_canceled=is_canceled,
+                             log=log, stats_path=stats_path,
+                             progress=progress, snap_grid=snap_grid,
+                             processes=processes, time_budget=time_budget,
+                             max_iterations=max_iterations, report=report,
+                             block_store=block_store)
+    if sweep is None:
+        return None
+    return sweep.results[0]
+
+
+def compute_ic_batch(blocks, origins_layer, walking_distance, crs=None,
+                     dead_end_width=None, engine=ENGINE_ITERATIVE,
+                     processes=None, use_cache=True, is_canceled=None,
+                     progress=None, log=_no_log, snap_grid=SNAP_GRID,
+                     block_store=None):
+    """Work out the IC of every point of the origins layer over the same
+    preprocessed blocks, in a pool of worker processes (one per core by
+    default). The parameters are those of compute_ic, and progress is
+    called with the percentage of the points done. walking_distance can
+    also be a list of walking distances, which are all worked out from a
+    single expansion to the longest of them. With a block_store only the
+    blocks around the origins are read from it.
+
+    Returns a copy of the origins layer in crs, named IC_batch, with the IC
+    of every point in its IC field (or in an IC_<walking distance> field
+    for each of the walking distances), or None if canceled. The features
+    without a geometry are left without an IC, see _origin_points.
+    """
+    walking_distances = _walking_distances(walking_distance)
+    _check_engine(engine, use_cache, block_store)
+    if block_store is not None:
+        crs, snap_grid = block_store.crs, block_store.grid
+    else:
+        crs = _crs_of(blocks, crs)
+    # a copy of the origins in crs, to which the IC fields are added
+    origins_layer = origins_layer.materialize(
+        QgsFeatureRequest().setDestinationCrs(
+            QgsCoordinateReferenceSystem(crs),
+            QgsProject.instance().transformContext()))
+    origins = _origin_points(origins_layer)
+    skipped = origins_layer.featureCount() - len(origins)
+    if skipped:
+        log('Batch: %s points without a geometry left out' %skipped)
+
+    store_path = None
+    if block_store is not None:
+        lines = store_lines(block_store, [(x, y) for _, x, y in origins],
+                            walking_distances[-1])
+    elif engine == ENGINE_STORED_GRAPH and origins:
+        # every worker searches the graph stored for the cached blocks
+        xs = [x for _, x, _ in origins]
+        ys = [y for _, _, y in origins]
+        graph = _stored_graph(blocks_layer_from(blocks, crs), crs,
+                              dead_end_width,
+                              (min(xs), min(ys), max(xs), max(ys)),
+                              walking_distances[-1], is_canceled, progress,
+                              log, snap_grid=snap_grid)
+        if graph is None:
+            return None
+        lines, _, store = graph
+        store_path = store.path
+    else:
+        lines = prepare_blocks(blocks_layer_from(blocks, crs), origins_layer,
+                               walking_distances[-1], crs, dead_end_width,
+                               use_cache, is_canceled, log,
+                               snap_grid=snap_grid)
+    if lines is None:
+        return None
+    results = batch_catchments(
+        lines, origins, walking_distances, engine, processes,
+        is_canceled=is_canceled, progress=progress, grid=snap_grid,
+        store_path=store_path)
+    if results is None:
+        return None
+
+    names = _ic_field_names(walking_distances)
+    provider = origins_layer.dataProvider()
+    provider.addAttributes([QgsField(name, QVariant.Int) for name in names
+                            if origins_layer.fields().indexOf(name) == -1])
+    origins_layer.updateFields()
+    fields = [origins_layer.fields().indexOf(name) for name in names]
+    provider.changeAttributeValues(
+        {fid: dict(zip(fields, ICs)) for fid, ICs in results.items()})
+    origins_layer.setName('IC_batch')
+    log('Batch: IC of %s points' %len(results))
+    return origins_layer
+
+
+def _origin_points(origins_layer):
+    """Returns the (fid, x, y) of the points of the origins layer. The
+    features without a geometry are left out, and a multipoint of a single
+    point is taken for it; a multipoint of several points has no single IC,
+    and is refused with a ValueError."""
+    origins = []
+    for feature in origins_layer.getFeatures():
+        geometry = feature.geometry()
+        if geometry.isNull() or geometry.isEmpty():
+            continue
+        if geometry.type() != QgsWkbTypes.PointGeometry:
+            raise ValueError('The origins must be points, feature %s is not'
+                             % feature.id())
+        if geometry.isMultipart():
+            points = geometry.asMultiPoint()
+            if len(points) != 1:
+                raise ValueError(
+                    'Feature %s of the origins is a multipoint of %s points, '
+                    'split it into single points first'
+                    % (feature.id(), len(points)))
+            point = points[0]
+        else:
+            point = geometry.asPoint()
+        origins.append((feature.id(), point.x(), point.y()))
+    return origins
+
+
+def _ic_field_names(walking_distances):
+    if len(walking_distances) == 1:
+        return ['IC']
+    return ['IC_%g' % distance for distance in walking_distances]
+
+
+def write_surface(path, values, columns, rows, extent, cell_size, crs,
+                  walking_distances):
+    """Write the IC of the cells, given as cell number -> [IC for each
+    walking distance] with the cells numbered row by row from the top left
+    one, into a GeoTIFF with a band for each walking distance."""
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        path, columns, rows, len(walking_distances), gdal.GDT_Int32,
+        ['COMPRESS=DEFLATE'])
+    dataset.SetGeoTransform(
+        (extent[0], cell_size, 0, extent[3], 0, -cell_size))
+    dataset.SetProjection(QgsCoordinateReferenceSystem(crs).toWkt())
+    for number, distance in enumerate(walking_distances):
+        cells = array('i', [SURFACE_NO_DATA]) * (columns * rows)
+        for cell, ICs in values.items():
+            cells[cell] = ICs[number]
+        band = dataset.GetRasterBand(number + 1)
+        band.SetNoDataValue(SURFACE_NO_DATA)
+        band.SetDescription('IC within %g m' % distance)
+        band.WriteRaster(0, 0, columns, rows, cells.tobytes(),
+                         buf_type=gdal.GDT_Int32)
+    dataset.FlushCache()
+    dataset = None
+
+
+def compute_ic_surface(blocks, extent, cell_size, walking_distance,
+                       crs=None, dead_end_width=None,
+                       engine=ENGINE_VISIBILITY_GRAPH, processes=None,
+                       output_path=None, use_cache=True, is_canceled=None,
+                       progress=None, log=_no_log, snap_grid=SNAP_GRID,
+                       block_store=None):
+    """Work out the IC surface of an area: the IC of the centre of every
+    cell of a grid over the extent (a QgsRectangle or an (xmin, ymin, xmax,
+    ymax) tuple in crs) which lies in the open space between the blocks.
+
+    The blocks around the area are prepared only once, and the cells are
+    spread over a pool of worker processes (one per core by default). With
+    the visibility graph engine, the default here, every worker looks from
+    each block vertex only once for all the cells it is handed. The other
+    parameters are those of compute_ic_batch, and with a block_store the
+    blocks around the extent are read from it.
+
+    Returns an ICSurface, with the raster written into output_path (a
+    temporary GeoTIFF by default), or None if canceled. A grid of more than
+    MAX_SURFACE_CELLS cells is refused with a ValueError before anything is
+    worked out.
+    """
+    timings = {}
+    starttime = time.time()
+    walking_distances = _walking_distances(walking_distance)
+    _check_engine(engine, use_cache, block_store)
+    if block_store is not None:
+        crs, snap_grid = block_store.crs, block_store.grid
+    else:
+        crs = _crs_of(blocks, crs)
+    if isinstance(extent, QgsRectangle):
+        extent = (extent.xMinimum(), extent.yMinimum(),
+                  extent.xMaximum(), extent.yMaximum())
+    if not cell_size > 0:
+        raise ValueError('The cell size must be positive')
+    columns = max(1, int(ceil((extent[2] - extent[0]) / cell_size)))
+    rows = max(1, int(ceil((extent[3] - extent[1]) / cell_size)))
+    if columns * rows > MAX_SURFACE_CELLS:
+        raise ValueError(
+            'A surface of %s x %s cells is more than %s cells, zoom in or '
+            'use larger cells' % (columns, rows, MAX_SURFACE_CELLS))
+    store_path = None
+    if block_store is not None:
+        lines = store_lines(block_store, [extent[:2], extent[2:]],
+                            walking_distances[-1])
+    elif engine == ENGINE_STORED_GRAPH:
+        # every worker searches the graph stored for the cached blocks
+        graph = _stored_graph(blocks_layer_from(blocks, crs), crs,
+                              dead_end_width, extent, walking_distances[-1],
+                              is_canceled, progress, log,
+                              snap_grid=snap_grid)
+        if graph is None:
+            return None
+        lines, _, store = graph
+        store_path = store.path
+    else:
+        lines = prepare_blocks(blocks_layer_from(blocks, crs),
+                               area_layer(extent, crs), walking_distances[-1],
+                               crs, dead_end_width, use_cache, is_canceled,
+                               log, snap_grid=snap_grid)
+    if lines is None:
+        return None
+
+    # the cells are numbered row by row from the top left one, like the
+    # raster, and only the ones in the open space are worked out
+    edge_index = EdgeIndex(lines, grid=snap_grid)
+    origins = []
+    for row in range(rows):
+        y = extent[3] - (row + 0.5) * cell_size
+        for column in range(columns):
+            x = extent[0] + (column + 0.5) * cell_size
+            if not edge_index.inside(x, y):
+                origins.append((row * columns + column, x, y))
+    log('Surface: %s of %s cells in the open space'
+        %(len(origins), columns * rows))
+    timings['blocks'] = time.time() - starttime
+
+    stagetime = time.time()
+    results = batch_catchments(
+        lines, origins, walking_distances, engine, processes,
+        is_canceled=is_canceled, progress=progress, grid=snap_grid,
+        store_path=store_path)
+    if results is None:
+        return None
+    timings['catchments'] = time.time() - stagetime
+
+    stagetime = time.time()
+    if output_path is None:
+        output_path = QgsProcessingUtils.generateTempFilename(
+            'IC_surface.tif')
+    write_surface(output_path, results, columns, rows, extent, cell_size,
+                  crs, walking_distances)
+    raster_layer = QgsRasterLayer(output_path, 'IC_surface')
+
+    points_layer = QgsVectorLayer('Point?crs=' + crs, 'IC_surface_points',
+                                  'memory')
+    provider = points_layer.dataProvider()
+    names = _ic_field_names(walking_distances)
+    provider.addAttributes([QgsField('cell', QVariant.Int)]
+                           + [QgsField(name, QVariant.Int) for name in names])
+    points_layer.updateFields()
+    features = []
+    for cell, x, y in origins:
+        feature = QgsFeature(points_layer.fields())
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        feature['cell'] = cell
+        for name, IC in zip(names, results[cell]):
+            feature[name] = IC
+        features.append(feature)
+    provider.addFeatures(features)
+    points_layer.updateExtents()
+    timings['output'] = time.time() - stagetime
+    timings['total'] = time.time() - starttime
+
+    return ICSurface(raster_layer, points_layer, len(origins), timings)
+
+
+def prepare_preview(blocks, extent, walking_distance, crs=None,
+                    dead_end_width=None, use_cache=True, is_canceled=None,
+                    log=_no_log, snap_grid=SNAP_GRID):
+    """Prepare the blocks around an area (a QgsRectangle or an (xmin, ymin,
+    xmax, ymax) tuple in crs) for previewing the IC of its points. The
+    parameters are those of compute_ic_surface. Returns an ICPreview, or
+    None if canceled."""
+    walking_distances = _walking_distances(walking_distance)
+    crs = _crs_of(blocks, crs)
+    if isinstance(extent, QgsRectangle):
+        extent = (extent.xMinimum(), extent.yMinimum(),
+                  extent.xMaximum(), extent.yMaximum())
+    lines = prepare_blocks(blocks_layer_from(blocks, crs),
+                           area_layer(extent, crs), walking_distances[-1],
+                           crs, dead_end_width, use_cache, is_canceled, log,
+                           snap_grid=snap_grid)
+    if lines is None:
+        return None
+    log('Preview: %s boundary lines around the map extent' % len(lines))
+    return ICPreview(lines, extent, walking_distances, snap_grid)
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+from heapq import heappop, heappush
+from math import hypot
+
+from .icgraph import SOURCE, VisibilityGraph, REMAINING_TOLERANCE
+from .icintervals import DistanceSweep
+from .icstats import RunStats
+from .icvertices import VertexStore
+from .icvisibility import look
+
+# the algorithms for growing the catchment, in the order they are listed in
+# the dialog
+ENGINE_ITERATIVE = 'iterative'
+ENGINE_VISIBILITY_GRAPH = 'visibility_graph'
+ENGINE_STORED_GRAPH = 'stored_graph'
+ENGINES = (ENGINE_ITERATIVE, ENGINE_VISIBILITY_GRAPH, ENGINE_STORED_GRAPH)
+
+# the node number of the starting point in a search over a GraphStore
+ORIGIN = -1
+
+# the points looked from in a round of expand_rounds are all those within
+# this walking distance (in the units of the CRS) of the nearest one
+ROUND_STEP = 50.0
+
+# a vertex with less walking distance left than this (in the units of the
+# CRS) is only looked from when it can still reach a part of a boundary
+# which is not reachable yet; further from the end of the walking distance
+# there nearly always is one, and checking costs more than it saves
+DROP_DISTANCE = 150.0
+
+
+def _segment_distance(x, y, ax, ay, bx, by):
+    dx = bx - ax
+    dy = by - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0
+    if length2 > 0:
+        t = min(max(((x - ax) * dx + (y - ay) * dy) / length2, 0.0), 1.0)
+    return hypot(ax + t * dx - x, ay + t * dy - y)
+
+
+def _reaches_unreached(edge_index, intervals, x, y, walked, radius,
+                       settled):
+    """Check if a point walked to from the starting point can still add to
+    what is reachable, that is if a part of a boundary which is not
+    reachable yet lies within its walking distance left (radius). Anything
+    reached from the point is within radius of it as well, so when there
+    is none, neither the point nor the vertices seen from it need to be
+    looked from. settled holds the numbers of the lines found reachable
+    all along within every walking distance."""
+    if radius >= DROP_DISTANCE:
+        return True
+    lines = edge_index.lines
+    for line_no in edge_index.lines_near(x, y, radius):
+        if line_no in settled:
+            continue
+        line = lines[line_no]
+        if not intervals.unreached(line):
+            settled.add(line_no)
+            continue
+        for start, end in intervals.unreached(line, walked):
+            points = line.substring(start, end)
+            for (ax, ay), (bx, by) in zip(points, points[1:]):
+                if _segment_distance(x, y, ax, ay, bx, by) < radius:
+                    return True
+    return False
+
+
+def _offer_corners(vertex_store, view, walked, iteration, fid):
+    """Offer the corners seen in a view from a point walked to from the
+    starting point, which is the vertex fid (None for the starting point).
+    Returns the heap entries of the added corners with walking distance
+    left, to be looked from next; a shortest path never bends at any other
+    vertex."""
+    entries = []
+    for vx, vy in view.corners:
+        length, line = view.vertices[(vx, vy)]
+        remaining = view.radius - length
+        added = vertex_store.offer(
+            vx, vy, remaining, iteration, prev_id=fid,
+            boundary_id=line.boundary_id)
+        if added is not None and remaining > REMAINING_TOLERANCE:
+            entries.append((walked + length, added.fid, vx, vy, added.fid))
+    return entries
+
+
+def expand_iterative(edge_index, x, y, walking_distance, intervals,
+                     is_canceled=None, stats=None, partial=False,
+                     max_iterations=None, report=None):
+    """Grow the catchment from (x, y) vertex by vertex: every vertex seen is
+    a new point to look from, until no vertex with some walking distance
+    left is found. The vertices are looked from in the order of the walking
+    distance to them, so a vertex is only looked from once, by the shortest
+    path to it, and a vertex with no part of a boundary which is not yet
+    reachable within its walking distance left is dropped without looking
+    from it. The reachable portions of the boundaries are added to
+    intervals (a ReachableIntervals, or a DistanceSweep for several walking
+    distances up to this one), and the time taken and the work done are
+    added to stats (a RunStats). Returns the VertexStore of the reached
+    vertices, with the number of sight lines on their path as their
+    iteration, or None if canceled.
+
+    Whatever has been added to intervals so far is reachable, so the
+    expansion can be stopped at any time: with partial, a canceled run
+    returns the vertices reached so far instead of None, and the
+    complete_within of the VertexStore tells the walking distance within
+    which the catchment is complete. The vertices reached by more than
+    max_iterations sight lines are not looked from. report is called with
+    the walking distance to every point looked from, after what it sees
+    has been added to intervals."""
+    if stats is None:
+        stats = RunStats()
+    tested = edge_index.tested
+    complete_within = walking_distance
+
+    # the vertices reached so far, with the walking distance they have
+    # left; a vertex reached by a shorter path replaces the one before
+    vertex_store = VertexStore(edge_index.grid)
+
+    # the points to look from, by the walking distance to them; the entries
+    # of the vertices replaced since they were pushed are skipped
+    heap = [(0.0, 0, x, y, None)]
+    looked_from = {}
+    settled = set()
+
+    while heap:
+        if is_canceled is not None and is_canceled():
+            if not partial:
+                return None
+            # every point nearer than those left has been looked from
+            complete_within = min(complete_within, heap[0][0])
+            break
+        walked, _, px, py, fid = heappop(heap)
+        distance = walking_distance - walked
+        iteration = 1
+        if fid is not None:
+            vertex = vertex_store.vertices.get(fid)
+            if vertex is None:
+                stats.count('vertices skipped')
+                continue
+            iteration = vertex.iteration + 1
+            if max_iterations is not None and iteration > max_iterations:
+                stats.count('vertices over budget')
+                complete_within = min(complete_within, walked)
+                continue
+            if not _reaches_unreached(edge_index, intervals, px, py, walked,
+                                      distance, settled):
+                stats.count('vertices dropped')
+                continue
+        looked_from[iteration] = looked_from.get(iteration, 0) + 1
+
+        with stats.stage('first pass' if fid is None else 'expansion'):
+            # everything seen from the point within its remaining walking
+            # distance is reachable, and the corners seen with some walking
+            # distance left are the points to look from next
+            view = look(edge_index, px, py, distance)
+            intervals.add_view(view, walked)
+            for entry in _offer_corners(vertex_store, view, walked,
+                                        iteration, fid):
+                heappush(heap, entry)
+            stats.count('vertices tested', len(view.vertices))
+            stats.count('vertices pruned',
+                        len(view.vertices) - len(view.corners))
+            stats.count('portions found', len(view.portions))
+        if report is not None:
+            report(walked)
+
+    # the number of points looked from for every number of sight lines
+    for iteration in sorted(looked_from):
+        stats.record('frontier size', looked_from[iteration])
+    stats.count('iterations', len(looked_from))
+    stats.count('vertices settled', sum(looked_from.values()) - 1)
+    stats.count('edges tested', edge_index.tested - tested)
+    stats.count('vertices accepted', vertex_store.added)
+    stats.count('vertices replaced', vertex_store.replaced)
+    vertex_store.complete_within = complete_within
+    return vertex_store
+
+
+def expand_rounds(edge_index, x, y, walking_distance, intervals, look_all,
+                  is_canceled=None, stats=None, step=ROUND_STEP,
+                  partial=False, max_iterations=None, report=None):
+    """Grow the catchment from (x, y) as expand_iterative does, but in
+    rounds: each round takes every point to look from within step of
+    walking distance of the nearest one and looks from all of them at once
+    with look_all, which is given the list of their (x, y, radius) and
+    returns their Views in the same order, in worker processes for one.
+    What they see is then added in the order they were taken, so the result
+    does not depend on how look_all gets the views. A point reached by a
+    shorter path found in its own round is looked from again, which only
+    adds to what it has seen, so the IC is that of expand_iterative. The
+    vertices are dropped by what the rounds before have reached, which
+    does not depend on the number of processes either. The parameters and
+    the result are those of expand_iterative."""
+    if stats is None:
+        stats = RunStats()
+    tested = edge_index.tested
+    complete_within = walking_distance
+    vertex_store = VertexStore(edge_index.grid)
+    heap = [(0.0, 0, x, y, None)]
+    looked_from = {}
+    settled = set()
+    rounds = 0
+
+    while heap:
+        if is_canceled is not None and is_canceled():
+            if not partial:
+                return None
+            complete_within = min(complete_within, heap[0][0])
+            break
+        # the points of the round, in the order they are taken from the
+        # heap, which is the same whatever the number of processes
+        points = []
+        last = heap[0][0] + step
+        while heap and heap[0][0] <= last:
+            walked, _, px, py, fid = heappop(heap)
+            iteration = 1
+            if fid is not None:
+                vertex = vertex_store.vertices.get(fid)
+                if vertex is None:
+                    stats.count('vertices skipped')
+                    continue
+                iteration = vertex.iteration + 1
+                if max_iterations is not None and iteration > max_iterations:
+                    stats.count('vertices over budget')
+                    complete_within = min(complete_within, walked)
+                    continue
+                # by what the rounds before have reached
+                if not _reaches_unreached(edge_index, intervals, px, py,
+                                          walked, walking_distance - walked,
+                                          settled):
+                    stats.count('vertices dropped')
+                    continue
+            looked_from[iteration] = looked_from.get(iteration, 0) + 1
+            points.append((walked, px, py, fid, iteration))
+        if not points:
+            continue
+        rounds += 1
+        stats.record('round size', len(points))
+
+        with stats.stage('first pass' if rounds == 1 else 'expansion'):
+            views = look_all([(px, py, walking_distance - walked)
+                              for walked, px, py, _, _ in points])
+            for (walked, _, _, fid, iteration), view in zip(points, views):
+                intervals.add_view(view, walked)
+                for entry in _offer_corners(vertex_store, view, walked,
+                                            iteration, fid):
+                    heappush(heap, entry)
+                stats.count('vertices tested', len(view.vertices))
+                stats.count('vertices pruned',
+                            len(view.vertices) - len(view.corners))
+                stats.count('portions found', len(view.portions))
+        if report is not None:
+            report(points[-1][0])
+
+    for iteration in sorted(looked_from):
+        stats.record('frontier size', looked_from[iteration])
+    stats.count('iterations', len(looked_from))
+    stats.count('rounds', rounds)
+    stats.count('vertices settled', sum(looked_from.values()) - 1)
+    stats.count('edges tested', edge_index.tested - tested)
+    stats.count('vertices accepted', vertex_store.added)
+    stats.count('vertices replaced', vertex_store.replaced)
+    vertex_store.complete_within = complete_within
+    return vertex_store
+
+
+def expand_visibility_graph(edge_index, x, y, walking_distance, intervals,
+                            is_canceled=None, stats=None, graph=None):
+    """Grow the catchment from (x, y) with a single shortest path search over
+    the visibility graph of the block vertices, cut off at the walking
+    distance. Every settled vertex is looked from once, with the walking
+    distance it has left, and what it sees is added to intervals (as in
+    expand_iterative). The time taken and the work done are added to stats
+    (a RunStats). A graph searched before over the same edge index can be
+    given to look from its nodes only once over all the searches. Returns
+    the graph and the walking distances of the reached nodes, or None if
+    canceled."""
+    if stats is None:
+        stats = RunStats()
+    tested = edge_index.tested
+
+    if graph is None:
+        graph = VisibilityGraph(edge_index)
+    source = graph.source(x, y)
+
+    try:
+        with stats.stage('shortest paths'):
+            distances = graph.shortest_paths(source, walking_distance,
+                                             is_canceled)
+        if distances is None:
+            return None
+
+        # the search has looked from every settled node with the walking
+        # distance it has left, so the views are already there
+        with stats.stage('visible portions'):
+            for node, distance in distances.items():
+                if is_canceled is not None and is_canceled():
+                    return None
+                remaining = walking_distance - distance
+                if remaining <= REMAINING_TOLERANCE:
+                    continue
+                view = graph.view(node, remaining)
+                intervals.add_view(view, distance)
+                stats.count('portions found', len(view.portions))
+    finally:
+        # a starting point which is not a block corner is looked from only
+        # once, even when the search is canceled
+        if source == SOURCE:
+            graph.forget(source)
+
+    stats.count('vertices tested', sum(
+        len(view.vertices) for view in graph.views.values()))
+    stats.count('vertices seen', len(graph.nodes))
+    stats.count('vertices accepted', len(distances))
+    stats.count('edges tested', edge_index.tested - tested)
+    return graph, distances
+
+
+def expand_graph_store(store, edge_index, x, y, walking_distance,
+                       intervals, is_canceled=None, stats=None):
+    """Grow the catchment from (x, y) with a shortest path search over a
+    GraphStore built as far as the walking distance or further. Only the
+    starting point is looked from, every vertex reached takes what it sees
+    from the store. What is seen is added to intervals (as in
+    expand_iterative). Returns the walking distances of the reached nodes
+    and the node each of them was reached from, with the starting point as
+    the ORIGIN node, or None if canceled."""
+    if stats is None:
+        stats = RunStats()
+
+    with stats.stage('first pass'):
+        view = look(edge_index, x, y, walking_distance)
+        intervals.add_view(view)
+    distances = {ORIGIN: 0.0}
+    previous = {ORIGIN: None}
+    heap = []
+    for vx, vy in view.corners:
+        length = view.vertices[(vx, vy)][0]
+        node = store.node_at(vx, vy)
+        if node is not None and length < distances.get(node, length + 1):
+            distances[node] = length
+            previous[node] = ORIGIN
+            heappush(heap, (length, node))
+
+    settled = {ORIGIN: 0.0}
+    with stats.stage('shortest paths'):
+        while heap:
+            if is_canceled is not None and is_canceled():
+                return None
+            distance, node = heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = distance
+            remaining = walking_distance - distance
+            if remaining <= REMAINING_TOLERANCE:
+                continue
+            view = store.view(node, remaining)
+            intervals.add_view(view, distance)
+            stats.count('portions found', len(view.portions))
+            for neighbour, length in store.neighbours(node, remaining):
+                new_distance = distance + length
+                if new_distance < distances.get(neighbour,
+                                                walking_distance + 1):
+                    distances[neighbour] = new_distance
+                    previous[neighbour] = node
+                    heappush(heap, (new_distance, neighbour))
+
+    stats.count('vertices accepted', len(settled))
+    return settled, previous
+
+
+def reachable_lengths(edge_index, x, y, walking_distances,
+                      engine=ENGINE_ITERATIVE, graph=None):
+    """Returns the total length of the boundaries reachable from (x, y)
+    within each of the walking distances, which are the ICs of the point,
+    in the order of the walking distances. The catchment is grown only
+    once, to the longest walking distance. With the visibility graph engine
+    a VisibilityGraph can be given to share the views between the starting
+    points, and the stored graph engine needs the GraphStore to search."""
+    sweep = DistanceSweep(walking_distances)
+    longest = sweep.walking_distances[-1]
+    if engine == ENGINE_STORED_GRAPH:
+        if graph is None:
+            raise ValueError('The stored graph engine needs a graph store')
+        expand_graph_store(graph, edge_index, x, y, longest, sweep)
+    elif engine == ENGINE_VISIBILITY_GRAPH:
+        expand_visibility_graph(edge_index, x, y, longest, sweep,
+                                graph=graph)
+    else:
+        expand_iterative(edge_index, x, y, longest, sweep)
+    lengths = {
+        distance: sum(intervals.length(key)
+                      for key in list(intervals.keys()))
+        for distance, intervals in zip(sweep.walking_distances,
+                                       sweep.intervals)
+    }
+    return [lengths[distance] for distance in walking_distances]
+
+
+def reachable_length(edge_index, x, y, walking_distance,
+                     engine=ENGINE_ITERATIVE):
+    """Returns the total length of the boundaries reachable from (x, y)
+    within the walking distance, which is the IC of the point."""
+    return reachable_lengths(edge_index, x, y, [walking_distance], engine)[0]
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""The geometry steps of preparing the blocks, run directly on lists of
+QgsGeometry instead of through processing algorithms, so that no
+intermediate layer is made and every feature is only copied once."""
+from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform,
+                       QgsFeature, QgsFeatureRequest, QgsGeometry,
+                       QgsProject, QgsRectangle, QgsSpatialIndex,
+                       QgsVectorLayer, QgsWkbTypes)
+
+# the number of segments of a quarter circle in the dead-end buffers, as in
+# the buffers the processing algorithm made
+DEAD_END_SEGMENTS = 5
+
+# the area (in square units of the CRS) below which the difference the
+# dead-end buffers make to a block is taken for a sliver, not a dead-end
+MIN_DEAD_END_AREA = 1.0
+
+
+def polygon_parts(geometry):
+    """Returns the single part polygons of a geometry, leaving out any
+    points or lines (such as the ones makeValid can leave behind)."""
+    if geometry is None or geometry.isEmpty():
+        return []
+    return [part for part in geometry.asGeometryCollection()
+            if part.type() == QgsWkbTypes.PolygonGeometry]
+
+
+def fix(geometry):
+    """Returns the geometry made valid, as in the fix geometries algorithm,
+    or None if nothing is left of it."""
+    if geometry.isNull() or geometry.isEmpty():
+        return None
+    if geometry.isGeosValid():
+        return geometry
+    fixed = geometry.makeValid()
+    if fixed.isNull() or fixed.isEmpty():
+        return None
+    return fixed
+
+
+def ring_polygons(geometry):
+    """Returns a polygon for every part of a line geometry, with the part as
+    its ring, as in the lines to polygons algorithm."""
+    if geometry.isMultipart():
+        parts = geometry.asMultiPolylineXY()
+    else:
+        parts = [geometry.asPolylineXY()]
+    polygons = []
+    for points in parts:
+        if len(points) < 3:
+            continue
+        if points[0] != points[-1]:
+            points = points + [points[0]]
+        polygons.append(QgsGeometry.fromPolygonXY([points]))
+    return polygons
+
+
+def read_blocks(blocks_layer, crs, request):
+    """Read the blocks of the layer handed out by the feature request as
+    fixed polygons in the given CRS. Line blocks are turned into polygons
+    first. Returns a list of QgsGeometry."""
+    transform = None
+    target_crs = QgsCoordinateReferenceSystem(crs)
+    if blocks_layer.crs() != target_crs:
+        transform = QgsCoordinateTransform(
+            blocks_layer.crs(), target_crs, QgsProject.instance())
+    lines = blocks_layer.geometryType() == QgsWkbTypes.LineGeometry
+
+    geometries = []
+    for feature in blocks_layer.getFeatures(request):
+        geometry = fix(feature.geometry())
+        if geometry is None:
+            continue
+        if transform is not None:
+            geometry.transform(transform)
+        if lines:
+            for polygon in ring_polygons(geometry):
+                polygon = fix(polygon)
+                if polygon is not None:
+                    geometries.extend(polygon_parts(polygon))
+        else:
+            geometries.extend(polygon_parts(geometry))
+    return geometries
+
+
+def dissolve(geometries):
+    """Returns the single part polygons of the union of the geometries, so
+    that touching blocks become one."""
+    if not geometries:
+        return []
+    return polygon_parts(QgsGeometry.unaryUnion(geometries))
+
+
+def _apart(geometries, distance):
+    """Returns the geometries in groups, as lists of their positions, with
+    the bounding boxes of no two geometries of a group nearer than distance
+    to each other. The geometries are taken in order and each goes into the
+    first group without a near one, so the groups are about as many as the
+    most blocks meeting around a street corner."""
+    index = QgsSpatialIndex()
+    for position, geometry in enumerate(geometries):
+        index.insertFeature(position, geometry.boundingBox())
+    group_of = {}
+    groups = []
+    for position, geometry in enumerate(geometries):
+        near = geometry.boundingBox()
+        near.grow(distance)
+        taken = {group_of[other] for other in index.intersects(near)
+                 if other in group_of}
+        group = 0
+        while group in taken:
+            group += 1
+        if group == len(groups):
+            groups.append([])
+        groups[group].append(position)
+        group_of[position] = group
+    return groups
+
+
+def _close(geometries, distance):
+    """Returns the closing of the collected geometries: buffered out by
+    distance and back in in one go, with the holes filled in. The
+    geometries are further than twice the distance from each other, so
+    their buffers do not meet and every part of the result is the closing
+    of one of them."""
+    closed = QgsGeometry.collectGeometry(geometries).buffer(
+        distance, DEAD_END_SEGMENTS, QgsGeometry.CapFlat,
+        QgsGeometry.JoinStyleMiter, 2)
+    closed = closed.buffer(
+        -distance, DEAD_END_SEGMENTS, QgsGeometry.CapFlat,
+        QgsGeometry.JoinStyleMiter, 2)
+    return [part.removeInteriorRings() for part in polygon_parts(closed)]
+
+
+def filled_blocks(geometries, dead_end_width):
+    """Fill in the dead-end streets narrower than dead_end_width of every
+    block, by buffering it out by half the width and back in again, which
+    closes the gaps narrower than the width, and filling in any holes left.
+
+    Rather than buffering every block on its own, the blocks are closed a
+    group at a time, in a single buffer out and in of the group collected
+    into one geometry. The blocks of a group are further apart than the
+    width, so that the streets between them are left open, and each block
+    is filled in just as on its own. A convex block without holes has no
+    dead-ends and is left out of the buffers.
+
+    Returns the (block, dead-ends) of every block, in their order, with the
+    number of dead-ends (and holes) filled in, leaving out the slivers the
+    buffers leave behind."""
+    filled = [(geometry, 0) for geometry in geometries]
+    concave = [position for position, geometry in enumerate(geometries)
+               if geometry.convexHull().area() - geometry.area()
+               >= MIN_DEAD_END_AREA]
+    distance = dead_end_width / 2
+    for group in _apart([geometries[position] for position in concave],
+                        dead_end_width):
+        blocks = [geometries[concave[member]] for member in group]
+        parts = _close(blocks, distance)
+        index = QgsSpatialIndex()
+        for number, part in enumerate(parts):
+            index.insertFeature(number, part.boundingBox())
+        for member, block in zip(group, blocks):
+            # the part closed from the block is the one holding it
+            inside = block.pointOnSurface()
+            for number in index.intersects(inside.boundingBox()):
+                closed = parts[number]
+                if not closed.contains(inside):
+                    continue
+                dead_ends = sum(
+                    1 for part in polygon_parts(closed.difference(block))
+                    if part.area() >= MIN_DEAD_END_AREA)
+                if dead_ends:
+                    filled[concave[member]] = (closed, dead_ends)
+                break
+    return filled
+
+
+def fill_dead_ends(geometries, dead_end_width):
+    """Fill in the dead-end streets narrower than dead_end_width of every
+    block, see filled_blocks. Returns a list of QgsGeometry and the number
+    of dead-ends filled in."""
+    filled = filled_blocks(geometries, dead_end_width)
+    return ([block for block, _ in filled],
+            sum(dead_ends for _, dead_ends in filled))
+
+
+def blocks_layer_of(geometries, crs):
+    """Returns a new memory layer holding the block polygons, in crs."""
+    layer = QgsVectorLayer('MultiPolygon?crs=' + crs, 'IC_blocks', 'memory')
+    features = []
+    for geometry in geometries:
+        feature = QgsFeature()
+        geometry.convertToMultiType()
+        feature.setGeometry(geometry)
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    layer.updateExtents()
+    return layer
+
+
+def features_within(blocks_layer, places_layer, walking_distance):
+    """Yield the features of the blocks layer within the walking distance
+    of a feature of the places layer (the starting points, or the area they
+    lie in). The exact distance between the geometries is measured, rather
+    than building a polygon of the circle around every place."""
+    places = {feature.id(): feature.geometry()
+              for feature in places_layer.getFeatures()
+              if not feature.geometry().isNull()}
+    if not places:
+        return
+    index = QgsSpatialIndex()
+    extent = QgsRectangle()
+    extent.setMinimal()
+    for fid, geometry in places.items():
+        index.insertFeature(fid, geometry.boundingBox())
+        extent.combineExtentWith(geometry.boundingBox())
+    extent.grow(walking_distance)
+
+    request = QgsFeatureRequest().setFilterRect(extent)
+    for feature in blocks_layer.getFeatures(request):
+        geometry = feature.geometry()
+        near = geometry.boundingBox()
+        near.grow(walking_distance)
+        for fid in index.intersects(near):
+            if geometry.distance(places[fid]) <= walking_distance:
+                yield feature
+                break
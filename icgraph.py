@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from heapq import heappush, heappop
+
+from .icintervals import snap_key
+from .icvisibility import look
+
+# vertices with less walking distance left than this are not looked from
+REMAINING_TOLERANCE = 0.001
+
+# the node number of a starting point which is not a node of the graph
+SOURCE = -1
+
+
+class VisibilityGraph:
+    """Visibility graph over the block corners around the starting point.
+
+    The nodes are the block corners (see BoundaryLine), as (x, y) pairs,
+    keyed by their place on the snapping grid of the edge index. Two
+    nodes are connected when one can be seen from the other. The
+    edges of a node are only worked out when the shortest path search
+    settles it, by looking from it with the walking distance it has left,
+    and the nodes are added as they are seen.
+
+    A graph can be searched again from other starting points over the same
+    blocks. With a radius, every look goes at least that far (the longest
+    walking distance of the searches), so that the view from a node is
+    worked out once and cut down to the walking distance left by every
+    later search. A starting point is not added to the graph: unless it
+    lies on a node, it is the SOURCE node of the search from it only.
+    """
+
+    def __init__(self, edge_index, radius=None):
+        self.edge_index = edge_index
+        self.radius = radius
+        self.nodes = []
+        # node -> the View from it
+        self.views = {}
+        # node -> the node it was reached from by the last search
+        self.previous = {}
+        self._keys = {}
+        self._source = None
+
+    def _key(self, x, y):
+        return snap_key(x, y, self.edge_index.grid)
+
+    def add_node(self, x, y):
+        """Add a point as a node, unless there already is a node at the same
+        place. Returns the node number."""
+        key = self._key(x, y)
+        node = self._keys.get(key)
+        if node is None:
+            node = len(self.nodes)
+            self._keys[key] = node
+            self.nodes.append((x, y))
+        return node
+
+    def node_at(self, x, y):
+        """Returns the node at the place of the point, or None."""
+        return self._keys.get(self._key(x, y))
+
+    def source(self, x, y):
+        """Returns the node to search from a starting point: the node at its
+        place, or else SOURCE, which stands for the point until the next
+        starting point and is not added to the graph."""
+        node = self.node_at(x, y)
+        if node is not None:
+            return node
+        self.views.pop(SOURCE, None)
+        self._source = (x, y)
+        return SOURCE
+
+    def point(self, node):
+        """Returns the (x, y) of a node."""
+        if node == SOURCE:
+            return self._source
+        return self.nodes[node]
+
+    def _look(self, node, radius):
+        """Returns the View from the node as far as radius or further,
+        looking again unless the last look from it went as far."""
+        view = self.views.get(node)
+        if view is None or view.radius < radius:
+            x, y = self.point(node)
+            view = look(self.edge_index, x, y, max(radius, self.radius or 0))
+            self.views[node] = view
+        return view
+
+    def view(self, node, radius):
+        """Returns the View from the node as far as radius."""
+        return self._look(node, radius).cut(radius)
+
+    def forget(self, node):
+        """Forget the view from a node which is not looked from again, such
+        as a starting point."""
+        self.views.pop(node, None)
+
+    def neighbours(self, node, radius):
+        """Returns the visible corners within radius of the node, together
+        with their distance from it. The other vertices are left out of the
+        graph, as no shortest path bends at them."""
+        view = self._look(node, radius)
+        return [(self.add_node(x, y), view.vertices[(x, y)][0])
+                for x, y in view.corners
+                if view.vertices[(x, y)][0] <= radius]
+
+    def shortest_paths(self, source, cutoff, is_canceled=None):
+        """Dijkstra search from the source node, cut off at the given
+        distance. Returns a dictionary of the reached nodes and their walking
+        distance from the source, or None if the search was canceled."""
+        distances = {source: 0.0}
+        self.previous = {source: None}
+        settled = {}
+        heap = [(0.0, source)]
+        while heap:
+            if is_canceled is not None and is_canceled():
+                return None
+            distance, node = heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = distance
+            remaining = cutoff - distance
+            if remaining <= REMAINING_TOLERANCE:
+                continue
+            for neighbour, length in self.neighbours(node, remaining):
+                new_distance = distance + length
+                if new_distance < distances.get(neighbour, cutoff + 1):
+                    distances[neighbour] = new_distance
+                    self.previous[neighbour] = node
+                    heappush(heap, (new_distance, neighbour))
+        return settled
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+from array import array
+from math import hypot
+
+from .icintervals import snap_key
+from .icmapped import MappedFile
+from .icvisibility import circle_chord, look
+
+# the file starts with the magic bytes and the version of the format
+MAGIC = b'ICVG'
+VERSION = 3
+
+# magic, version, radius, snapping grid, number of lines, nodes, edges and
+# portions
+_HEADER = struct.Struct('<4sIddqqqq')
+
+# the sections of the file after the header, in the order they are written,
+# with their array type: the 8 byte ones first so that every section is
+# aligned for memoryview.cast
+_SECTIONS = (
+    ('points', 'd'),
+    ('edge_offsets', 'q'),
+    ('edge_lengths', 'd'),
+    ('portion_offsets', 'q'),
+    ('portion_starts', 'd'),
+    ('portion_ends', 'd'),
+    ('portion_nears', 'd'),
+    ('portion_fars', 'd'),
+    ('edge_targets', 'i'),
+    ('portion_lines', 'i'),
+)
+
+
+def _segment_distances(x, y, ax, ay, bx, by):
+    """Returns the distance from the point to the nearest and to the
+    farthest point of the segment."""
+    dx = bx - ax
+    dy = by - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0
+    if length2 > 0:
+        t = min(max(((x - ax) * dx + (y - ay) * dy) / length2, 0.0), 1.0)
+    near = hypot(ax + t * dx - x, ay + t * dy - y)
+    far = max(hypot(ax - x, ay - y), hypot(bx - x, by - y))
+    return near, far
+
+
+def build_graph_store(edge_index, radius, path, is_canceled=None,
+                      progress=None):
+    """Work out the visibility graph of the block corners (see BoundaryLine)
+    of the edge index as far as radius, and write it into a graph store file
+    at path. For every corner the file holds the corners seen from it with
+    their distance and the visible portions of the boundary lines, so that any
+    walking distance up to radius can be searched without looking again.
+    Both are sorted by distance, so that a search with less walking
+    distance left only reads the near ones. progress is called with the
+    percentage of the corners done. Returns False if canceled."""
+    lines = edge_index.lines
+    grid = edge_index.grid
+    line_numbers = {line.key: line_no for line_no, line in enumerate(lines)}
+
+    keys = {}
+    points = array('d')
+    for line in lines:
+        for (x, y), corner in zip(line.points, line.corners):
+            key = snap_key(x, y, grid)
+            if corner and key not in keys:
+                keys[key] = len(keys)
+                points.extend((x, y))
+    node_count = len(keys)
+
+    sections = {name: array(kind) for name, kind in _SECTIONS}
+    sections['points'] = points
+    sections['edge_offsets'].append(0)
+    sections['portion_offsets'].append(0)
+    for node in range(node_count):
+        if is_canceled is not None and is_canceled():
+            return False
+        px, py = points[2 * node], points[2 * node + 1]
+        view = look(edge_index, px, py, radius)
+        edges = []
+        for x, y in view.corners:
+            length = view.vertices[(x, y)][0]
+            target = keys.get(snap_key(x, y, grid))
+            if target is not None and target != node:
+                edges.append((length, target))
+        for length, target in sorted(edges):
+            sections['edge_targets'].append(target)
+            sections['edge_lengths'].append(length)
+        portions = []
+        for line, start, end in view.portions:
+            (ax, ay), (bx, by) = line.interpolate(start), line.interpolate(end)
+            near, far = _segment_distances(px, py, ax, ay, bx, by)
+            portions.append((near, far, line_numbers[line.key], start, end))
+        for near, far, line_no, start, end in sorted(portions):
+            sections['portion_lines'].append(line_no)
+            sections['portion_starts'].append(start)
+            sections['portion_ends'].append(end)
+            sections['portion_nears'].append(near)
+            sections['portion_fars'].append(far)
+        sections['edge_offsets'].append(len(sections['edge_targets']))
+        sections['portion_offsets'].append(len(sections['portion_lines']))
+        if progress is not None and node % 100 == 0:
+            progress(100.0 * node / node_count)
+
+    # written next to the final file first, so that a canceled or failed
+    # write never leaves a broken store behind
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, radius, grid, len(lines),
+                             node_count, len(sections['edge_targets']),
+                             len(sections['portion_lines'])))
+        for name, _ in _SECTIONS:
+            sections[name].tofile(f)
+    os.replace(temporary, path)
+    return True
+
+
+class GraphStore:
+    """A visibility graph written by build_graph_store, memory-mapped from
+    its file, over the same boundary lines (snapped to the same grid) it
+    was built from. Nothing is
+    read into memory but the places of the vertices; the edges and the
+    visible portions of a vertex are read from the mapped file when the
+    search gets to it.
+    """
+
+    def __init__(self, path, lines, grid):
+        self.path = path
+        self.lines = lines
+        self._file = MappedFile(path, _HEADER)
+        (magic, version, self.radius, self.grid, line_count,
+         self.node_count, edge_count, portion_count) = self._file.header
+        if magic != MAGIC or version != VERSION \
+                or line_count != len(lines) or self.grid != grid:
+            self._file.close()
+            raise ValueError('Not a graph store of these lines: %s' % path)
+
+        sizes = {
+            'points': 2 * self.node_count,
+            'edge_offsets': self.node_count + 1,
+            'edge_lengths': edge_count,
+            'portion_offsets': self.node_count + 1,
+            'portion_starts': portion_count,
+            'portion_ends': portion_count,
+            'portion_nears': portion_count,
+            'portion_fars': portion_count,
+            'edge_targets': edge_count,
+            'portion_lines': portion_count,
+        }
+        for name, section in self._file.sections(_SECTIONS, sizes).items():
+            setattr(self, '_' + name, section)
+
+        points = self._points
+        self._keys = {
+            snap_key(points[2 * node], points[2 * node + 1], grid): node
+            for node in range(self.node_count)}
+
+    def point(self, node):
+        return self._points[2 * node], self._points[2 * node + 1]
+
+    def node_at(self, x, y):
+        """Returns the node at the place of the point, or None."""
+        return self._keys.get(snap_key(x, y, self.grid))
+
+    def neighbours(self, node, radius):
+        """Returns the visible nodes within radius of the node, together with
+        their distance from it."""
+        lengths = self._edge_lengths
+        targets = self._edge_targets
+        neighbours = []
+        for k in range(self._edge_offsets[node],
+                       self._edge_offsets[node + 1]):
+            if lengths[k] > radius:
+                break
+            neighbours.append((targets[k], lengths[k]))
+        return neighbours
+
+    def portions(self, node, radius):
+        """Returns the portions of the boundary lines visible from the node
+        as far as radius, as (line, start, end)."""
+        x, y = self.point(node)
+        lines = self.lines
+        starts = self._portion_starts
+        ends = self._portion_ends
+        fars = self._portion_fars
+        portions = []
+        for k in range(self._portion_offsets[node],
+                       self._portion_offsets[node + 1]):
+            if self._portion_nears[k] >= radius:
+                break
+            line = lines[self._portion_lines[k]]
+            start = starts[k]
+            end = ends[k]
+            if fars[k] <= radius:
+                portions.append((line, start, end))
+                continue
+            # the portion lies on a single edge, cut it like a segment
+            (ax, ay), (bx, by) = line.interpolate(start), line.interpolate(end)
+            chord = circle_chord(x, y, radius, ax, ay, bx, by)
+            if chord is None or chord[1] <= chord[0]:
+                continue
+            portions.append((line, start + chord[0] * (end - start),
+                             start + chord[1] * (end - start)))
+        return portions
+
+    def view(self, node, radius):
+        """Returns the view from the node as far as radius."""
+        return StoredView(self, node, radius)
+
+    def close(self):
+        self._file.close()
+
+
+class StoredView:
+    """What can be seen from a node of a GraphStore, as far as a radius, as
+    the visible portions of the boundary lines. Like a View it can be cut
+    down to a smaller radius."""
+
+    __slots__ = ('store', 'node', 'radius', 'portions')
+
+    def __init__(self, store, node, radius):
+        self.store = store
+        self.node = node
+        self.radius = radius
+        self.portions = store.portions(node, radius)
+
+    def within(self, radius):
+        if radius >= self.radius:
+            return self.portions
+        return self.store.portions(self.node, radius)
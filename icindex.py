@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from math import sqrt
+
+from .icintervals import SNAP_GRID
+
+
+class EdgeIndex:
+    """Uniform grid over the edges (segments) of the boundary lines.
+
+    A point with some walking distance left can only see or reach the edges
+    whose bounding box touches the square envelope of its walking distance,
+    so only the edges registered in the grid cells under that envelope are
+    handed out. The index counts how many edges were handed out for testing
+    and how many were pruned without ever being looked at.
+
+    The index also knows the grid the lines are snapped to, which the
+    points looked from are snapped to and the vertices are compared on.
+    """
+
+    def __init__(self, lines, cell_size=None, grid=SNAP_GRID):
+        self.lines = lines
+        self.grid = grid
+        edges = []
+        for line_no, line in enumerate(lines):
+            for i in range(len(line.points) - 1):
+                (ax, ay), (bx, by) = line.points[i], line.points[i + 1]
+                edges.append((line_no, i, min(ax, bx), min(ay, by),
+                              max(ax, bx), max(ay, by)))
+        self.edge_count = len(edges)
+
+        if cell_size is None:
+            # aim at a few edges per cell
+            if edges:
+                width = max(e[4] for e in edges) - min(e[2] for e in edges)
+                height = max(e[5] for e in edges) - min(e[3] for e in edges)
+                cell_size = sqrt(max(width * height, 1.0) / len(edges)) * 2
+            else:
+                cell_size = 1.0
+        self.cell_size = max(cell_size, 0.1)
+
+        self._cells = {}
+        self._last_column = max((self._cell(e[4]) for e in edges), default=0)
+        for line_no, i, xmin, ymin, xmax, ymax in edges:
+            for cx in range(self._cell(xmin), self._cell(xmax) + 1):
+                for cy in range(self._cell(ymin), self._cell(ymax) + 1):
+                    self._cells.setdefault((cx, cy), []).append((line_no, i))
+        self.tested = 0
+        self.pruned = 0
+
+    def _cell(self, coordinate):
+        return int(coordinate // self.cell_size)
+
+    def edges_near(self, x, y, distance):
+        """Returns the (line number, edge number) pairs of the edges which
+        may lie within the given distance of the point."""
+        x0, x1 = self._cell(x - distance), self._cell(x + distance)
+        y0, y1 = self._cell(y - distance), self._cell(y + distance)
+        found = set()
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            # the envelope covers more cells than there are occupied ones
+            for (cx, cy), edges in self._cells.items():
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    found.update(edges)
+        else:
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    found.update(self._cells.get((cx, cy), ()))
+        self.tested += len(found)
+        self.pruned += self.edge_count - len(found)
+        return found
+
+    def lines_near(self, x, y, distance):
+        """Returns the numbers of the lines with an edge which may lie within
+        the given distance of the point. Unlike edges_near, the edges are
+        not counted as looked at."""
+        x0, x1 = self._cell(x - distance), self._cell(x + distance)
+        y0, y1 = self._cell(y - distance), self._cell(y + distance)
+        found = set()
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                found.update(line_no for line_no, _
+                             in self._cells.get((cx, cy), ()))
+        return found
+
+    def inside(self, x, y):
+        """Check if the point lies inside a block, by the winding number of
+        the boundary lines around it. The blocks lie on the left of their
+        lines, so the exterior rings wind around the points of a block once
+        and the rings of its holes take that back. Only the edges in the row
+        of cells to the right of the point can cross the ray cast from it to
+        the right."""
+        row = self._cell(y)
+        seen = set()
+        winding = 0
+        for column in range(self._cell(x), self._last_column + 1):
+            for edge in self._cells.get((column, row), ()):
+                if edge in seen:
+                    continue
+                seen.add(edge)
+                line_no, i = edge
+                points = self.lines[line_no].points
+                (ax, ay), (bx, by) = points[i], points[i + 1]
+                if (ay <= y) == (by <= y):
+                    continue
+                left = (bx - ax) * (y - ay) - (x - ax) * (by - ay)
+                if ay <= y and left > 0:
+                    winding += 1
+                elif by <= y and left < 0:
+                    winding -= 1
+        return winding != 0
+
+    def summary(self):
+        return '%s edges looked at, %s pruned by the index' % (
+            self.tested, self.pruned)
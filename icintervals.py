@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_right
+from math import hypot
+
+# the block coordinates are snapped to a grid of this spacing (in the units
+# of the CRS) once the blocks are prepared, so that the same vertex always
+# has the very same coordinates and vertices can be compared by their place
+# on the grid
+SNAP_GRID = 0.005
+
+
+def merge_intervals(intervals, tolerance=1e-9):
+    """Merge overlapping or touching (start, end) intervals. Returns a sorted
+    list of disjoint intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + tolerance:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(intervals, removed, tolerance=1e-9):
+    """Returns the parts of the merged intervals outside the merged removed
+    intervals, dropping the parts shorter than the tolerance."""
+    result = []
+    for start, end in intervals:
+        for cut_start, cut_end in removed:
+            if cut_end <= start or cut_start >= end:
+                continue
+            if cut_start - start > tolerance:
+                result.append((start, cut_start))
+            start = max(start, cut_end)
+            if start >= end:
+                break
+        if end - start > tolerance:
+            result.append((start, end))
+    return result
+
+
+class BoundaryLine:
+    """A ring of a block boundary, linearly referenced by the distance along
+    it from its first vertex.
+
+    corners tells for every vertex whether the block has a convex corner
+    there, turning left with the block on the left. Only those corners can
+    bend a shortest walking path around the block; the concave corners and
+    the vertices along a straight side cannot, and neither can the open
+    space side of a corner of a hole, where the ring turns right.
+    """
+
+    __slots__ = ('key', 'boundary_id', 'points', 'measures', 'corners')
+
+    def __init__(self, key, boundary_id, points, corners=None):
+        self.key = key
+        self.boundary_id = boundary_id
+        self.points = points
+        self.measures = [0.0]
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            self.measures.append(self.measures[-1] + hypot(x2 - x1, y2 - y1))
+        # the corners can be given as worked out before, e.g. when the line
+        # is read from a block store
+        self.corners = _corners(points) if corners is None else corners
+
+    @property
+    def length(self):
+        return self.measures[-1]
+
+    def vertex_number(self, i):
+        """Returns the number of vertex i, with the closing vertex of a ring
+        numbered as its first one."""
+        if i == len(self.points) - 1 and self.points[0] == self.points[-1]:
+            return 0
+        return i
+
+    def interpolate(self, measure):
+        """Returns the point at the given distance along the line."""
+        i = min(max(bisect_right(self.measures, measure) - 1, 0),
+                len(self.points) - 2)
+        (x1, y1), (x2, y2) = self.points[i], self.points[i + 1]
+        length = self.measures[i + 1] - self.measures[i]
+        t = (measure - self.measures[i]) / length if length else 0.0
+        t = min(max(t, 0.0), 1.0)
+        return (x1 + t * (x2 - x1), y1 + t * (y2 - y1))
+
+    def substring(self, start, end):
+        """Returns the vertices of the part of the line between two
+        distances along it."""
+        points = [self.interpolate(start)]
+        for measure, point in zip(self.measures, self.points):
+            if start < measure < end:
+                points.append(point)
+        points.append(self.interpolate(end))
+        return points
+
+
+def _corners(points):
+    """Returns for every point of a line whether the line turns left at it.
+    The ends of a line which is not a ring are always corners."""
+    count = len(points)
+    closed = count > 3 and points[0] == points[-1]
+    corners = []
+    for i, (x, y) in enumerate(points):
+        if closed:
+            before = points[i - 1] if i > 0 else points[-2]
+            after = points[i + 1] if i < count - 1 else points[1]
+        elif 0 < i < count - 1:
+            before, after = points[i - 1], points[i + 1]
+        else:
+            corners.append(True)
+            continue
+        cross = ((x - before[0]) * (after[1] - y)
+                 - (y - before[1]) * (after[0] - x))
+        corners.append(cross > 0)
+    return corners
+
+
+def snap_key(x, y, grid=SNAP_GRID):
+    """Returns the place of the nearest point of the grid, as a pair of
+    integers."""
+    return (round(x / grid), round(y / grid))
+
+
+def snap_ring(points, grid=SNAP_GRID):
+    """Returns the points of a ring snapped to the grid, leaving out the
+    points which snap onto the one before them, or None if fewer than three
+    distinct points are left."""
+    keys = []
+    for x, y in points:
+        key = snap_key(x, y, grid)
+        if not keys or key != keys[-1]:
+            keys.append(key)
+    if keys and keys[0] != keys[-1]:
+        keys.append(keys[0])
+    if len(keys) < 4:
+        return None
+    return [(kx * grid, ky * grid) for kx, ky in keys]
+
+
+def block_lines(block_id, rings, first_key=0, grid=SNAP_GRID):
+    """Returns the BoundaryLines of the rings of a block, the exterior ring
+    first. The rings are snapped to the grid (unless it is None), and the
+    ones which collapse on it are left out. The rings are turned so that the
+    block lies on their left, which is counter-clockwise for the exterior
+    ring and clockwise for the holes. The lines are keyed (block_id,
+    first_key), (block_id, first_key + 1),..."""
+    lines = []
+    for n, points in enumerate(rings):
+        if grid is not None:
+            points = snap_ring(points, grid)
+            if points is None:
+                continue
+        area = sum(x1 * y2 - x2 * y1
+                   for (x1, y1), (x2, y2) in zip(points, points[1:]))
+        if (area < 0) == (n == 0):
+            points = points[::-1]
+        lines.append(BoundaryLine((block_id, first_key + n), block_id,
+                                  points))
+    return lines
+
+
+class ReachableIntervals:
+    """The reachable portions of the boundary lines, kept as intervals of
+    the distance along each line. Intervals are collected as they are found
+    and merged only when they are read."""
+
+    def __init__(self):
+        self._intervals = {}
+        # the number of intervals merged into others
+        self.unions = 0
+
+    def add(self, key, portions):
+        if portions:
+            self._intervals.setdefault(key, []).extend(portions)
+
+    def add_view(self, view, walked=0.0):
+        """Add the portions seen in a view from a point walked to from the
+        starting point."""
+        for line, start, end in view.portions:
+            self.add(line.key, [(start, end)])
+
+    def merged(self, key):
+        """Returns the merged reachable intervals of a line."""
+        intervals = self._intervals.get(key)
+        if not intervals:
+            return []
+        merged = merge_intervals(intervals)
+        self.unions += len(intervals) - len(merged)
+        self._intervals[key] = merged
+        return merged
+
+    def length(self, key):
+        return sum(end - start for start, end in self.merged(key))
+
+    def unreached(self, line, walked=0.0):
+        """Returns the intervals of the line which are not reachable."""
+        return subtract_intervals([(0.0, line.length)],
+                                  self.merged(line.key), 1e-6)
+
+    def keys(self):
+        return self._intervals.keys()
+
+
+class DistanceSweep:
+    """The reachable intervals of several walking distances at once, from a
+    single expansion to the longest of them. A point walked to from the
+    starting point sees, for every walking distance, what is visible from
+    it as far as the walking distance it has left, so every view is cut down
+    to each of the walking distances in turn."""
+
+    def __init__(self, walking_distances):
+        self.walking_distances = sorted(set(walking_distances))
+        self.intervals = [ReachableIntervals()
+                          for _ in self.walking_distances]
+
+    @property
+    def unions(self):
+        return sum(intervals.unions for intervals in self.intervals)
+
+    def add_view(self, view, walked=0.0):
+        for distance, intervals in zip(self.walking_distances,
+                                       self.intervals):
+            radius = distance - walked
+            if radius <= 0:
+                continue
+            for line, start, end in view.within(radius):
+                intervals.add(line.key, [(start, end)])
+
+    def unreached(self, line, walked=0.0):
+        """Returns the intervals of the line which are not reachable within
+        some walking distance longer than walked, which a point walked to
+        that far could still add to."""
+        for distance, intervals in zip(self.walking_distances,
+                                       self.intervals):
+            if distance > walked:
+                return intervals.unreached(line)
+        return []
+
+    def bands(self, key):
+        """Returns the reachable intervals of a line by distance band, as
+        (start, end, walking distance) with the shortest walking distance
+        within which each interval is reachable."""
+        bands = []
+        previous = []
+        for distance, intervals in zip(self.walking_distances,
+                                       self.intervals):
+            merged = intervals.merged(key)
+            for start, end in subtract_intervals(merged, previous):
+                bands.append((start, end, distance))
+            previous = merged
+        return bands
+
+    def keys(self):
+        keys = set()
+        for intervals in self.intervals:
+            keys.update(intervals.keys())
+        return keys
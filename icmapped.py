@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import mmap
+import struct
+from array import array
+
+
+class MappedFile:
+    """A file written as a header followed by sections of arrays, one after
+    the other, memory-mapped for reading. The sections are read in place as
+    memoryviews of their array type, so the sections of 8 byte values come
+    first to keep every section aligned for memoryview.cast.
+
+    The header is a struct.Struct, unpacked into header. The stores built on
+    it (GraphStore, BlockStore) check the header before they take their
+    sections, and close the file if it is not theirs.
+    """
+
+    def __init__(self, path, header):
+        self.path = path
+        self._header_size = header.size
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = memoryview(self._map)
+        self._sections = []
+        try:
+            self.header = header.unpack_from(self._data)
+        except struct.error:
+            self.close()
+            raise ValueError('Not a store file: %s' % path)
+
+    def sections(self, sections, sizes):
+        """Returns the sections, given in their order as (name, array type),
+        with their number of values by name, as a dictionary of name ->
+        memoryview."""
+        offset = self._header_size
+        found = {}
+        for name, kind in sections:
+            size = sizes[name] * array(kind).itemsize
+            if offset + size > len(self._data):
+                self.close()
+                raise ValueError('Truncated store file: %s' % self.path)
+            section = self._data[offset:offset + size].cast(kind)
+            self._sections.append(section)
+            found[name] = section
+            offset += size
+        return found
+
+    def close(self):
+        for section in self._sections:
+            section.release()
+        self._sections = []
+        self._data.release()
+        self._map.close()
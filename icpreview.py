@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QColor
+
+from qgis.core import *
+from qgis.gui import *
+
+import time
+
+from .iccompute import prepare_preview
+
+MESSAGE_CATEGORY = 'InterfaceCatchment'
+
+# the cursor has to rest this long (in milliseconds) before the IC under it
+# is worked out, so that a quick drag only works out where it stops
+PREVIEW_DELAY = 40
+
+# the time (in seconds) the IC of a point should be shown within, longer
+# searches are logged
+PREVIEW_TARGET = 0.2
+
+
+class ICPreviewTask(QgsTask):
+    """Works out the IC of a single point for the preview map tool, first
+    preparing the blocks around the map extent when the tool has nothing
+    prepared for it yet. The tool runs one of these at a time, as they
+    share its ICPreview."""
+
+    def __init__(self, preview, options, point):
+        flags = QgsTask.CanCancel | getattr(QgsTask, 'Hidden', 0)
+        super().__init__('InterfaceCatchment preview', flags)
+        self.preview = preview
+        self.options = options
+        self.point = point
+        self.ic = None
+        self.seconds = None
+        self.exception = None
+        # set when the cursor has moved on; only the search is given up
+        # then, the blocks being prepared are kept for the next point
+        self.stale = False
+
+    def is_stale(self):
+        return self.stale or self.isCanceled()
+
+    def run(self):
+        try:
+            if self.preview is None:
+                blocks_layer, extent, distances, crs, dead_end_width = \
+                    self.options
+                self.preview = prepare_preview(
+                    blocks_layer, extent, distances, crs, dead_end_width,
+                    is_canceled=self.isCanceled)
+                if self.preview is None:
+                    return False
+            starttime = time.time()
+            self.ic = self.preview.ic(*self.point,
+                                      is_canceled=self.is_stale)
+            self.seconds = time.time() - starttime
+            return self.ic is not None
+        except Exception as e:
+            self.exception = e
+            return False
+
+
+class ICPreviewTool(QgsMapTool):
+    """Map tool showing the IC of the point under the cursor as it moves,
+    with what is reachable from it drawn as a rubber band. The blocks
+    around the map extent and the visibility graph over them are kept
+    warm between the points, and prepared again when the blocks, the
+    options or the extent change. A search still running when the cursor
+    moves on is canceled. A click takes the point as the starting point
+    and Esc leaves the tool."""
+
+    def __init__(self, parent):
+        super().__init__(parent.canvas)
+        self.parent = parent
+        self.canvas = parent.canvas
+        self.previous_tool = None
+        self.band = None
+        self.preview = None
+        self.preview_options = None
+        self.task = None
+        self.pending = None
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.start_task)
+
+    def log(self, message, level=Qgis.Info):
+        QgsMessageLog.logMessage(message, MESSAGE_CATEGORY, level=level)
+
+    def options(self):
+        """Returns the blocks layer, the map extent, the walking distances,
+        the CRS and the dead-end width the preview is worked out with."""
+        dlg = self.parent.dlg
+        extent = self.canvas.extent()
+        dead_end_width = None
+        if dlg.checkBox.checkState():
+            dead_end_width = dlg.mQgsDoubleSpinBox_2.value()
+        return (dlg.mMapLayerComboBox.currentLayer(),
+                (extent.xMinimum(), extent.yMinimum(),
+                 extent.xMaximum(), extent.yMaximum()),
+                self.parent.walking_distances(),
+                self.canvas.mapSettings().destinationCrs().authid(),
+                dead_end_width)
+
+    def activate(self):
+        super().activate()
+        self.band = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        self.band.setColor(QColor('red'))
+        self.band.setWidth(2)
+
+    def deactivate(self):
+        self.timer.stop()
+        self.pending = None
+        if self.task is not None:
+            self.task.cancel()
+        if self.band is not None:
+            self.canvas.scene().removeItem(self.band)
+            self.band = None
+        self.parent.iface.statusBarIface().clearMessage()
+        super().deactivate()
+
+    def leave(self):
+        """Go back to the map tool used before and to the dialog."""
+        self.canvas.setMapTool(self.previous_tool)
+        self.parent.dlg.show()
+
+    def canvasMoveEvent(self, event):
+        point = self.toMapCoordinates(event.pos())
+        self.pending = (point.x(), point.y())
+        # the point the running search was started for is stale now
+        if self.task is not None:
+            self.task.stale = True
+        self.timer.start(PREVIEW_DELAY)
+
+    def canvasReleaseEvent(self, event):
+        point = self.toMapCoordinates(event.pos())
+        self.parent.dlg.lineEdit.setText(str(point.x()))
+        self.parent.dlg.lineEdit_2.setText(str(point.y()))
+        self.parent.dlg.mMapLayerComboBox_2.setCurrentIndex(-1)
+        self.leave()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.leave()
+
+    def start_task(self):
+        """Work out the IC of the last point the cursor rested on, unless a
+        search is still running, which starts it when it is done."""
+        if self.task is not None or self.pending is None:
+            return
+        options = self.options()
+        if options[0] is None or not options[2]:
+            return
+        # the prepared blocks are kept while the same blocks and options
+        # are used over the same extent
+        same = (self.preview_options is not None
+                and self.preview_options[0] is options[0]
+                and self.preview_options[2:] == options[2:])
+        if (not same or self.preview is None
+                or not self.preview.covers(options[1])):
+            self.preview = None
+            self.preview_options = options
+        task = self.task = ICPreviewTask(self.preview, options, self.pending)
+        self.pending = None
+        task.taskCompleted.connect(lambda: self.task_done(task, True))
+        task.taskTerminated.connect(lambda: self.task_done(task, False))
+        QgsApplication.taskManager().addTask(task)
+
+    def task_done(self, task, result):
+        if task is not self.task:
+            return
+        self.task = None
+        if task.options is self.preview_options:
+            self.preview = task.preview
+        if task.exception is not None:
+            self.log('Preview exception: %s' % task.exception, Qgis.Critical)
+        elif result and self.band is not None:
+            ICs, geometry = task.ic
+            self.band.setToGeometry(geometry, None)
+            self.parent.iface.statusBarIface().showMessage(
+                'IC %s (%.0f ms)' % (', '.join(
+                    '%g m: %s' % (distance, IC) for distance, IC in zip(
+                        self.preview.walking_distances, ICs)),
+                    1000 * task.seconds))
+            if task.seconds > PREVIEW_TARGET:
+                self.log('Preview took %.3f s' % task.seconds)
+        elif not result and self.band is not None and not task.is_stale():
+            # the point is inside a block or outside the prepared area
+            self.band.reset(QgsWkbTypes.LineGeometry)
+        if self.pending is not None:
+            self.start_task()
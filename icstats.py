@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+from contextlib import contextmanager
+
+
+class RunStats:
+    """Timers and counters of a single IC run.
+
+    Stages are timed with ``with stats.stage('name'):`` and a stage run
+    more than once adds up its time. Counters are added to with count(), and
+    series of values (the frontier size at every number of sight lines,
+    the size of every round) are appended to with record(). Everything is
+    kept in the order it first happened.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.series = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (self.stages.get(name, 0.0)
+                                 + time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, name, value):
+        self.series.setdefault(name, []).append(value)
+
+    def as_dict(self):
+        return {
+            'stages': dict(self.stages),
+            'counters': dict(self.counters),
+            'series': {name: list(values)
+                       for name, values in self.series.items()},
+        }
+
+    def lines(self):
+        """Returns the stats as lines of text for the log."""
+        lines = ['%s: %.3f s' % (name, seconds)
+                 for name, seconds in self.stages.items()]
+        lines += ['%s: %s' % (name, value)
+                  for name, value in self.counters.items()]
+        lines += ['%s: %s' % (name, ', '.join(
+                      '%.3f' % v if isinstance(v, float) else str(v)
+                      for v in values))
+                  for name, values in self.series.items()]
+        return lines
+
+    def write_json(self, path, **extra):
+        """Write the stats, together with any extra items, into a JSON
+        file."""
+        data = dict(extra)
+        data.update(self.as_dict())
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from .icintervals import SNAP_GRID
+
+
+class Vertex:
+    """A vertex reached by the catchment, with the walking distance it has
+    left."""
+
+    __slots__ = ('fid', 'x', 'y', 'distance', 'iteration', 'prev_id',
+                 'boundary_id')
+
+    def __init__(self, fid, x, y, distance, iteration, prev_id, boundary_id):
+        self.fid = fid
+        self.x = x
+        self.y = y
+        self.distance = distance
+        self.iteration = iteration
+        self.prev_id = prev_id
+        self.boundary_id = boundary_id
+
+
+class VertexStore:
+    """In-memory store of the vertices reached by the catchment.
+
+    The block vertices are snapped to a grid, so a vertex is keyed by its
+    place on the grid and its duplicate is the vertex under the same key.
+    The iteration of a vertex is the number of sight lines on the path it
+    was reached by.
+    """
+
+    def __init__(self, grid=SNAP_GRID):
+        self.grid = grid
+        self.vertices = {}
+        self._keys = {}
+        self._next_fid = 1
+        # the most sight lines on the path to an added vertex
+        self.iterations = 0
+        self.added = 0
+        self.replaced = 0
+        # the walking distance within which the catchment is complete, set
+        # by the engine which reached the vertices
+        self.complete_within = None
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def _key(self, x, y):
+        return (round(x / self.grid), round(y / self.grid))
+
+    def at(self, x, y):
+        """Returns the stored vertex on the same grid point as x, y, or
+        None."""
+        return self._keys.get(self._key(x, y))
+
+    def offer(self, x, y, distance, iteration, prev_id=None,
+              boundary_id=None):
+        """Offer a reached vertex to the store. Any duplicate with less
+        walking distance left is removed, and the vertex is only added when
+        no duplicate with at least as much distance left remains. Returns the
+        added vertex or None."""
+        other = self.at(x, y)
+        if other is not None:
+            if distance <= other.distance:
+                return None
+            self.remove(other)
+            self.replaced += 1
+
+        vertex = Vertex(self._next_fid, x, y, distance, iteration, prev_id,
+                        boundary_id)
+        self._next_fid += 1
+        self.vertices[vertex.fid] = vertex
+        self._keys[self._key(x, y)] = vertex
+        self.iterations = max(self.iterations, iteration)
+        self.added += 1
+        return vertex
+
+    def remove(self, vertex):
+        del self.vertices[vertex.fid]
+        del self._keys[self._key(vertex.x, vertex.y)]
+
+    def to_layer(self, crs, name='IC_vertices'):
+        """Write the stored vertices into a new memory layer."""
+        from PyQt5.QtCore import QVariant
+        from qgis.core import (QgsFeature, QgsField, QgsGeometry, QgsPointXY,
+                               QgsVectorLayer)
+
+        layer = QgsVectorLayer('Point?crs=' + crs, name, 'memory')
+        provider = layer.dataProvider()
+        provider.addAttributes(
+            [
+                QgsField('iteration', QVariant.Int),
+                QgsField('prev_id', QVariant.Int),
+                QgsField('distance', QVariant.Double),
+                QgsField('boundary_id', QVariant.Int),
+            ]
+        )
+        layer.updateFields()
+        fields = layer.fields()
+
+        features = []
+        for vertex in self.vertices.values():
+            feature = QgsFeature(fields, vertex.fid)
+            feature.setGeometry(
+                QgsGeometry.fromPointXY(QgsPointXY(vertex.x, vertex.y)))
+            feature.setAttributes([vertex.iteration, vertex.prev_id,
+                                   vertex.distance, vertex.boundary_id])
+            features.append(feature)
+        provider.addFeatures(features)
+        layer.updateExtents()
+        return layer
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+from math import atan2, cos, hypot, pi, sin, sqrt
+
+TWO_PI = 2 * pi
+
+# angular intervals narrower than this are not looked along
+ANGLE_TOLERANCE = 1e-12
+
+
+def circle_chord(cx, cy, radius, x1, y1, x2, y2):
+    """Returns the part of the segment (x1, y1)-(x2, y2) which lies within
+    the circle as a pair of segment parameters (t0, t1) with
+    0 <= t0 <= t1 <= 1, or None if the segment misses the circle."""
+    dx = x2 - x1
+    dy = y2 - y1
+    fx = x1 - cx
+    fy = y1 - cy
+    a = dx * dx + dy * dy
+    c = fx * fx + fy * fy - radius * radius
+    if a == 0:
+        return (0.0, 0.0) if c <= 0 else None
+    b = 2 * (fx * dx + fy * dy)
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+        return None
+    root = sqrt(discriminant)
+    t0 = (-b - root) / (2 * a)
+    t1 = (-b + root) / (2 * a)
+    if t0 > 1 or t1 < 0:
+        return None
+    return (max(t0, 0.0), min(t1, 1.0))
+
+
+class View:
+    """What can be seen from a point, as far as a radius: the visible
+    portions of the boundary lines as (line, start, end) distances along
+    them, and the visible vertices as (x, y) -> (distance, line)."""
+
+    __slots__ = ('x', 'y', 'radius', 'portions', 'vertices', 'corners',
+                 '_ends')
+
+    def __init__(self, x, y, radius):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.portions = []
+        self.vertices = {}
+        # the visible vertices which are convex corners of their block
+        self.corners = set()
+        self._ends = None
+
+    def add_vertex(self, x, y, line, number):
+        """Add vertex number of the line as seen."""
+        # the point and the vertices are on the same grid, so the vertex the
+        # point stands on has the very same coordinates
+        if x != self.x or y != self.y:
+            self.vertices[(x, y)] = (hypot(x - self.x, y - self.y), line)
+            if line.corners[number]:
+                self.corners.add((x, y))
+
+    def within(self, radius):
+        """Returns the visible portions as far as a smaller radius. Every
+        portion lies on a single edge, so it is cut by the circle like a
+        segment."""
+        if radius >= self.radius:
+            return self.portions
+        if self._ends is None:
+            # the ends of the portions, kept for the next radius
+            self._ends = [(line.interpolate(start), line.interpolate(end))
+                          for line, start, end in self.portions]
+        x, y = self.x, self.y
+        portions = []
+        for portion, ((ax, ay), (bx, by)) in zip(self.portions, self._ends):
+            if (hypot(ax - x, ay - y) <= radius
+                    and hypot(bx - x, by - y) <= radius):
+                portions.append(portion)
+                continue
+            line, start, end = portion
+            chord = circle_chord(x, y, radius, ax, ay, bx, by)
+            if chord is None or chord[1] <= chord[0]:
+                continue
+            t0, t1 = chord
+            portions.append((line, start + t0 * (end - start),
+                             start + t1 * (end - start)))
+        return portions
+
+    def cut(self, radius):
+        """Returns the View from the same point as far as a smaller
+        radius."""
+        if radius >= self.radius:
+            return self
+        view = View(self.x, self.y, radius)
+        view.portions = self.within(radius)
+        view.vertices = {vertex: seen
+                         for vertex, seen in self.vertices.items()
+                         if seen[0] <= radius}
+        view.corners = {vertex for vertex in self.corners
+                        if vertex in view.vertices}
+        return view
+
+
+def _angle(dx, dy):
+    angle = atan2(dy, dx)
+    return angle + TWO_PI if angle < 0 else angle
+
+
+def _same_angle(a, b):
+    difference = abs(a - b)
+    return (difference <= ANGLE_TOLERANCE
+            or abs(difference - TWO_PI) <= ANGLE_TOLERANCE)
+
+
+def _pieces(start, end):
+    """Split the counter-clockwise angular range from start to end into
+    ranges within [0, 2 pi]."""
+    if start <= end:
+        return [(start, end)]
+    return [(start, TWO_PI), (0.0, end)]
+
+
+class _Occluder:
+    """The part of a front facing edge within the radius, seen from the
+    point turning counter-clockwise from q to p. p_vertex and q_vertex are
+    the numbers of the line vertices at p and q, or None when the radius
+    cuts the edge short there."""
+
+    __slots__ = ('line', 'px', 'py', 'qx', 'qy', 'mp', 'mq', 'p_vertex',
+                 'q_vertex', 'p_angle', 'q_angle')
+
+    def __init__(self, line, px, py, qx, qy, mp, mq, p_vertex, q_vertex,
+                 p_angle, q_angle):
+        self.line = line
+        self.px = px
+        self.py = py
+        self.qx = qx
+        self.qy = qy
+        self.mp = mp
+        self.mq = mq
+        self.p_vertex = p_vertex
+        self.q_vertex = q_vertex
+        self.p_angle = p_angle
+        self.q_angle = q_angle
+
+    def distance(self, x, y, ux, uy):
+        """Distance from (x, y) to the edge along the direction (ux, uy)."""
+        ex = self.qx - self.px
+        ey = self.qy - self.py
+        return ((self.px - x) * ey - (self.py - y) * ex) / (ux * ey - uy * ex)
+
+    def parameter(self, x, y, ux, uy):
+        """Position from p (0) to q (1) where the direction (ux, uy) from
+        (x, y) hits the edge."""
+        ex = self.qx - self.px
+        ey = self.qy - self.py
+        t = ((x - self.px) * uy - (y - self.py) * ux) / (ex * uy - ey * ux)
+        return min(max(t, 0.0), 1.0)
+
+
+def look(edge_index, x, y, radius):
+    """Work out what can be seen from the point (x, y) as far as radius, with
+    an angular plane sweep over the block edges near the point.
+
+    The boundary lines are oriented with the blocks on their left, so only
+    the edges facing the point can hide anything behind them. The edges
+    facing the point are sorted by the angles of their ends, and between two
+    consecutive angles the nearest one of the edges spanning that angular
+    interval is the visible one. When the point lies on a block boundary the
+    directions into the block are blocked, and the boundary it lies on can be
+    walked along.
+
+    The point is snapped to the grid the block lines are snapped to, so
+    whether it lies on an edge, at one of its ends or on which side of it
+    is decided exactly, in integer grid steps, for the edges which pass
+    within a grid step of it. Returns a View."""
+    grid = edge_index.grid
+    kx, ky = round(x / grid), round(y / grid)
+    x, y = kx * grid, ky * grid
+    view = View(x, y, radius)
+    lines = edge_index.lines
+    occluders = []
+    edge_on = []
+    blocked = []
+    outgoing = {}
+    incoming = {}
+
+    for line_no, i in edge_index.edges_near(x, y, radius):
+        line = lines[line_no]
+        (ax, ay), (bx, by) = line.points[i], line.points[i + 1]
+        length = line.measures[i + 1] - line.measures[i]
+        if length == 0:
+            continue
+        chord = circle_chord(x, y, radius, ax, ay, bx, by)
+        if chord is None or chord[1] <= chord[0]:
+            continue
+        t0, t1 = chord
+        ex = bx - ax
+        ey = by - ay
+        px, py = (ax, ay) if t0 == 0 else (ax + t0 * ex, ay + t0 * ey)
+        qx, qy = (bx, by) if t1 == 1 else (ax + t1 * ex, ay + t1 * ey)
+        mp = line.measures[i] + t0 * length
+        mq = line.measures[i] + t1 * length
+
+        # the point is on the left of the edge (the block side) when cross
+        # is positive, and cross / length is its distance from the edge line
+        cross = ex * (y - ay) - ey * (x - ax)
+        if abs(cross) <= grid * length:
+            # near the edge line the side is worked out again exactly, with
+            # the point and the edge on the grid
+            kax, kay = round(ax / grid), round(ay / grid)
+            kex, key = round(bx / grid) - kax, round(by / grid) - kay
+            cross = kex * (ky - kay) - key * (kx - kax)
+        if cross == 0:
+            along = (kx - kax) * kex + (ky - kay) * key
+            squared = kex * kex + key * key
+            if 0 <= along <= squared:
+                # the point lies on this edge, which can be walked along
+                view.portions.append((line, mp, mq))
+                if t0 == 0:
+                    view.add_vertex(ax, ay, line, i)
+                if t1 == 1:
+                    view.add_vertex(bx, by, line, i + 1)
+                direction = _angle(ex, ey)
+                if along == 0:
+                    outgoing[(line_no, i)] = direction
+                elif along == squared:
+                    incoming[(line_no, line.vertex_number(i + 1))] = (
+                        _angle(-ex, -ey))
+                else:
+                    blocked.extend(_pieces(direction, (direction + pi) % TWO_PI))
+            else:
+                # seen edge-on, it hides nothing
+                edge_on.append((hypot(px - x, py - y), line, px, py, qx, qy,
+                                mp, mq, i if t0 == 0 else None,
+                                i + 1 if t1 == 1 else None))
+            continue
+        if cross > 0:
+            # the back of an edge is always hidden behind its block
+            continue
+        occluders.append(
+            _Occluder(line, px, py, qx, qy, mp, mq,
+                      i if t0 == 0 else None, i + 1 if t1 == 1 else None,
+                      _angle(px - x, py - y), _angle(qx - x, qy - y)))
+
+    # at a block vertex, the directions between the edge leaving it and
+    # the edge coming into it point into the block
+    for key, start in outgoing.items():
+        end = incoming.get(key)
+        if end is not None:
+            blocked.extend(_pieces(start, end))
+
+    events = []
+    for n, occluder in enumerate(occluders):
+        for start, end in _pieces(occluder.q_angle, occluder.p_angle):
+            events.append((start, 1, n))
+            events.append((end, -1, n))
+    for start, end in blocked:
+        events.append((start, 0, None))
+        events.append((end, 0, None))
+    events.sort(key=lambda event: event[0])
+
+    active = set()
+    previous = 0.0
+    k = 0
+    while True:
+        angle = events[k][0] if k < len(events) else TWO_PI
+        if angle - previous > ANGLE_TOLERANCE and active:
+            _look_between(view, occluders, active, blocked, previous, angle)
+        if k >= len(events):
+            break
+        while k < len(events) and events[k][0] == angle:
+            _, kind, n = events[k]
+            if kind == 1:
+                active.add(n)
+            elif kind == -1:
+                active.discard(n)
+            k += 1
+        previous = angle
+
+    # an edge seen edge-on is visible as far as its nearer end is
+    edge_on.sort(key=lambda edge: edge[0])
+    for _, line, px, py, qx, qy, mp, mq, p_vertex, q_vertex in edge_on:
+        if hypot(qx - x, qy - y) < hypot(px - x, py - y):
+            near, far = (qx, qy, q_vertex), (px, py, p_vertex)
+        else:
+            near, far = (px, py, p_vertex), (qx, qy, q_vertex)
+        if near[2] is not None and (near[0], near[1]) in view.vertices:
+            view.portions.append((line, mp, mq))
+            if far[2] is not None:
+                view.add_vertex(far[0], far[1], line, far[2])
+
+    return view
+
+
+def _look_between(view, occluders, active, blocked, start, end):
+    """Find the nearest of the active edges between two angles and add its
+    part between them to the view."""
+    middle = (start + end) / 2
+    for blocked_start, blocked_end in blocked:
+        if blocked_start < middle < blocked_end:
+            return
+
+    x, y = view.x, view.y
+    ux, uy = cos(middle), sin(middle)
+    nearest = min(active, key=lambda n: occluders[n].distance(x, y, ux, uy))
+    occluder = occluders[nearest]
+
+    t_start = occluder.parameter(x, y, cos(start), sin(start))
+    t_end = occluder.parameter(x, y, cos(end), sin(end))
+    m_start = occluder.mp + t_start * (occluder.mq - occluder.mp)
+    m_end = occluder.mp + t_end * (occluder.mq - occluder.mp)
+    if m_end < m_start:
+        m_start, m_end = m_end, m_start
+    if m_end > m_start:
+        view.portions.append((occluder.line, m_start, m_end))
+
+    # the ends of the visible edge are visible vertices when the interval
+    # reaches them
+    if occluder.q_vertex is not None and _same_angle(occluder.q_angle, start):
+        view.add_vertex(occluder.qx, occluder.qy, occluder.line,
+                        occluder.q_vertex)
+    if occluder.p_vertex is not None and _same_angle(occluder.p_angle, end):
+        view.add_vertex(occluder.px, occluder.py, occluder.line,
+                        occluder.p_vertex)
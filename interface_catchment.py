@@ -23,8 +23,8 @@
 """
 from PyQt5.QtCore import (QSettings, QTranslator, qVersion, QCoreApplication,
                           QObject, QThread, pyqtRemoveInputHook, pyqtSignal,
-                          QVariant)
-from PyQt5.QtGui import QIcon, QDoubleValidator, QColor
+                          QVariant, QRegExp)
+from PyQt5.QtGui import QIcon, QDoubleValidator, QColor, QRegExpValidator
 from PyQt5.QtWidgets import QAction
 
 from qgis.core import *
@@ -43,6 +43,8 @@ import time
 
 # from .functions import read_runtime_parameters, worker
 
+from .icblocks import block_cache
+from .icpreview import ICPreviewTool
 from .icworker import ICWorker
 
 _translate = QtCore.QCoreApplication.translate
@@ -109,6 +111,8 @@ class InterfaceCatchment:
         # function
         self.dlg.checkBox.stateChanged.connect(self.checkbox_on_change)
         self.dlg.checkBox_2.stateChanged.connect(self.checkbox2_on_change)
+        self.dlg.checkBox_4.stateChanged.connect(self.batch_on_change)
+        self.dlg.checkBox_6.stateChanged.connect(self.surface_on_change)
 
         # this is where I hide the warning message at first and then I can
         # always show it when needed
@@ -120,18 +124,40 @@ class InterfaceCatchment:
         self.dlg.lineEdit.setValidator(validator)
         self.dlg.lineEdit_2.setValidator(validator)
 
+        # the walking distances are one or more positive numbers, separated
+        # by commas or spaces
+        self.dlg.lineEdit_3.setValidator(QRegExpValidator(
+            QRegExp(r'[\d.,;\s]*'), self.dlg))
+
         # This is to enable selecting a starting point by clicking on the map
         self.canvas = self.iface.mapCanvas()
         self.clickTool = QgsMapToolEmitPoint(self.canvas)
         self.clickTool.canvasClicked.connect(self.read_click_coordinates)
         self.dlg.pushButton.clicked.connect(self.click_starting_point)
 
+        # the IC of the point under the cursor can be previewed on the map
+        # before choosing the starting point
+        self.previewTool = ICPreviewTool(self)
+        self.dlg.pushButton_3.clicked.connect(self.preview_starting_point)
+
+        # the preprocessed blocks are cached between the runs, until cleared
+        self.dlg.pushButton_2.clicked.connect(self.clear_block_cache)
+
+        # what an anytime run has reached so far is drawn over the map
+        # until it is done
+        self.partial_band = None
+
 
     def click_starting_point(self):
         self.current_map_tool = self.canvas.mapTool()
         self.canvas.setMapTool( self.clickTool )
         self.dlg.hide()
 
+    def preview_starting_point(self):
+        self.previewTool.previous_tool = self.canvas.mapTool()
+        self.canvas.setMapTool(self.previewTool)
+        self.dlg.hide()
+
     def read_click_coordinates(self, point, button):
         self.dlg.label_8.hide()
         self.dlg.lineEdit.setText(str(point.x()))
@@ -140,6 +166,27 @@ class InterfaceCatchment:
         self.dlg.mMapLayerComboBox_2.setCurrentIndex(-1)
         self.dlg.show()
 
+    def clear_block_cache(self):
+        """Method for clearing the cache of the preprocessed blocks when the
+        clear block cache button is pressed"""
+        self.log('Block cache cleared after %s' % block_cache.summary())
+        block_cache.clear()
+
+    def walking_distances(self):
+        """Returns the walking distances typed into the walking distance
+        field as a sorted list, without duplicates and without anything
+        that is not a positive number."""
+        distances = set()
+        for text in self.dlg.lineEdit_3.text().replace(';', ',').replace(
+                ',', ' ').split():
+            try:
+                distance = float(text)
+            except ValueError:
+                continue
+            if distance > 0:
+                distances.add(distance)
+        return sorted(distances)
+
     def close_dialog(self):
         """Method for closing the plugin dialog when button cancel is
         pressed"""
@@ -165,6 +212,21 @@ class InterfaceCatchment:
         elif not self.dlg.checkBox.isChecked():
             self.dlg.checkBox_2.setCheckState(QtCore.Qt.Checked)
 
+    def batch_on_change(self, signal):
+        """A method that checks the starting point layer again when the batch
+        mode is switched, since in batch mode a layer with many points is
+        not ambiguous."""
+        if signal:
+            self.dlg.checkBox_6.setCheckState(QtCore.Qt.Unchecked)
+        self.read_point_coordinates(
+            self.dlg.mMapLayerComboBox_2.currentLayer())
+
+    def surface_on_change(self, signal):
+        """A method that unchecks the batch mode when the surface mode is
+        checked, the surface does not need any starting points."""
+        if signal:
+            self.dlg.checkBox_4.setCheckState(QtCore.Qt.Unchecked)
+
     # this is where I read out the coordinates of the chosen point and
     # write them into the x and y text boxes
     def read_point_coordinates(self, layer):
@@ -176,6 +238,9 @@ class InterfaceCatchment:
         self.dlg.label_8.hide()
         if not layer:
             pass
+        elif self.dlg.checkBox_4.isChecked() and layer.featureCount() > 0:
+            # in batch mode every point of the layer is a starting point
+            pass
         elif layer.featureCount() == 0:
             # layer has 0 features, raise warning
             self.dlg.label_8.setText(
@@ -327,6 +392,8 @@ class InterfaceCatchment:
             self.iface.removeToolBarIcon(action)
         # remove the toolbar
         del self.toolbar
+        if self.canvas.mapTool() is self.previewTool:
+            self.canvas.unsetMapTool(self.previewTool)
 
 
     def run(self):
@@ -341,6 +408,9 @@ class InterfaceCatchment:
         added_layer = QgsProject.instance().addMapLayer(layer)
         color = params.get('color')
         width = params.get('width')
+        if not isinstance(added_layer, QgsVectorLayer):
+            # rasters keep their default style
+            color = width = None
         if color:
             added_layer.renderer().symbol().setColor(QColor(color))
         if width:
@@ -360,6 +430,26 @@ class InterfaceCatchment:
         self.iface.layerTreeView().refreshLayerSymbology(added_layer.id())
         self.log('Added layer "%s" with color: %s, width: %s to the map.' %(added_layer.sourceName(),color,width))
     
+    def show_partial_result(self, walked, ics, geometry):
+        """Draws what an anytime run has reached so far on the map, and
+        shows its lower bound ICs in the status bar."""
+        if self.partial_band is None:
+            self.partial_band = QgsRubberBand(self.canvas,
+                                              QgsWkbTypes.LineGeometry)
+            self.partial_band.setColor(QColor('red'))
+            self.partial_band.setWidth(2)
+        self.partial_band.setToGeometry(geometry, None)
+        self.iface.statusBarIface().showMessage(
+            'IC reached within %g m: at least %s' %(walked, ', '.join(
+                str(ic) for ic in ics)))
+
+    def clear_partial_result(self):
+        """Removes what an anytime run has reached so far from the map."""
+        if self.partial_band is not None:
+            self.canvas.scene().removeItem(self.partial_band)
+            self.partial_band = None
+        self.iface.statusBarIface().clearMessage()
+
     def update_task_number_label(self):
         active_tasks = QgsApplication.taskManager().activeTasks()
         ic_task_count = sum([1 for t in active_tasks if type(t)==ICWorker])
@@ -379,8 +469,21 @@ class InterfaceCatchment:
 
     def execute(self):
         try:
-            myworker = self.myworker = ICWorker(self, 'InterfaceCatchment plugin - %s m' %self.dlg.mQgsDoubleSpinBox.value())
+            distances = self.walking_distances()
+            if not distances:
+                self.log('No walking distance given', Qgis.Warning)
+                return
+            description = 'InterfaceCatchment plugin - %s m' %', '.join(
+                '%g' % distance for distance in distances)
+            if self.dlg.checkBox_4.isChecked():
+                description += ' (batch)'
+            elif self.dlg.checkBox_6.isChecked():
+                description += ' (surface)'
+            myworker = self.myworker = ICWorker(self, description)
             myworker.layerPrint.connect(self.showLayer)
+            myworker.partialResult.connect(self.show_partial_result)
+            myworker.taskCompleted.connect(self.clear_partial_result)
+            myworker.taskTerminated.connect(self.clear_partial_result)
             QgsApplication.taskManager().countActiveTasksChanged.connect(self.update_task_number_label)
             QgsApplication.taskManager().allTasksFinished.connect(self.delete_task_number_label)
             QgsApplication.taskManager().addTask(myworker)
@@ -0,0 +1,195 @@
+# coding=utf-8
+"""Parallel expansion test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from utilities import city_lines, expand_rounds, plugin_module
+
+icbatch = plugin_module('icbatch')
+icengine = plugin_module('icengine')
+icgraphstore = plugin_module('icgraphstore')
+icindex = plugin_module('icindex')
+icintervals = plugin_module('icintervals')
+
+
+def city(**options):
+    """Returns the block lines of a small synthetic city and its starting
+    point."""
+    return city_lines(6, 6, 60.0, seed=3, **options)
+
+
+def grow(expand, lines, origin, distance, **options):
+    """Returns the merged reachable intervals of every line and the walking
+    distance left at every reached vertex."""
+    intervals = icintervals.ReachableIntervals()
+    vertex_store = expand(icindex.EdgeIndex(lines), origin[0], origin[1],
+                          distance, intervals, **options)
+    return ({key: intervals.merged(key) for key in intervals.keys()},
+            {(vertex.x, vertex.y): vertex.distance
+             for vertex in vertex_store.vertices.values()})
+
+
+class ParallelExpansionTest(unittest.TestCase):
+    """Test that looking from the points of a round in worker processes
+    reaches what the serial engine reaches."""
+
+    def assertSameCatchment(self, lines, origin, distance):
+        serial = grow(icengine.expand_iterative, lines, origin, distance)
+        self.assertTrue(serial[0])
+        # the vertices dropped depend on the rounds, but not on the
+        # number of processes
+        rounds = grow(expand_rounds, lines, origin, distance)
+        self.assertEqual(rounds[0], serial[0])
+        # a pool is started even when there are fewer cores
+        with mock.patch.object(icbatch, 'available_cores', return_value=4):
+            for processes in (1, 2, 3):
+                pooled = grow(icbatch.expand_parallel, lines, origin,
+                              distance, processes=processes)
+                self.assertEqual(pooled[0], serial[0])
+                self.assertEqual(pooled[1], rounds[1])
+
+    def test_processes_capped(self):
+        """No more processes are started than there are cores."""
+        lines, _ = city()
+        edge_index = icindex.EdgeIndex(lines)
+        with mock.patch.object(icbatch, 'available_cores', return_value=1):
+            with icbatch.LookPool(edge_index, 4) as pool:
+                self.assertEqual(pool.processes, 1)
+                self.assertIsNone(pool._pool)
+
+    def test_spawned_executable(self):
+        """The workers are spawned, never forked, with the python
+        interpreter, which is put back for the rest of the process
+        afterwards."""
+        self.assertEqual(icbatch._context().get_start_method(), 'spawn')
+        lines, origin = city()
+        edge_index = icindex.EdgeIndex(lines)
+        previous = icbatch.spawn.get_executable()
+        with mock.patch.object(icbatch, 'available_cores', return_value=2), \
+                mock.patch.object(icbatch, '_python_executable',
+                                  return_value=sys.executable), \
+                mock.patch.object(
+                    icbatch.spawn, 'set_executable',
+                    wraps=icbatch.spawn.set_executable) as setter:
+            with icbatch.LookPool(edge_index, 2) as pool:
+                self.assertEqual(icbatch.spawn.get_executable(), previous)
+                points = [(origin[0], origin[1], 100.0),
+                          (origin[0] + 10.0, origin[1], 50.0)]
+                self.assertEqual(
+                    [(sorted(view.corners), len(view.portions))
+                     for view in pool.look_all(points)],
+                    [(sorted(view.corners), len(view.portions))
+                     for view in [icengine.look(edge_index, *point)
+                                  for point in points]])
+        self.assertEqual([call[0][0] for call in setter.call_args_list],
+                         [sys.executable, previous])
+
+    def test_counts(self):
+        """The vertices which are not corners are counted, though their
+        views only send the corners back."""
+        lines, origin = city(irregularity=0.5, curved=0.3)
+        counters = []
+        with mock.patch.object(icbatch, 'available_cores', return_value=2):
+            for processes in (1, 2):
+                stats = icbatch.RunStats()
+                icbatch.expand_parallel(
+                    icindex.EdgeIndex(lines), origin[0], origin[1], 200.0,
+                    icintervals.ReachableIntervals(), processes, stats=stats)
+                counters.append({name: stats.counters[name] for name in (
+                    'vertices tested', 'vertices pruned', 'edges tested')})
+        self.assertGreater(counters[0]['vertices pruned'], 0)
+        self.assertEqual(counters[1], counters[0])
+
+    def test_grid(self):
+        """A grid of blocks gives the serial catchment."""
+        lines, origin = city()
+        self.assertSameCatchment(lines, origin, 250.0)
+
+    def test_mixed(self):
+        """Irregular, curved blocks with dead-ends and courtyards give the
+        serial catchment."""
+        lines, origin = city(irregularity=0.5, dead_ends=0.3,
+                             courtyards=0.3, curved=0.3)
+        self.assertSameCatchment(lines, origin, 250.0)
+
+    def test_rounds(self):
+        """Rounds of any step give the serial catchment."""
+        lines, origin = city(curved=0.5)
+        serial = grow(icengine.expand_iterative, lines, origin, 200.0)
+        for step in (0.0, 10.0, 1000.0):
+            self.assertEqual(grow(expand_rounds, lines, origin, 200.0,
+                                  step=step)[0], serial[0])
+
+
+class BatchCatchmentsTest(unittest.TestCase):
+    """Test that the engines give the same IC of every origin in a batch."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_engines(self):
+        """The visibility graph is shared over the origins, the stored graph
+        is searched from its file, and both give the IC of the iterative
+        engine."""
+        lines, (x, y) = city(irregularity=0.5, curved=0.3)
+        origins = [(fid, x + 13.0 * fid, y - 7.0 * fid)
+                   for fid in range(4)]
+        store_path = os.path.join(self.directory, 'graph.icvg')
+        self.assertTrue(icgraphstore.build_graph_store(
+            icindex.EdgeIndex(lines), 200.0, store_path))
+        results = {}
+        for engine in icengine.ENGINES:
+            with mock.patch.object(icbatch, 'VisibilityGraph',
+                                   wraps=icbatch.VisibilityGraph) as graph, \
+                    mock.patch.object(icbatch, 'GraphStore',
+                                      wraps=icbatch.GraphStore) as store:
+                results[engine] = icbatch.batch_catchments(
+                    lines, origins, [100.0, 200.0], engine, processes=1,
+                    store_path=store_path
+                    if engine == icengine.ENGINE_STORED_GRAPH else None)
+            self.assertEqual(
+                graph.call_count,
+                int(engine == icengine.ENGINE_VISIBILITY_GRAPH))
+            self.assertEqual(store.call_count,
+                             int(engine == icengine.ENGINE_STORED_GRAPH))
+        for engine, result in results.items():
+            for fid, _, _ in origins:
+                for length, expected in zip(
+                        result[fid],
+                        results[icengine.ENGINE_ITERATIVE][fid]):
+                    self.assertLessEqual(abs(length - expected), 1, engine)
+
+    def test_stored_graph_needs_store(self):
+        """The stored graph engine is refused without a graph store."""
+        lines, (x, y) = city()
+        with self.assertRaises(ValueError):
+            icbatch.batch_catchments(lines, [(0, x, y)], [100.0],
+                                     icengine.ENGINE_STORED_GRAPH,
+                                     processes=1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ParallelExpansionTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,56 @@
+# coding=utf-8
+"""Synthetic city test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import unittest
+
+from icbench.city import synthetic_city
+
+
+def area(ring):
+    return sum(x1 * y2 - x2 * y1
+               for (x1, y1), (x2, y2) in zip(ring, ring[1:])) / 2
+
+
+class SyntheticCityTest(unittest.TestCase):
+    """Test the synthetic cities the benchmarks run on."""
+
+    def test_grid(self):
+        """A plain grid has square blocks and starts in a street crossing."""
+        blocks, centre = synthetic_city(4, 3, block_size=80.0,
+                                        street_width=(20.0, 20.0))
+        self.assertEqual(len(blocks), 12)
+        self.assertTrue(all(len(rings) == 1 for rings in blocks))
+        self.assertAlmostEqual(area(blocks[0][0]), 6400.0)
+        self.assertEqual(centre, (190.0, 190.0))
+
+    def test_features(self):
+        """Dead-ends, courtyards and curves add vertices and holes, and the
+        rings keep their orientation."""
+        blocks, _ = synthetic_city(3, 3, dead_ends=1.0, courtyards=1.0,
+                                   curved=1.0, irregularity=1.0, seed=3)
+        for exterior, courtyard in blocks:
+            self.assertGreater(len(exterior), 80)
+            self.assertGreater(area(exterior), 0)
+            self.assertLess(area(courtyard), 0)
+
+    def test_seed(self):
+        """The same seed gives the same city."""
+        self.assertEqual(synthetic_city(3, 3, irregularity=0.5, seed=7),
+                         synthetic_city(3, 3, irregularity=0.5, seed=7))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SyntheticCityTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,189 @@
+# coding=utf-8
+"""Block store test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+from utilities import plugin_module
+
+icblockstore = plugin_module('icblockstore')
+icintervals = plugin_module('icintervals')
+
+TILE_SIZE = 100.0
+
+
+def square(block_id, x, y, width, height=None):
+    """Returns the boundary lines of a rectangular block with its lower left
+    corner at (x, y)."""
+    height = width if height is None else height
+    return icintervals.block_lines(block_id, [[
+        (x, y), (x + width, y), (x + width, y + height), (x, y + height),
+        (x, y)]])
+
+
+def box(line):
+    xs = [x for x, _ in line.points]
+    ys = [y for _, y in line.points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def meets(a, b):
+    return a[0] <= b[2] and a[1] <= b[3] and a[2] >= b[0] and a[3] >= b[1]
+
+
+class BlockStoreTest(unittest.TestCase):
+    """Test that the lines written tile by tile are found around any
+    extent, on either side of the origin."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'blocks.icbs')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, blocks, large=()):
+        """Write the blocks, stored by the tile of their centre, and the
+        large blocks, and open the store."""
+        tiled = []
+        for lines in blocks:
+            x0, y0, x1, y1 = box(lines[0])
+            tile = icblockstore.tile_of((x0 + x1) / 2, (y0 + y1) / 2,
+                                        TILE_SIZE)
+            tiled.append((icblockstore._tile_key(*tile), tile, lines))
+        tiled.sort(key=lambda block: block[0])
+        writer = icblockstore.BlockStoreWriter(self.path, 'EPSG:3857',
+                                               icintervals.SNAP_GRID,
+                                               TILE_SIZE)
+        try:
+            for _, tile, lines in tiled:
+                writer.add_block(lines, tile)
+            for lines in large:
+                writer.add_block(lines)
+            writer.finish()
+        finally:
+            writer.close()
+        store = icblockstore.BlockStore(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def assertFound(self, store, extent):
+        """line_numbers finds every line whose box meets the extent, and no
+        other."""
+        expected = [line_no for line_no in range(store.line_count)
+                    if meets(box(store.line(line_no)), extent)]
+        self.assertEqual(sorted(store.line_numbers(extent)), expected,
+                         extent)
+
+    def test_tile_keys(self):
+        """The tile keys are in the order of the columns and then of the
+        rows, on either side of the origin."""
+        tiles = [(column, row) for column in (-2 ** 20, -3, -1, 0, 1, 5)
+                 for row in (-2 ** 20, -7, -1, 0, 1, 2 ** 20)]
+        keys = [icblockstore._tile_key(*tile) for tile in tiles]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(icblockstore.tile_of(-0.5, -100.0, TILE_SIZE),
+                         (-1, -1))
+        self.assertEqual(icblockstore.tile_of(0.0, 99.9, TILE_SIZE), (0, 0))
+
+    def test_round_trip(self):
+        """The blocks of tiles with negative columns and rows are read back
+        from their tiles as written."""
+        blocks = []
+        for block_id, (x, y) in enumerate(
+                [(-250.0, -250.0), (-250.0, 130.0), (130.0, -250.0),
+                 (-30.0, -30.0), (10.0, 10.0), (-1e5, 3e4)]):
+            blocks.append(square(block_id, x, y, 20.0))
+        store = self.write(blocks)
+        self.assertEqual(store.crs, 'EPSG:3857')
+        self.assertEqual(store.tile_size, TILE_SIZE)
+        for lines in blocks:
+            found = store.lines(box(lines[0]))
+            self.assertEqual([line.points for line in found],
+                             [line.points for line in lines])
+            self.assertEqual([line.corners for line in found],
+                             [line.corners for line in lines])
+
+    def test_tile_edges(self):
+        """The blocks reaching out of their tile are found from the tiles
+        next to it."""
+        rng = random.Random(5)
+        blocks = []
+        for block_id in range(200):
+            # near the edges of the tiles, up to a tile across
+            x = rng.choice((-1, 0, 1, 2)) * TILE_SIZE + rng.uniform(-60, 10)
+            y = rng.choice((-2, -1, 0, 1)) * TILE_SIZE + rng.uniform(-60, 10)
+            blocks.append(square(block_id, x, y, rng.uniform(1.0, 99.0),
+                                 rng.uniform(1.0, 99.0)))
+        store = self.write(blocks)
+        for _ in range(200):
+            x = rng.uniform(-250.0, 350.0)
+            y = rng.uniform(-350.0, 250.0)
+            self.assertFound(store, (x, y, x + rng.uniform(0.0, 30.0),
+                                     y + rng.uniform(0.0, 30.0)))
+
+    def test_large_blocks(self):
+        """The blocks too large for a tile are found from anywhere they
+        reach."""
+        blocks = [square(0, -40.0, -40.0, 30.0), square(1, 210.0, 10.0, 30.0)]
+        large = [square(2, -450.0, -20.0, 900.0, 15.0),
+                 square(3, 50.0, -300.0, 250.0)]
+        store = self.write(blocks, large)
+        for extent in ((-440.0, -10.0, -439.0, -9.0),
+                       (430.0, -19.0, 431.0, -18.0),
+                       (240.0, -290.0, 260.0, -280.0),
+                       (-40.0, -40.0, -30.0, -30.0),
+                       (0.0, 0.0, 0.0, 0.0)):
+            self.assertFound(store, extent)
+        self.assertEqual(
+            {line.boundary_id
+             for line in store.lines((-440.0, -10.0, -439.0, -9.0))}, {2})
+
+    def test_write_order(self):
+        """The tiles are written in order, and the large blocks last."""
+        writer = icblockstore.BlockStoreWriter(self.path, 'EPSG:3857',
+                                               icintervals.SNAP_GRID,
+                                               TILE_SIZE)
+        try:
+            writer.add_block(square(0, 10.0, 10.0, 5.0), (0, 0))
+            with self.assertRaises(ValueError):
+                writer.add_block(square(1, -90.0, 10.0, 5.0), (-1, 0))
+            writer.add_block(square(2, 0.0, 0.0, 300.0))
+            with self.assertRaises(ValueError):
+                writer.add_block(square(3, 110.0, 10.0, 5.0), (1, 0))
+        finally:
+            writer.close()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_other_version_rejected(self):
+        """A store of another version is not read."""
+        self.write([square(0, 10.0, 10.0, 5.0)]).close()
+        with open(self.path, 'r+b') as f:
+            f.seek(struct.calcsize('<4s'))
+            f.write(struct.pack('<I', icblockstore.VERSION + 1))
+        with self.assertRaises(ValueError):
+            icblockstore.BlockStore(self.path)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BlockStoreTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,154 @@
+# coding=utf-8
+"""Interface catchment test, in QGIS.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import shutil
+import tempfile
+import unittest
+from math import sqrt
+
+from qgis.core import (QgsFeature, QgsGeometry, QgsPointXY, QgsRectangle,
+                       QgsVectorLayer, QgsWkbTypes)
+
+from utilities import get_qgis_app, plugin_module
+QGIS_APP = get_qgis_app()
+
+icblocks = plugin_module('icblocks')
+iccompute = plugin_module('iccompute')
+icengine = plugin_module('icengine')
+icgeometry = plugin_module('icgeometry')
+
+CRS = 'EPSG:3857'
+
+
+def square(x, y, size=100.0):
+    return QgsGeometry.fromRect(QgsRectangle(x, y, x + size, y + size))
+
+
+def slotted(x, y):
+    """Returns a 100 m square block with a dead-end street 20 m wide and
+    80 m deep cut into it from the top."""
+    return QgsGeometry.fromPolygonXY([[
+        QgsPointXY(x + px, y + py) for px, py in (
+            (0, 0), (100, 0), (100, 100), (60, 100), (60, 20), (40, 20),
+            (40, 100), (0, 100), (0, 0))]])
+
+
+def blocks_layer(geometries):
+    layer = QgsVectorLayer('MultiPolygon?crs=' + CRS, 'blocks', 'memory')
+    features = []
+    for geometry in geometries:
+        feature = QgsFeature()
+        feature.setGeometry(geometry)
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    layer.updateExtents()
+    return layer
+
+
+class ComputeICTest(unittest.TestCase):
+    """Test the IC of two blocks across a street 20 m wide, the block cache
+    and the dead-end filling on QGIS geometries."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.blocks = [square(0.0, 0.0), square(120.0, 0.0)]
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_known_ic(self):
+        """From the middle of the street the faces along it are reachable
+        as far as the walking distance, and every face of both blocks is
+        reachable by walking around them."""
+        result = iccompute.compute_ic(self.blocks, (110.0, 50.0), 30.0,
+                                      crs=CRS, use_cache=False)
+        # 2 faces, each seen as far as 28.3 m either side of the middle
+        self.assertEqual(result.ic, round(4 * sqrt(30.0 ** 2 - 10.0 ** 2)))
+        self.assertTrue(result.complete)
+        for engine in icengine.ENGINES:
+            if engine == icengine.ENGINE_STORED_GRAPH:
+                continue
+            result = iccompute.compute_ic(self.blocks, (110.0, 50.0), 1000.0,
+                                          crs=CRS, engine=engine,
+                                          use_cache=False)
+            self.assertEqual(result.ic, 800, engine)
+
+    def test_line_blocks(self):
+        """Blocks given as closed lines give the IC of the polygons."""
+        lines = [QgsGeometry.fromPolylineXY(block.asPolygon()[0])
+                 for block in self.blocks]
+        self.assertEqual(
+            iccompute.blocks_layer_from(lines, CRS).geometryType(),
+            QgsWkbTypes.LineGeometry)
+        result = iccompute.compute_ic(lines, (110.0, 50.0), 1000.0, crs=CRS,
+                                      use_cache=False)
+        self.assertEqual(result.ic, 800)
+
+    def test_cache(self):
+        """The blocks are preprocessed once, and again after an edit of the
+        blocks layer."""
+        cache = icblocks.BlockCache(self.directory)
+        layer = blocks_layer(self.blocks)
+        area = QgsRectangle(60.0, 0.0, 160.0, 100.0)
+        first = cache.blocks(layer, CRS, area=area)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        second = cache.blocks(layer, CRS, area=area)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(second.featureCount(), first.featureCount())
+
+        feature = next(layer.getFeatures())
+        layer.dataProvider().changeGeometryValues(
+            {feature.id(): square(0.0, 0.0, 50.0)})
+        edited = cache.blocks(layer, CRS, area=area)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(
+            sorted(round(block.geometry().area())
+                   for block in edited.getFeatures()), [2500, 10000])
+
+    def test_dead_ends(self):
+        """The dead-end narrower than the width is filled in, and the street
+        between two blocks narrower than it is left open."""
+        filled = icgeometry.filled_blocks(
+            [slotted(0.0, 0.0), square(110.0, 0.0), square(0.0, 200.0)],
+            30.0)
+        self.assertEqual([dead_ends for _, dead_ends in filled], [1, 0, 0])
+        self.assertAlmostEqual(filled[0][0].area(), 10000.0, delta=1.0)
+        self.assertEqual([round(block.area()) for block, _ in filled[1:]],
+                         [10000, 10000])
+        self.assertFalse(filled[0][0].intersects(filled[1][0]))
+        # a dead-end wider than the width is kept
+        self.assertEqual(icgeometry.filled_blocks([slotted(0.0, 0.0)],
+                                                  10.0)[0][1], 0)
+
+    def test_dead_ends_near(self):
+        """Only the blocks near the area are filled in, each once for the
+        width."""
+        layer = blocks_layer([slotted(0.0, 0.0), slotted(1000.0, 0.0)])
+        filled = {}
+        area = QgsRectangle(0.0, 0.0, 100.0, 100.0)
+        near = icblocks.fill_dead_ends_near(layer, 30.0, area, filled)
+        self.assertEqual(near.featureCount(), 1)
+        self.assertEqual(len(filled), 1)
+        stats = icblocks.RunStats()
+        icblocks.fill_dead_ends_near(layer, 30.0, None, filled, stats)
+        self.assertEqual(stats.counters['dead-end cache hits'], 1)
+        self.assertEqual(stats.counters['dead-ends filled'], 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ComputeICTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,196 @@
+# coding=utf-8
+"""Anytime expansion test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import unittest
+from unittest import mock
+
+from utilities import city_lines, expand_rounds, plugin_module
+
+icbatch = plugin_module('icbatch')
+icengine = plugin_module('icengine')
+icindex = plugin_module('icindex')
+icintervals = plugin_module('icintervals')
+
+WALKING_DISTANCE = 250.0
+
+
+def stopped_after(calls):
+    """Returns an is_canceled which stops the run after that many calls."""
+    made = []
+
+    def is_canceled():
+        made.append(None)
+        return len(made) > calls
+
+    return is_canceled
+
+
+def expand_parallel(edge_index, x, y, walking_distance, intervals,
+                    **options):
+    with mock.patch.object(icbatch, 'available_cores', return_value=2):
+        return icbatch.expand_parallel(edge_index, x, y, walking_distance,
+                                       intervals, processes=2, **options)
+
+
+# the engines which can be stopped with what they have reached
+ENGINES = {
+    'iterative': icengine.expand_iterative,
+    'rounds': expand_rounds,
+    'parallel': expand_parallel,
+}
+
+
+class AnytimeExpansionTest(unittest.TestCase):
+    """Test that a stopped expansion reaches a part of the catchment, and
+    all of it within the walking distance it says it is complete."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.lines, self.origin = city_lines(6, 6, 60.0, seed=2,
+                                             irregularity=0.5, curved=0.3,
+                                             dead_ends=0.3)
+        self.complete = self.grow(icengine.expand_iterative,
+                                  [WALKING_DISTANCE / 2, WALKING_DISTANCE])[0]
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.lines = None
+
+    def grow(self, expand, walking_distances, **options):
+        """Returns the DistanceSweep and the VertexStore of a run."""
+        sweep = icintervals.DistanceSweep(walking_distances)
+        vertex_store = expand(icindex.EdgeIndex(self.lines), self.origin[0],
+                              self.origin[1], max(walking_distances), sweep,
+                              **options)
+        return sweep, vertex_store
+
+    def assertLowerBound(self, partial, complete):
+        """Every reachable interval of partial lies within those of
+        complete."""
+        for key in partial.keys():
+            reachable = complete.merged(key)
+            for start, end in partial.merged(key):
+                self.assertTrue(
+                    any(s - 1e-6 <= start and end <= e + 1e-6
+                        for s, e in reachable), (key, start, end))
+
+    def ic(self, intervals):
+        return sum(intervals.length(key) for key in list(intervals.keys()))
+
+    def assertStoppedRun(self, name, sweep, vertex_store):
+        self.assertIsNotNone(vertex_store, name)
+        self.assertLess(vertex_store.complete_within, WALKING_DISTANCE,
+                        name)
+        for partial, complete in zip(sweep.intervals,
+                                     self.complete.intervals):
+            self.assertLowerBound(partial, complete)
+        self.assertLessEqual(self.ic(sweep.intervals[-1]),
+                             self.ic(self.complete.intervals[-1]) + 1e-6,
+                             name)
+        # the walking distances within which it is complete are exact
+        for distance, partial, complete in zip(
+                sweep.walking_distances, sweep.intervals,
+                self.complete.intervals):
+            if distance <= vertex_store.complete_within:
+                self.assertAlmostEqual(self.ic(partial), self.ic(complete),
+                                       places=6, msg=name)
+
+    def test_complete_run(self):
+        """A run which is not stopped is complete on every engine."""
+        for name, expand in ENGINES.items():
+            sweep, vertex_store = self.grow(
+                expand, [WALKING_DISTANCE / 2, WALKING_DISTANCE],
+                partial=True)
+            self.assertEqual(vertex_store.complete_within, WALKING_DISTANCE,
+                             name)
+            for partial, complete in zip(sweep.intervals,
+                                         self.complete.intervals):
+                self.assertAlmostEqual(self.ic(partial), self.ic(complete),
+                                       places=6, msg=name)
+
+    def test_canceled(self):
+        """A canceled run is a lower bound of the IC on every engine, or
+        None when it is not partial."""
+        for name, expand in ENGINES.items():
+            for calls in (1, 3, 8):
+                sweep, vertex_store = self.grow(
+                    expand, [WALKING_DISTANCE / 2, WALKING_DISTANCE],
+                    is_canceled=stopped_after(calls), partial=True)
+                self.assertStoppedRun(name, sweep, vertex_store)
+                if calls == 1:
+                    # only the starting point has been looked from
+                    self.assertLess(self.ic(sweep.intervals[-1]),
+                                    self.ic(self.complete.intervals[-1]))
+            self.assertIsNone(self.grow(
+                expand, [WALKING_DISTANCE], is_canceled=stopped_after(3))[1],
+                name)
+
+    def test_max_iterations(self):
+        """A run stopped at a number of sight lines is a lower bound of the
+        IC on every engine, the deeper the larger, and marks itself
+        partial."""
+        for name, expand in ENGINES.items():
+            previous = 0.0
+            for max_iterations in (1, 2, 3):
+                sweep, vertex_store = self.grow(
+                    expand, [WALKING_DISTANCE / 2, WALKING_DISTANCE],
+                    max_iterations=max_iterations)
+                self.assertStoppedRun(name, sweep, vertex_store)
+                self.assertTrue(all(
+                    vertex.iteration <= max_iterations + 1
+                    for vertex in vertex_store.vertices.values()))
+                ic = self.ic(sweep.intervals[-1])
+                self.assertGreaterEqual(ic, previous - 1e-6, name)
+                previous = ic
+
+    def test_graph_not_partial(self):
+        """The visibility graph search is not anytime: a canceled search
+        gives nothing rather than a part of the catchment."""
+        sweep, expanded = self.grow(icengine.expand_visibility_graph,
+                                    [WALKING_DISTANCE],
+                                    is_canceled=stopped_after(3))
+        self.assertIsNone(expanded)
+
+
+class DroppedVerticesTest(unittest.TestCase):
+    """Test that the vertices dropped would have added nothing."""
+
+    def test_same_catchment(self):
+        """Dropping the vertices which cannot reach any part of a boundary
+        which is not reachable yet gives the same catchment."""
+        dropped = 0
+        for seed, options in enumerate(({}, {'dead_ends': 0.5},
+                                        {'curved': 0.5, 'courtyards': 0.5})):
+            lines, (x, y) = city_lines(7, 7, 60.0, seed=seed, **options)
+            runs = []
+            for drop_distance in (icengine.DROP_DISTANCE, 0.0):
+                with mock.patch.object(icengine, 'DROP_DISTANCE',
+                                       drop_distance):
+                    sweep = icintervals.DistanceSweep([100.0, 300.0])
+                    stats = icengine.RunStats()
+                    icengine.expand_iterative(icindex.EdgeIndex(lines), x, y,
+                                              300.0, sweep, stats=stats)
+                    runs.append(sweep)
+                    dropped += stats.counters.get('vertices dropped', 0)
+            for kept, looked in zip(*(run.intervals for run in runs)):
+                self.assertEqual(set(kept.keys()), set(looked.keys()))
+                for key in looked.keys():
+                    self.assertEqual(kept.merged(key), looked.merged(key))
+        self.assertGreater(dropped, 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(AnytimeExpansionTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
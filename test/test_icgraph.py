@@ -0,0 +1,93 @@
+# coding=utf-8
+"""Visibility graph test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import unittest
+
+from utilities import city_lines, plugin_module
+
+icengine = plugin_module('icengine')
+icgraph = plugin_module('icgraph')
+icindex = plugin_module('icindex')
+icintervals = plugin_module('icintervals')
+
+
+class VisibilityGraphTest(unittest.TestCase):
+    """Test that the starting points searched from leave nothing behind in
+    a shared visibility graph."""
+
+    def setUp(self):
+        """Runs before each test."""
+        lines, self.origin = city_lines(5, 5, 60.0, seed=1,
+                                        irregularity=0.5)
+        self.graph = icgraph.VisibilityGraph(icindex.EdgeIndex(lines), 200.0)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.graph = None
+
+    def search(self, x, y, is_canceled=None):
+        return icengine.expand_visibility_graph(
+            self.graph.edge_index, x, y, 200.0,
+            icintervals.ReachableIntervals(), is_canceled, graph=self.graph)
+
+    def test_source_not_kept(self):
+        """A starting point is neither a node nor a view of the graph after
+        the search."""
+        x, y = self.origin
+        graph, distances = self.search(x, y)
+        self.assertIn(icgraph.SOURCE, distances)
+        self.assertEqual(graph.point(icgraph.SOURCE), (x, y))
+        self.assertIsNone(graph.node_at(x, y))
+        self.assertNotIn(icgraph.SOURCE, graph.views)
+        nodes = len(graph.nodes)
+        # the corners are kept for the next starting point
+        self.search(x + 7.0, y)
+        self.assertNotIn(icgraph.SOURCE, self.graph.views)
+        self.assertIsNone(self.graph.node_at(x + 7.0, y))
+        self.assertGreaterEqual(len(self.graph.nodes), nodes)
+
+    def test_canceled_source_forgotten(self):
+        """A canceled search forgets its starting point too."""
+        x, y = self.origin
+        calls = []
+
+        def is_canceled():
+            calls.append(None)
+            return len(calls) > 3
+
+        self.assertIsNone(self.search(x, y, is_canceled))
+        self.assertNotIn(icgraph.SOURCE, self.graph.views)
+        self.assertIsNone(self.graph.node_at(x, y))
+
+    def test_same_ic_after_other_searches(self):
+        """A graph searched before gives the IC of a new graph."""
+        x, y = self.origin
+        first = icintervals.ReachableIntervals()
+        icengine.expand_visibility_graph(self.graph.edge_index, x, y, 200.0,
+                                         first)
+        self.search(x + 30.0, y + 3.0)
+        self.search(x, y, lambda: True)
+        again = icintervals.ReachableIntervals()
+        icengine.expand_visibility_graph(self.graph.edge_index, x, y, 200.0,
+                                         again, graph=self.graph)
+        # the views cut down from longer looks end within rounding
+        self.assertEqual(set(again.keys()), set(first.keys()))
+        for key in first.keys():
+            self.assertAlmostEqual(again.length(key), first.length(key))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(VisibilityGraphTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,121 @@
+# coding=utf-8
+"""Graph store test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from utilities import city_lines, plugin_module
+
+icengine = plugin_module('icengine')
+icgraphstore = plugin_module('icgraphstore')
+icindex = plugin_module('icindex')
+icintervals = plugin_module('icintervals')
+
+RADIUS = 250.0
+
+
+class GraphStoreTest(unittest.TestCase):
+    """Test that a graph store read back from its file gives the IC of the
+    visibility graph it was written from."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.lines, self.origin = city_lines(5, 5, 60.0, seed=4,
+                                             irregularity=0.5, curved=0.3,
+                                             dead_ends=0.3)
+        self.edge_index = icindex.EdgeIndex(self.lines)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'graph.icvg')
+        self.assertTrue(icgraphstore.build_graph_store(
+            self.edge_index, RADIUS, self.path))
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open(self):
+        store = icgraphstore.GraphStore(self.path, self.lines,
+                                        self.edge_index.grid)
+        self.addCleanup(store.close)
+        return store
+
+    def assertSameIntervals(self, stored, searched):
+        # the views cut down from the stored radius end within rounding
+        self.assertEqual(set(stored.keys()), set(searched.keys()))
+        for key in searched.keys():
+            self.assertAlmostEqual(stored.length(key), searched.length(key))
+
+    def test_round_trip(self):
+        """The memory-mapped store gives the IC of a visibility graph
+        search, as far as its radius and within it."""
+        store = self.open()
+        self.assertEqual(store.radius, RADIUS)
+        self.assertGreater(store.node_count, 0)
+        x, y = self.origin
+        for dx, dy in ((0.0, 0.0), (23.0, -11.0)):
+            for distance in (RADIUS / 2, RADIUS):
+                stored = icintervals.ReachableIntervals()
+                self.assertIsNotNone(icengine.expand_graph_store(
+                    store, self.edge_index, x + dx, y + dy, distance,
+                    stored))
+                searched = icintervals.ReachableIntervals()
+                icengine.expand_visibility_graph(
+                    self.edge_index, x + dx, y + dy, distance, searched)
+                self.assertSameIntervals(stored, searched)
+
+    def test_nodes(self):
+        """Every corner is a node at its place, with its neighbours sorted
+        by distance."""
+        store = self.open()
+        for node in range(store.node_count):
+            self.assertEqual(store.node_at(*store.point(node)), node)
+            lengths = [length for _, length in
+                       store.neighbours(node, RADIUS)]
+            self.assertEqual(lengths, sorted(lengths))
+            self.assertTrue(all(length <= RADIUS for length in lengths))
+
+    def test_other_version_rejected(self):
+        """A store of another version, of other lines or of another grid is
+        not read."""
+        with open(self.path, 'r+b') as f:
+            f.seek(struct.calcsize('<4s'))
+            f.write(struct.pack('<I', icgraphstore.VERSION + 1))
+        with self.assertRaises(ValueError):
+            self.open()
+        with open(self.path, 'r+b') as f:
+            f.seek(struct.calcsize('<4s'))
+            f.write(struct.pack('<I', icgraphstore.VERSION))
+        self.open()
+        with self.assertRaises(ValueError):
+            icgraphstore.GraphStore(self.path, self.lines[1:],
+                                    self.edge_index.grid)
+        with self.assertRaises(ValueError):
+            icgraphstore.GraphStore(self.path, self.lines,
+                                    self.edge_index.grid * 2)
+
+    def test_canceled(self):
+        """A canceled build leaves no file behind."""
+        path = os.path.join(self.directory, 'canceled.icvg')
+        self.assertFalse(icgraphstore.build_graph_store(
+            self.edge_index, RADIUS, path, lambda: True))
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(GraphStoreTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
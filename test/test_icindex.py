@@ -0,0 +1,59 @@
+# coding=utf-8
+"""Edge index test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import unittest
+
+from utilities import plugin_module
+
+EdgeIndex = plugin_module('icindex').EdgeIndex
+block_lines = plugin_module('icintervals').block_lines
+
+
+class EdgeIndexTest(unittest.TestCase):
+    """Test the edge index finds the edges and the inside of the blocks."""
+
+    def setUp(self):
+        """Runs before each test."""
+        square = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]
+        hole = [(2, 2), (2, 4), (4, 4), (4, 2), (2, 2)]
+        other = [(20, 0), (30, 0), (30, 10), (20, 10), (20, 0)]
+        self.index = EdgeIndex(block_lines(1, [square, hole])
+                               + block_lines(2, [other]), cell_size=3)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.index = None
+
+    def test_edges_near(self):
+        """Only the edges around the point are handed out."""
+        lines = self.index.lines
+        near = {lines[line_no].boundary_id
+                for line_no, i in self.index.edges_near(25, 5, 6)}
+        self.assertEqual(near, {2})
+
+    def test_inside(self):
+        """Points in a block are inside, points in its hole or in the street
+        are not."""
+        self.assertTrue(self.index.inside(5, 5))
+        self.assertTrue(self.index.inside(25, 9))
+        self.assertFalse(self.index.inside(3, 3))
+        self.assertFalse(self.index.inside(15, 5))
+        self.assertFalse(self.index.inside(5, 12))
+        self.assertFalse(self.index.inside(-1, 5))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(EdgeIndexTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
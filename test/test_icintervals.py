@@ -0,0 +1,115 @@
+# coding=utf-8
+"""Reachable intervals test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import unittest
+
+from icintervals import (BoundaryLine, DistanceSweep, ReachableIntervals,
+                         block_lines, merge_intervals, snap_key,
+                         subtract_intervals)
+from icvisibility import View
+
+
+class ReachableIntervalsTest(unittest.TestCase):
+    """Test the linear referencing of the reachable boundary portions."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.line = BoundaryLine((1, 0), 1, [(0, 0), (10, 0), (10, 10)])
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.line = None
+
+    def test_merge_intervals(self):
+        """Overlapping and touching intervals are merged."""
+        self.assertEqual(
+            merge_intervals([(5, 7), (0, 2), (1, 3), (3, 4)]),
+            [(0, 4), (5, 7)])
+
+    def test_substring(self):
+        """A portion of the line keeps the vertices it passes."""
+        self.assertEqual(self.line.length, 20)
+        self.assertEqual(self.line.substring(5, 15),
+                         [(5, 0), (10, 0), (10, 5)])
+
+    def test_block_lines(self):
+        """Rings are turned so that the block lies on their left."""
+        square = [(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]
+        hole = [(2, 2), (4, 2), (4, 4), (2, 4), (2, 2)]
+        exterior, interior = block_lines(7, [square, hole])
+        self.assertEqual(exterior.points, square[::-1])
+        self.assertEqual(interior.points, hole[::-1])
+        self.assertEqual((exterior.key, interior.key), ((7, 0), (7, 1)))
+        self.assertEqual(exterior.vertex_number(4), 0)
+
+    def test_block_lines_are_snapped(self):
+        """Rings are snapped to the grid, and the ones which collapse on it
+        are left out."""
+        ring = [(0, 0), (0.0001, 0.0002), (10.0004, 0), (10, 10.0021),
+                (0, 0)]
+        sliver = [(0, 0), (0.001, 0), (0.001, 0.001), (0, 0)]
+        lines = block_lines(3, [ring, sliver], grid=0.005)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0].points, [(0, 0), (10, 0), (10, 10),
+                                           (0, 0)])
+        self.assertEqual(snap_key(10.0021, -0.0026), (2000, -1))
+
+    def test_corners(self):
+        """Only the convex corners of a block are corners, not the concave
+        ones, the vertices along a side or the corners of its holes."""
+        block = [(0, 0), (10, 0), (20, 0), (20, 20), (10, 10), (0, 20),
+                 (0, 0)]
+        hole = [(2, 2), (2, 4), (4, 4), (4, 2), (2, 2)]
+        exterior, interior = block_lines(5, [block, hole])
+        self.assertEqual(exterior.corners,
+                         [True, False, True, True, False, True, True])
+        self.assertEqual(interior.corners, [False] * 5)
+        self.assertEqual(self.line.corners, [True, True, True])
+
+    def test_reachable_intervals(self):
+        """Intervals of a line are merged when read."""
+        intervals = ReachableIntervals()
+        intervals.add(self.line.key, [(0, 4), (2, 6)])
+        intervals.add(self.line.key, [(8, 9)])
+        self.assertEqual(intervals.merged(self.line.key), [(0, 6), (8, 9)])
+        self.assertEqual(intervals.length(self.line.key), 7)
+        self.assertEqual(intervals.merged((2, 0)), [])
+
+    def test_subtract_intervals(self):
+        """Only the parts outside the removed intervals are kept."""
+        self.assertEqual(
+            subtract_intervals([(0, 10), (12, 14)], [(2, 3), (9, 13)]),
+            [(0, 2), (3, 9), (13, 14)])
+
+    def test_distance_sweep(self):
+        """Views are cut down to every walking distance."""
+        sweep = DistanceSweep([20, 5])
+        near = View(0, 0, 20)
+        near.portions.append((self.line, 0, 10))
+        sweep.add_view(near, 0)
+        far = View(10, 0, 10)
+        far.portions.append((self.line, 10, 20))
+        sweep.add_view(far, 10)
+        short, long = sweep.intervals
+        self.assertEqual(sweep.walking_distances, [5, 20])
+        self.assertEqual(short.merged(self.line.key), [(0, 5)])
+        self.assertEqual(long.merged(self.line.key), [(0, 20)])
+        self.assertEqual(sweep.bands(self.line.key),
+                         [(0, 5, 5), (5, 20, 20)])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ReachableIntervalsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,64 @@
+# coding=utf-8
+"""Run stats test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import json
+import os
+import tempfile
+import unittest
+
+from icstats import RunStats
+
+
+class RunStatsTest(unittest.TestCase):
+    """Test the run stats add up stages and counters."""
+
+    def test_stage_adds_up(self):
+        """A stage run twice keeps the sum of its times."""
+        stats = RunStats()
+        with stats.stage('look'):
+            pass
+        first = stats.stages['look']
+        with stats.stage('look'):
+            pass
+        self.assertGreaterEqual(stats.stages['look'], first)
+        self.assertEqual(list(stats.stages), ['look'])
+
+    def test_counters_and_series(self):
+        """Counters add up and series keep every value in order."""
+        stats = RunStats()
+        stats.count('vertices tested', 3)
+        stats.count('vertices tested', 2)
+        stats.record('frontier size', 1)
+        stats.record('frontier size', 7)
+        self.assertEqual(stats.counters['vertices tested'], 5)
+        self.assertEqual(stats.series['frontier size'], [1, 7])
+        self.assertIn('vertices tested: 5', stats.lines())
+        self.assertIn('frontier size: 1, 7', stats.lines())
+
+    def test_write_json(self):
+        """The JSON file holds the stats and the extra items."""
+        stats = RunStats()
+        stats.count('looks')
+        path = os.path.join(tempfile.mkdtemp(), 'run.json')
+        stats.write_json(path, ic=120)
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data['ic'], 120)
+        self.assertEqual(data['counters'], {'looks': 1})
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RunStatsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
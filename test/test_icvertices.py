@@ -0,0 +1,65 @@
+# coding=utf-8
+"""Vertex store test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import unittest
+
+from utilities import plugin_module
+
+VertexStore = plugin_module('icvertices').VertexStore
+
+
+class VertexStoreTest(unittest.TestCase):
+    """Test the vertex store keeps the best duplicate."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.store = VertexStore()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.store = None
+
+    def test_duplicate_with_less_distance_is_rejected(self):
+        """A vertex on the grid point of a better one is not added."""
+        self.assertIsNotNone(self.store.offer(10.0, 10.0, 300.0, 1))
+        self.assertIsNone(self.store.offer(10.002, 9.998, 250.0, 1))
+        self.assertEqual(len(self.store), 1)
+
+    def test_duplicate_with_more_distance_replaces(self):
+        """A vertex on the grid point of a worse one replaces it."""
+        first = self.store.offer(10.0, 10.0, 250.0, 1)
+        second = self.store.offer(10.001, 10.0, 300.0, 2, prev_id=first.fid)
+        self.assertEqual(list(self.store.vertices), [second.fid])
+        self.assertEqual(self.store.replaced, 1)
+        self.assertIs(self.store.at(10.0, 10.0), second)
+
+    def test_distinct_vertices_are_kept(self):
+        """Vertices on neighbouring grid points are both kept."""
+        self.store.offer(10.0, 10.0, 250.0, 1)
+        self.store.offer(10.005, 10.0, 250.0, 1)
+        self.assertEqual(len(self.store), 2)
+
+    def test_iterations(self):
+        """The iterations are the most sight lines to an added vertex."""
+        self.assertEqual(self.store.iterations, 0)
+        self.store.offer(0.0, 0.0, 100.0, 1)
+        self.store.offer(5.0, 0.0, 20.0, 3)
+        self.store.offer(9.0, 0.0, 50.0, 2)
+        self.assertEqual(self.store.iterations, 3)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(VertexStoreTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,124 @@
+# coding=utf-8
+"""Visibility sweep test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'imajicos@gmail.com'
+__date__ = '2026-10-18'
+__copyright__ = 'Copyright 2018, Ivan Majic'
+
+import unittest
+
+from utilities import plugin_module
+
+icintervals = plugin_module('icintervals')
+icvisibility = plugin_module('icvisibility')
+
+EdgeIndex = plugin_module('icindex').EdgeIndex
+block_lines = icintervals.block_lines
+merge_intervals = icintervals.merge_intervals
+circle_chord = icvisibility.circle_chord
+look = icvisibility.look
+
+
+class VisibilityTest(unittest.TestCase):
+    """Test what the angular sweep sees around two blocks."""
+
+    def setUp(self):
+        """Runs before each test."""
+        near = [(10, -5), (20, -5), (20, 5), (10, 5), (10, -5)]
+        far = [(30, -20), (40, -20), (40, 20), (30, 20), (30, -20)]
+        self.index = EdgeIndex(block_lines(1, [near]) + block_lines(2, [far]))
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.index = None
+
+    def portions(self, view, block_id):
+        return merge_intervals(
+            (start, end) for line, start, end in view.portions
+            if line.boundary_id == block_id)
+
+    def test_circle_chord(self):
+        """A segment is cut to the circle."""
+        self.assertEqual(circle_chord(0, 0, 5, -10, 0, 10, 0), (0.25, 0.75))
+        self.assertEqual(circle_chord(0, 0, 50, -10, 0, 10, 0), (0.0, 1.0))
+        self.assertIsNone(circle_chord(0, 0, 5, -10, 6, 10, 6))
+        self.assertIsNone(circle_chord(0, 0, 5, 6, 0, 10, 0))
+
+    def test_near_block_hides_far_block(self):
+        """Only the face of the near block and the parts of the far block
+        around its shadow are seen."""
+        view = look(self.index, 0, 0, 100)
+        self.assertEqual(self.portions(view, 1), [(30.0, 40.0)])
+        far = self.portions(view, 2)
+        self.assertEqual(len(far), 2)
+        # the shadow of the near block covers y from -15 to 15 on the face
+        # of the far block at x = 30
+        self.assertAlmostEqual(sum(end - start for start, end in far), 10.0)
+        self.assertEqual(sorted(view.vertices),
+                         [(10, -5), (10, 5), (30, -20), (30, 20)])
+
+    def test_radius_cuts_the_view(self):
+        """Nothing beyond the radius is seen."""
+        view = look(self.index, 0, 0, 10.5)
+        portions = self.portions(view, 1)
+        self.assertEqual(len(portions), 1)
+        self.assertAlmostEqual(portions[0][1] - portions[0][0],
+                               2 * 10.25 ** 0.5)
+        self.assertEqual(self.portions(view, 2), [])
+        self.assertEqual(view.vertices, {})
+
+    def test_view_within_a_smaller_radius(self):
+        """The portions seen are cut down to a smaller radius."""
+        view = look(self.index, 0, 0, 30)
+        self.assertIs(view.within(30), view.portions)
+        portions = merge_intervals(
+            (start, end) for line, start, end in view.within(10.5)
+            if line.boundary_id == 1)
+        self.assertEqual(len(portions), 1)
+        self.assertAlmostEqual(portions[0][1] - portions[0][0],
+                               2 * 10.25 ** 0.5)
+
+    def test_look_from_a_vertex(self):
+        """From a block corner the block itself hides what lies behind it,
+        and both edges at the corner can be walked along."""
+        view = look(self.index, 20, 5, 100)
+        self.assertIn((20, -5), view.vertices)
+        self.assertIn((10, 5), view.vertices)
+        self.assertNotIn((10, -5), view.vertices)
+        self.assertIn((30, 20), view.vertices)
+        self.assertAlmostEqual(
+            sum(end - start for start, end in self.portions(view, 1)), 20.0)
+
+    def test_only_corners_are_corners_of_the_view(self):
+        """A vertex along a side is seen, but it is not a corner."""
+        block = [(10, -5), (20, -5), (20, 5), (10, 5), (10, 0), (10, -5)]
+        view = look(EdgeIndex(block_lines(1, [block])), 0, 0, 100)
+        self.assertEqual(sorted(view.vertices),
+                         [(10, -5), (10, 0), (10, 5)])
+        self.assertEqual(sorted(view.corners), [(10, -5), (10, 5)])
+        near = view.cut(10.5)
+        self.assertEqual(list(near.vertices), [(10, 0)])
+        self.assertEqual(near.corners, set())
+
+    def test_look_from_near_a_vertex(self):
+        """A point a fraction of the snapping grid away from a block corner
+        is looked from the corner itself."""
+        view = look(self.index, 20.001, 4.999, 100)
+        self.assertEqual((view.x, view.y), (20, 5))
+        self.assertNotIn((20, 5), view.vertices)
+        self.assertNotIn((10, -5), view.vertices)
+        self.assertAlmostEqual(
+            sum(end - start for start, end in self.portions(view, 1)), 20.0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(VisibilityTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
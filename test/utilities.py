@@ -1,6 +1,8 @@
 # coding=utf-8
 """Common functionality used by regression tests."""
 
+import importlib
+import os
 import sys
 import logging
 
@@ -12,6 +14,58 @@ PARENT = None
 IFACE = None
 
 
+def plugin_module(name):
+    """Import a module of the plugin as a part of the plugin package, for
+    the modules which import the others relatively.
+
+    :param name: The name of the module, e.g. icengine.
+    :type name: str
+
+    :returns: The module.
+    """
+    plugin_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parent = os.path.dirname(plugin_dir)
+    if parent not in sys.path:
+        sys.path.append(parent)
+    return importlib.import_module(
+        '%s.%s' % (os.path.basename(plugin_dir), name))
+
+
+def city_lines(columns, rows, block_size, seed=0, **options):
+    """Returns the boundary lines of the blocks of a synthetic city, as
+    made by icbench.city.synthetic_city with the same arguments, and its
+    starting point.
+
+    :returns: The BoundaryLines of every block and the (x, y) starting
+        point.
+    :rtype: (list, tuple)
+    """
+    from icbench.city import synthetic_city
+    icintervals = plugin_module('icintervals')
+    blocks, origin = synthetic_city(columns, rows, block_size, seed=seed,
+                                    **options)
+    lines = []
+    for block_id, rings in enumerate(blocks):
+        lines.extend(icintervals.block_lines(block_id, rings))
+    return lines, origin
+
+
+def expand_rounds(edge_index, x, y, walking_distance, intervals, **options):
+    """icengine.expand_rounds, looking from the points of every round in
+    this process.
+
+    :returns: The VertexStore of the reached vertices, as expand_rounds.
+    """
+    icengine = plugin_module('icengine')
+
+    def look_all(points):
+        return [icengine.look(edge_index, px, py, radius)
+                for px, py, radius in points]
+
+    return icengine.expand_rounds(edge_index, x, y, walking_distance,
+                                  intervals, look_all, **options)
+
+
 def get_qgis_app():
     """ Start one QGIS application to test against.
 